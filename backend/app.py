@@ -1,18 +1,40 @@
-from flask import Flask, request, jsonify, make_response
+from flask import Flask, request, jsonify, make_response, g, Response, stream_with_context
 from flask_cors import CORS
 from datetime import datetime, timezone
-from models import db, Video, VideoMetric, Comment
-from youtube_service import YouTubeService
-from sentiment_service import get_analyzer
+from models import (db, Video, VideoMetric, Comment, CommentHistory, VideoSyncEpoch, CommentThreadDigest,
+                    ArchiveSweep, ArchiveSweepSeen, ImportJob, SentimentBackfillJob, SyncRun, SyncNode,
+                    SyncWorkItem)
+from youtube_service import YouTubeService, combine_digests
+from googleapiclient.errors import HttpError
+from sentiment_service import current_model_name, get_analyzer, get_batcher, apply_result as apply_sentiment_result
 from config import Config
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
+from coordination import SyncCoordinator, default_node_id, scheduled_fire_time
+import migrations
+import db_routing
+import partitioning
+import metric_history
+import sentiment_trends
+import sentiment_backfill
+import author_stats
+import near_duplicates
+import export
+import projection
+import comment_revisions
+import keywords
+import term_stats
+import keyword_trends
+import bulk_import
+from instrumentation import CONTENT_TYPE, REGISTRY, SyncTrace, install_db_hooks, observe_microbatch, observe_request
 import logging
 import os
-from sqlalchemy import text, case
-from collections import Counter
-import re
+import tempfile
+import threading
+import time
+from sqlalchemy import case, func, insert, select, update
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 import json
 
 # Configure logging
@@ -29,14 +51,42 @@ cors = CORS(
     resources={r"/api/*": {"origins": ["http://localhost:3000", "http://127.0.0.1:3000"]}},
     supports_credentials=True,
 )
+# SQLITE_PROFILE=concurrent: WAL, read pool and a single serialized writer (see db_routing.py)
+db_routing.configure(app)
 db.init_app(app)
+db_routing.install(app, db)
+# Per-video sentiment trend buckets follow every comment insert/delete/re-score at flush time
+sentiment_trends.install(db_routing.RoutingSession)
+# ... and so do the per-author aggregates (author_stats.py)
+author_stats.install(db_routing.RoutingSession)
+if app.config.get('TERM_STATS_ENABLED', True):
+    # ... and the keyword term statistics behind scoring=tfidf|pmi|hybrid (term_stats.py)
+    term_stats.install(db_routing.RoutingSession)
+if app.config.get('KEYWORD_TRENDS_ENABLED', True):
+    # ... and the per-day keyword counts behind the keyword trend snapshots (keyword_trends.py)
+    keyword_trends.install(db_routing.RoutingSession)
+if app.config.get('NEAR_DUPLICATES_ENABLED', True):
+    # MinHash signatures of new and edited comments are written at flush time (near_duplicates.py)
+    near_duplicates.install(db_routing.RoutingSession, keywords.base_tokenize)
 
 # Initialize YouTube service
-youtube_service = YouTubeService(app.config['YOUTUBE_API_KEY'])
+youtube_service = YouTubeService(app.config['YOUTUBE_API_KEY'],
+                                 api_endpoint=app.config.get('YOUTUBE_API_ENDPOINT') or None)
 
 # Scheduler for automatic syncing
 scheduler = BackgroundScheduler()
 
+# Cross-process coordination of scheduled syncs (None = every process syncs everything)
+coordinator = None
+if app.config.get('SYNC_COORDINATION') == 'lease':
+    coordinator = SyncCoordinator(
+        app,
+        node_id=app.config.get('SYNC_NODE_ID') or None,
+        lease_seconds=app.config.get('SYNC_LEASE_SECONDS', 300),
+        heartbeat_seconds=app.config.get('SYNC_HEARTBEAT_SECONDS', 30),
+        tick_wait_seconds=app.config.get('SYNC_TICK_WAIT_SECONDS', 30)
+    )
+
 
 @app.before_request
 def handle_preflight():
@@ -54,6 +104,21 @@ def handle_preflight():
         resp.status_code = 204
         return resp
 
+@app.before_request
+def start_request_timer():
+    if request.path.startswith('/api/'):
+        g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_latency(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        observe_request(request.method, route, response.status_code, time.perf_counter() - started)
+    return response
+
+
 @app.after_request
 def enforce_cors(response):
     if request.path.startswith('/api/'):
@@ -65,143 +130,572 @@ def enforce_cors(response):
     return response
 
 
+def _as_naive_utc(dt):
+    """Normalize API (aware) and DB (naive UTC) datetimes so they compare equal."""
+    if dt is not None and dt.tzinfo is not None:
+        return dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def _comments_to_dicts(comments):
+    """Serialize comments, deriving last_seen from sync epochs with two extra queries.
+
+    Active comments were confirmed in their video's current epoch, deleted ones in
+    their stored seen_epoch; rows from before epochs existed keep the legacy column.
+    """
+    times = projection.last_seen_times([(c.id, c.video_id, c.status, c.seen_epoch) for c in comments])
+    return [c.to_dict(last_seen=times.get(c.id)) for c in comments]
+
+
+def _record_sync_run(trace, video=None, error=None):
+    """Persist the summary of a finished SyncTrace as a SyncRun row (best effort)."""
+    summary = trace.summary()
+    try:
+        run = SyncRun(
+            kind=summary['kind'],
+            video_id=video.id if video is not None else None,
+            status=summary['status'],
+            error=error,
+            started_at=summary['started_at'],
+            finished_at=summary['finished_at'],
+            duration_seconds=summary['duration_seconds'],
+            api_calls=summary['api_calls'],
+            db_statements=summary['db_statements'],
+            comments_processed=summary['comments_processed'],
+            stats=json.dumps(summary['stats']),
+            phases=json.dumps(summary['phases'])
+        )
+        db.session.add(run)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"Could not record sync run: {e}")
+
+
 def sync_video(video_id):
-    """Sync a single video's data from YouTube."""
+    """Sync a single video's data from YouTube.
+
+    Returns the error of a failed sync (also recorded as an error run), or None.
+    """
     with app.app_context():
         video = Video.query.filter_by(video_id=video_id).first()
         if not video or not video.is_active:
             return
         
         logger.info(f"Syncing video: {video_id}")
-        
-        # Get current video details and metrics
+        trace = SyncTrace('video', video_id)
+        try:
+            error = _sync_video(video, trace)
+        except Exception as e:
+            db.session.rollback()
+            _record_sync_run(trace.finish('error'), video, error=str(e))
+            raise
+        if not error and app.config.get('KEYWORD_TRENDS_ENABLED', True):
+            with trace.span('keyword_snapshot'):
+                trace.stats['keyword_days'] += _snapshot_keyword_trends(video)
+        _record_sync_run(trace.finish('error' if error else 'ok'), video, error=error)
+        return error
+
+
+def _snapshot_keyword_trends(video):
+    """Re-rank the keyword trend days changed since the last snapshot; a failure only delays it.
+
+    Returns the number of days ranked.
+    """
+    try:
+        days = keyword_trends.snapshot(db.session.connection(), video.id, app.config.get('KEYWORD_TREND_TOP_K', 20))
+        db.session.commit()
+        return days
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"Keyword trend snapshot of {video.video_id} failed: {e}")
+        return 0
+
+
+def _sync_video(video, trace):
+    """Body of sync_video; every phase runs inside a timed span of ``trace``.
+
+    Returns an error message when the sync could not run, otherwise None.
+    """
+    video_id = video.video_id
+
+    # Get current video details and metrics
+    with trace.span('youtube_video_details'):
         video_data = youtube_service.get_video_details(video_id)
-        if not video_data:
-            logger.error(f"Could not fetch video details for {video_id}")
-            return
-        
-        # Update video info
-        video.title = video_data['title']
-        video.channel_title = video_data['channel_title']
-        video.description = video_data['description']
-        video.last_synced = datetime.now(timezone.utc)
-        
-        # Save metrics
-        metric = VideoMetric(
-            video_id=video.id,
-            view_count=video_data['view_count'],
-            like_count=video_data['like_count'],
-            comment_count=video_data['comment_count']
-        )
-        db.session.add(metric)
-        
-        # Get current comments
-        current_comments = youtube_service.get_video_comments(video_id, max_results=1000)
-        current_comment_ids = {c['comment_id'] for c in current_comments}
-        
-        # Check for deleted comments
-        stored_comments = Comment.query.filter_by(video_id=video.id, status='active').all()
-        for stored_comment in stored_comments:
-            if stored_comment.comment_id not in current_comment_ids:
-                stored_comment.status = 'deleted'
-                stored_comment.deleted_at = datetime.now(timezone.utc)
-                # record history
-                try:
-                    from models import CommentHistory
-                    hist = CommentHistory(comment_id=stored_comment.id, action='deleted', meta=None)
-                    db.session.add(hist)
-                except Exception:
-                    pass
-                logger.info(f"Marked comment as deleted: {stored_comment.comment_id}")
-        
-        # Add or update comments
-        comments_to_analyze = []
-        for comment_data in current_comments:
-            existing_comment = Comment.query.filter_by(comment_id=comment_data['comment_id']).first()
-            if existing_comment:
-                # Update existing comment
-                existing_comment.text = comment_data['text']
+    if not video_data:
+        logger.error(f"Could not fetch video details for {video_id}")
+        return 'Could not fetch video details'
+
+    # Update video info
+    video.title = video_data['title']
+    video.channel_title = video_data['channel_title']
+    video.description = video_data['description']
+    video.last_synced = datetime.now(timezone.utc)
+
+    # Save metrics (extends the latest run instead when nothing changed; see metric_history.py)
+    metric_history.record_snapshot(video.id, video_data, _as_naive_utc(video.last_synced),
+                                   app.config.get('METRIC_STORAGE', 'runs'))
+    # No write transaction (under SQLITE_PROFILE=concurrent: the single writer) stays open
+    # while the comments are fetched
+    with trace.span('commit'):
+        db.session.commit()
+
+    # Small videos are fetched in one window; large ones are swept page by page
+    threshold = app.config.get('FULL_ARCHIVE_THRESHOLD', 1000)
+    if video_data['comment_count'] > threshold:
+        _sync_full_archive(video, trace)
+    else:
+        _sync_comment_window(video, trace, max_results=max(threshold, 1000))
+    logger.info(f"Successfully synced video: {video_id}")
+    return None
+
+
+def _mark_deleted(comments, previous_epoch, now, trace):
+    """Mark active comments that are no longer returned by the API as deleted.
+
+    An active comment was confirmed in the previous epoch, which becomes its final
+    seen_epoch; this write happens together with the status change anyway.
+    """
+    for stored_comment in comments:
+        stored_comment.status = 'deleted'
+        stored_comment.deleted_at = now
+        stored_comment.seen_epoch = previous_epoch or stored_comment.seen_epoch
+        # record history
+        try:
+            hist = CommentHistory(comment_id=stored_comment.id, action='deleted', meta=None)
+            db.session.add(hist)
+        except Exception:
+            pass
+        trace.count('deleted')
+        logger.info(f"Marked comment as deleted: {stored_comment.comment_id}")
+
+
+def _reconcile_comments(video, comments_data, stored, epoch, now, trace):
+    """Insert new comments and update changed or reinstated ones; unchanged rows are not written.
+
+    ``stored`` maps comment_id -> Comment for (at least) the fetched ids.
+    Returns the comments that need sentiment inference.
+    """
+    comments_to_analyze = []
+    edits = []
+    for comment_data in comments_data:
+        existing_comment = stored.get(comment_data['comment_id'])
+        if existing_comment:
+            # Whitespace-only differences keep the stored text, which is always the latest revision
+            text_changed = (existing_comment.text != comment_data['text']
+                            and comment_revisions.text_hash(existing_comment.text)
+                            != comment_revisions.text_hash(comment_data['text']))
+            changed = (
+                text_changed
+                or existing_comment.like_count != comment_data['like_count']
+                or _as_naive_utc(existing_comment.updated_at) != _as_naive_utc(comment_data['updated_at'])
+            )
+            if changed:
+                if text_changed:
+                    edits.append((existing_comment, existing_comment.text, existing_comment.updated_at))
+                    existing_comment.text = comment_data['text']
                 existing_comment.like_count = comment_data['like_count']
                 existing_comment.updated_at = comment_data['updated_at']
-                # update last seen/timestamps
-                existing_comment.last_seen = datetime.now(timezone.utc)
-                if existing_comment.status == 'deleted':
-                    existing_comment.status = 'active'
-                    existing_comment.deleted_at = None
-                    existing_comment.reinstated_at = datetime.now(timezone.utc)
-                    # add history entry
-                    try:
-                        from models import CommentHistory
-                        hist = CommentHistory(comment_id=existing_comment.id, action='reinstated', meta=None)
-                        db.session.add(hist)
-                    except Exception:
-                        pass
-                # Re-analyze sentiment if text changed and sentiment not yet set
-                if not existing_comment.sentiment:
-                    comments_to_analyze.append(existing_comment)
-            else:
-                # Add new comment
-                new_comment = Comment(
-                    video_id=video.id,
-                    comment_id=comment_data['comment_id'],
-                    parent_id=comment_data['parent_id'],
-                    author=comment_data['author'],
-                    author_channel_id=comment_data['author_channel_id'],
-                    text=comment_data['text'],
-                    like_count=comment_data['like_count'],
-                    published_at=comment_data['published_at'],
-                    updated_at=comment_data['updated_at'],
-                    last_seen=datetime.now(timezone.utc)
-                )
-                db.session.add(new_comment)
-                db.session.flush()  # Ensure ID is available
-                comments_to_analyze.append(new_comment)
-        
-        # Batch sentiment analysis for new/updated comments (guarded by config)
-        if comments_to_analyze:
-            if not app.config.get('SENTIMENT_ENABLED', True):
-                logger.info("Sentiment analysis is disabled via config; skipping analysis for comments")
+                existing_comment.seen_epoch = epoch
+                trace.count('updated')
             else:
+                trace.count('unchanged')
+            if existing_comment.status == 'deleted':
+                existing_comment.status = 'active'
+                existing_comment.deleted_at = None
+                existing_comment.reinstated_at = now
+                existing_comment.seen_epoch = epoch
+                # add history entry
                 try:
-                    analyzer = get_analyzer()
-                    texts = [c.text for c in comments_to_analyze]
-                    sentiments = analyzer.analyze_batch(texts)
-                    min_conf = app.config.get('SENTIMENT_MIN_CONFIDENCE', 0.6)
-                    for comment, sentiment_result in zip(comments_to_analyze, sentiments):
-                        # sentiment_result may be None or dict {'sentiment','score','label'} depending on analyzer
-                        if not sentiment_result:
-                            comment.sentiment = None
-                            comment.sentiment_score = None
-                            comment.sentiment_label = None
-                            continue
-                        score = sentiment_result.get('score') or sentiment_result.get('confidence') or 0.0
-                        # Accept label only if confidence above threshold
-                        if score and float(score) >= float(min_conf):
-                            comment.sentiment = sentiment_result.get('sentiment')
-                            comment.sentiment_score = float(score)
-                            comment.sentiment_label = sentiment_result.get('label')
-                        else:
-                            # store score but do not commit a label
-                            comment.sentiment = None
-                            comment.sentiment_score = float(score) if score is not None else None
-                            comment.sentiment_label = sentiment_result.get('label') if 'label' in sentiment_result else None
-                    logger.info(f"Analyzed sentiment for {len(comments_to_analyze)} comments")
-                except Exception as e:
-                    logger.warning(f"Sentiment analysis failed: {e}")
-        
+                    hist = CommentHistory(comment_id=existing_comment.id, action='reinstated', meta=None)
+                    db.session.add(hist)
+                except Exception:
+                    pass
+                trace.count('reinstated')
+            # Re-analyze sentiment if the text changed or inference never produced a result;
+            # comments scored below the confidence threshold keep their stored score.
+            if text_changed or (not existing_comment.sentiment and existing_comment.sentiment_score is None):
+                comments_to_analyze.append(existing_comment)
+        else:
+            # Add new comment (inserted in one batch at flush time)
+            new_comment = Comment(
+                video_id=video.id,
+                comment_id=comment_data['comment_id'],
+                parent_id=comment_data['parent_id'],
+                author=comment_data['author'],
+                author_channel_id=comment_data['author_channel_id'],
+                text=comment_data['text'],
+                like_count=comment_data['like_count'],
+                published_at=comment_data['published_at'],
+                updated_at=comment_data['updated_at'],
+                seen_epoch=epoch
+            )
+            db.session.add(new_comment)
+            stored[new_comment.comment_id] = new_comment
+            comments_to_analyze.append(new_comment)
+            trace.count('created')
+    # Keep the previous text as a compact revision before it is lost (see comment_revisions.py)
+    trace.count('edited', comment_revisions.record_edits(edits, _as_naive_utc(now)))
+    return comments_to_analyze
+
+
+def _close_epoch(video, epoch, now):
+    """Every comment still active is confirmed as of ``now``."""
+    video.sync_epoch = epoch
+    db.session.add(VideoSyncEpoch(video_id=video.id, epoch=epoch, synced_at=now))
+
+
+def _run_sentiment(comments_to_analyze, trace):
+    # Batch sentiment analysis for new/updated comments (guarded by config)
+    if comments_to_analyze:
+        if not app.config.get('SENTIMENT_ENABLED', True):
+            logger.info("Sentiment analysis is disabled via config; skipping analysis for comments")
+        else:
+            with trace.span('sentiment'):
+                _analyze_comments(comments_to_analyze, trace)
+
+
+def _stored_comments(video, comment_ids):
+    """Load stored comments by YouTube id, keyed by comment_id.
+
+    The video_id filter is redundant for correctness but lets Postgres prune a
+    hash-partitioned comments table to a single partition (see partitioning.py).
+    """
+    if not comment_ids:
+        return {}
+    rows = Comment.query.filter(Comment.video_id == video.id, Comment.comment_id.in_(comment_ids)).all()
+    return {c.comment_id: c for c in rows}
+
+
+def _load_thread_digests(video, thread_ids=None):
+    """Stored thread digests of a video keyed by thread_id, optionally only for ``thread_ids``."""
+    query = db.session.query(CommentThreadDigest.thread_id, CommentThreadDigest.digest).filter(
+        CommentThreadDigest.video_id == video.id)
+    if thread_ids is not None:
+        if not thread_ids:
+            return {}
+        query = query.filter(CommentThreadDigest.thread_id.in_(thread_ids))
+    return dict(query.all())
+
+
+def _changed_threads(comments, digests, stored_digests, trace):
+    """Split a fetched page into the threads whose digest differs from the stored one.
+
+    Returns ``(comments, digests)`` of the changed threads only; new threads have no
+    stored digest and always count as changed.
+    """
+    changed = {t: d for t, d in digests.items() if stored_digests.get(t) != d}
+    changed_comments = [c for c in comments if (c['parent_id'] or c['comment_id']) in changed]
+    trace.count('unchanged', len(comments) - len(changed_comments))
+    trace.stats['threads_unchanged'] += len(digests) - len(changed)
+    trace.stats['threads_changed'] += len(changed)
+    return changed_comments, changed
+
+
+def _store_thread_digests(video, digests, stored_digests):
+    """Upsert thread digests in thread_id order; unchanged threads are not written."""
+    new, changed = [], []
+    for thread_id, digest in sorted(digests.items()):
+        if thread_id not in stored_digests:
+            new.append({'video_id': video.id, 'thread_id': thread_id, 'digest': digest})
+        elif stored_digests[thread_id] != digest:
+            changed.append({'video_id': video.id, 'thread_id': thread_id, 'digest': digest})
+    if new:
+        db.session.execute(insert(CommentThreadDigest), new)
+    if changed:
+        db.session.execute(update(CommentThreadDigest), changed)
+    stored_digests.update(digests)
+
+
+def _trim_thread_digests(video, thread_ids, stored_digests):
+    """Drop digests of threads no longer in the archive and store the rolling digest."""
+    gone = [t for t in stored_digests if t not in thread_ids]
+    if gone:
+        CommentThreadDigest.query.filter(CommentThreadDigest.video_id == video.id,
+                                         CommentThreadDigest.thread_id.in_(gone)).delete(synchronize_session=False)
+        for thread_id in gone:
+            del stored_digests[thread_id]
+    video.comment_digest = combine_digests(stored_digests.items())
+
+
+def _sync_comment_window(video, trace, max_results):
+    """Fetch up to ``max_results`` comments at once and reconcile them.
+
+    Deletions are only derived when the fetch covered every thread of the video;
+    a truncated or failed fetch says nothing about the comments it did not return.
+    For complete fetches, per-thread digests over (comment_id, updated_at, like_count)
+    are compared with the previous run: an identical rolling digest skips
+    reconciliation and sentiment entirely, otherwise only changed threads are diffed.
+    Digests are keyed by thread rather than page position, so a new thread at the
+    top of the newest-first listing does not dirty every page below it.
+    """
+    with trace.span('youtube_comments'):
+        pages, complete = youtube_service.get_video_comment_pages(video.video_id, max_results)
+    current_comments = [c for comments, _ in pages for c in comments]
+    current_digests = {t: d for _, digests in pages for t, d in digests.items()}
+    trace.count('fetched', len(current_comments))
+
+    now = datetime.now(timezone.utc)
+    previous_epoch = video.sync_epoch or 0
+    epoch = previous_epoch + 1
+
+    if complete and video.comment_digest == combine_digests(current_digests.items()):
+        # Nothing changed since the last sync: every active comment is confirmed as is
+        trace.count('unchanged', len(current_comments))
+        trace.stats['threads_unchanged'] += len(current_digests)
+        _close_epoch(video, epoch, now)
+        with trace.span('commit'):
+            db.session.commit()
+        return
+
+    chunk_size = app.config.get('SYNC_COMMIT_CHUNK', 0)
+    with trace.span('reconcile'):
+        if complete:
+            stored_digests = _load_thread_digests(video)
+            changed_pages = []
+            for comments, digests in pages:
+                changed_comments, changed_digests = _changed_threads(comments, digests, stored_digests, trace)
+                if changed_digests:
+                    changed_pages.append((changed_comments, changed_digests))
+
+            # Deletions need only the ids of active comments, not whole rows
+            current_comment_ids = {c['comment_id'] for c in current_comments}
+            missing_ids = [pk for pk, cid in db.session.query(Comment.id, Comment.comment_id)
+                           .filter_by(video_id=video.id, status='active') if cid not in current_comment_ids]
+            if missing_ids:
+                _mark_deleted(Comment.query.filter(Comment.video_id == video.id, Comment.id.in_(missing_ids)).all(),
+                              previous_epoch, now, trace)
+        else:
+            logger.warning(f"Comment fetch for {video.video_id} was incomplete; skipping deletion detection")
+            changed_pages = [(current_comments, None)]
+
+    # Thread digests are committed together with their comments, so an interrupted chunked
+    # sync resumes with the threads it did not get to
+    comments_to_analyze = []
+    for chunk in _page_chunks(changed_pages, chunk_size):
+        with trace.span('reconcile'):
+            to_diff = [c for comments, _ in chunk for c in comments]
+            stored = _stored_comments(video, [c['comment_id'] for c in to_diff])
+            for _, digests in chunk:
+                if digests is not None:
+                    _store_thread_digests(video, digests, stored_digests)
+            chunk_to_analyze = _reconcile_comments(video, to_diff, stored, epoch, now, trace)
+        if chunk_size:
+            # Short write transactions; inference runs while no write lock is held
+            with trace.span('commit'):
+                db.session.commit()
+            _run_sentiment(chunk_to_analyze, trace)
+            with trace.span('commit'):
+                db.session.commit()
+        else:
+            comments_to_analyze.extend(chunk_to_analyze)
+
+    if complete:
+        with trace.span('reconcile'):
+            _trim_thread_digests(video, current_digests, stored_digests)
+            _close_epoch(video, epoch, now)
+
+    _run_sentiment(comments_to_analyze, trace)
+
+    with trace.span('commit'):
         db.session.commit()
-        logger.info(f"Successfully synced video: {video_id}")
+
+
+def _page_chunks(pages, chunk_size):
+    """Group (comments, digests) pages into chunks of about ``chunk_size`` comments.
+
+    Pages are never split; ``chunk_size`` 0 yields everything as one chunk.
+    """
+    if not chunk_size:
+        if pages:
+            yield pages
+        return
+    chunk, count = [], 0
+    for page in pages:
+        chunk.append(page)
+        count += len(page[0])
+        if count >= chunk_size:
+            yield chunk
+            chunk, count = [], 0
+    if chunk:
+        yield chunk
+
+
+def _sync_full_archive(video, trace):
+    """Sweep every comment thread of a large video, one committed page at a time.
+
+    Memory is bounded by one API page. The next page token is checkpointed in
+    archive_sweeps with every page, so a sweep interrupted by an error, restart or
+    the FULL_ARCHIVE_MAX_PAGES budget resumes on the next sync. Seen comment ids
+    are staged in archive_sweep_seen; deletions are derived only after the last
+    page, when the sweep has seen the complete archive.
+    """
+    sweep = ArchiveSweep.query.filter_by(video_id=video.id, status='running').order_by(ArchiveSweep.id.desc()).first()
+    if sweep is None:
+        sweep = ArchiveSweep(video_id=video.id, epoch=(video.sync_epoch or 0) + 1, status='running',
+                             started_at=datetime.now(timezone.utc))
+        db.session.add(sweep)
+        # Committed before the first page is fetched, like every later checkpoint
+        db.session.commit()
+        logger.info(f"Starting full-archive sweep {sweep.id} for {video.video_id}")
+    else:
+        logger.info(f"Resuming full-archive sweep {sweep.id} for {video.video_id} after {sweep.pages_done} pages")
+
+    max_pages = app.config.get('FULL_ARCHIVE_MAX_PAGES', 200)
+    pages = youtube_service.iter_comment_pages(video.video_id, page_token=sweep.page_token)
+    processed = 0
+    while not max_pages or processed < max_pages:
+        try:
+            with trace.span('youtube_comments'):
+                page, next_token, digests = next(pages)
+        except HttpError as e:
+            if e.resp.status == 400 and sweep.page_token:
+                # Page tokens do not live forever; start over with a fresh sweep next time
+                logger.warning(f"Sweep {sweep.id} for {video.video_id} has a stale page token; abandoning it")
+                ArchiveSweepSeen.query.filter_by(sweep_id=sweep.id).delete(synchronize_session=False)
+                sweep.status = 'abandoned'
+            else:
+                logger.error(f"YouTube API error during sweep {sweep.id} for {video.video_id}: {e}")
+            db.session.commit()
+            return
+
+        now = datetime.now(timezone.utc)
+        trace.count('fetched', len(page))
+        with trace.span('reconcile'):
+            ids = list({c['comment_id'] for c in page})
+            # Unchanged threads only have their ids confirmed for deletion detection
+            stored_digests = _load_thread_digests(video, list(digests))
+            changed_comments, changed_digests = _changed_threads(page, digests, stored_digests, trace)
+            comments_to_analyze = []
+            if changed_digests:
+                stored = _stored_comments(video, [c['comment_id'] for c in changed_comments])
+                comments_to_analyze = _reconcile_comments(video, changed_comments, stored, sweep.epoch, now, trace)
+                _store_thread_digests(video, changed_digests, stored_digests)
+            # Comments can shift between pages while a sweep runs; stage each id once
+            already_seen = {row[0] for row in db.session.query(ArchiveSweepSeen.comment_id).filter(
+                ArchiveSweepSeen.sweep_id == sweep.id, ArchiveSweepSeen.comment_id.in_(ids))} if ids else set()
+            new_seen = [{'sweep_id': sweep.id, 'comment_id': cid} for cid in ids if cid not in already_seen]
+            if new_seen:
+                db.session.execute(insert(ArchiveSweepSeen), new_seen)
+
+        if not app.config.get('SYNC_COMMIT_CHUNK', 0):
+            _run_sentiment(comments_to_analyze, trace)
+
+        sweep.page_token = next_token
+        sweep.pages_done = (sweep.pages_done or 0) + 1
+        sweep.comments_seen = (sweep.comments_seen or 0) + len(page)
+        sweep.updated_at = now
+        if not next_token:
+            _complete_sweep(video, sweep, trace)
+        with trace.span('commit'):
+            db.session.commit()
+        if app.config.get('SYNC_COMMIT_CHUNK', 0) and comments_to_analyze:
+            # Chunked mode: the page (and its checkpoint) is already committed
+            _run_sentiment(comments_to_analyze, trace)
+            with trace.span('commit'):
+                db.session.commit()
+        processed += 1
+        if not next_token:
+            return
+    logger.info(f"Sweep {sweep.id} for {video.video_id} paused after {processed} pages; resumes next sync")
+
+
+def _complete_sweep(video, sweep, trace):
+    """Derive deletions from a finished sweep and close its epoch."""
+    now = datetime.now(timezone.utc)
+    with trace.span('reconcile'):
+        seen = db.session.query(ArchiveSweepSeen.comment_id).filter(ArchiveSweepSeen.sweep_id == sweep.id)
+        missing = Comment.query.filter(
+            Comment.video_id == video.id,
+            Comment.status == 'active',
+            ~Comment.comment_id.in_(seen)
+        ).all()
+        _mark_deleted(missing, video.sync_epoch or 0, now, trace)
+        # A thread's id is the comment_id of its top-level comment
+        CommentThreadDigest.query.filter(
+            CommentThreadDigest.video_id == video.id,
+            ~CommentThreadDigest.thread_id.in_(seen)
+        ).delete(synchronize_session=False)
+        video.comment_digest = combine_digests(_load_thread_digests(video).items())
+        ArchiveSweepSeen.query.filter_by(sweep_id=sweep.id).delete(synchronize_session=False)
+        sweep.status = 'complete'
+        sweep.page_token = None
+        sweep.completed_at = now
+        _close_epoch(video, sweep.epoch, now)
+    logger.info(f"Completed full-archive sweep {sweep.id} for {video.video_id}: "
+                f"{sweep.comments_seen} comments in {sweep.pages_done} pages, {len(missing)} deleted")
+
+
+def _analyze_comments(comments_to_analyze, trace=None):
+    """Run batch sentiment inference and store labels above SENTIMENT_MIN_CONFIDENCE."""
+    try:
+        analyzer = get_analyzer()
+        texts = [c.text for c in comments_to_analyze]
+        started = time.perf_counter()
+        sentiments = analyzer.analyze_batch(texts)
+        if trace is not None:
+            trace.record_inference(len(texts), sum(1 for r in sentiments if r), time.perf_counter() - started,
+                                   analyzer.batch_size)
+        min_conf = app.config.get('SENTIMENT_MIN_CONFIDENCE', 0.6)
+        for comment, sentiment_result in zip(comments_to_analyze, sentiments):
+            # sentiment_result may be None or dict {'sentiment','score','label'} depending on analyzer
+            apply_sentiment_result(comment, sentiment_result, min_conf, analyzer.model_name)
+        logger.info(f"Analyzed sentiment for {len(comments_to_analyze)} comments")
+    except Exception as e:
+        logger.warning(f"Sentiment analysis failed: {e}")
+
+
+def _sync_video_by_pk(pk):
+    video = db.session.get(Video, pk)
+    if video:
+        return sync_video(video.video_id)
+
+
+def _active_video_pks():
+    return [row[0] for row in db.session.query(Video.id).filter_by(is_active=True).order_by(Video.id).all()]
+
+
+def _scheduled_sync_time():
+    """Scheduled fire time of the current sync_all_videos run, shared by every node; None if unknown."""
+    job = scheduler.get_job('sync_all_videos')
+    fire = scheduled_fire_time(job.trigger, datetime.now(timezone.utc)) if job is not None else None
+    if fire is None:
+        logger.warning("Could not determine the scheduled sync time; using the current minute as tick")
+    return fire
 
 
 def sync_all_videos():
-    """Sync all active videos."""
+    """Sync all active videos.
+
+    With SYNC_COORDINATION=lease only one node plans each tick and the videos
+    are sharded across all live nodes instead of every process syncing them all.
+    """
+    if app.config.get('BACKGROUND_JOBS') != 'worker':
+        # Catch up on a recount a restart interrupted (worker.py polls for it instead)
+        _run_keyword_stats_rebuild()
     with app.app_context():
-        videos = Video.query.filter_by(is_active=True).all()
+        trace = SyncTrace('all')
+        if coordinator is not None:
+            stats = coordinator.run_tick(plan=_active_video_pks, work=_sync_video_by_pk,
+                                         tick=coordinator.tick_key(_scheduled_sync_time()))
+            trace.stats['tick_leader'] = stats['leader']
+            trace.stats['videos_synced'] = stats['synced']
+            trace.stats['videos_failed'] = stats['failed']
+            _record_sync_run(trace.finish('ok' if not stats['failed'] else 'error'))
+            return
+        with trace.span('load_videos'):
+            videos = Video.query.filter_by(is_active=True).all()
         for video in videos:
             try:
-                sync_video(video.video_id)
+                error = sync_video(video.video_id)
             except Exception as e:
-                logger.error(f"Error syncing video {video.video_id}: {e}")
+                error = str(e)
+            if error:
+                trace.stats['videos_failed'] += 1
+                logger.error(f"Error syncing video {video.video_id}: {error}")
+            else:
+                trace.stats['videos_synced'] += 1
+        _record_sync_run(trace.finish('ok' if not trace.stats['videos_failed'] else 'error'))
 
 
 @app.route('/api/videos', methods=['GET'])
@@ -250,27 +744,9 @@ def add_video():
     if not video_data:
         return jsonify({'error': 'Could not fetch video details'}), 400
     
-    # Create video record
-    video = Video(
-        video_id=video_data['video_id'],
-        title=video_data['title'],
-        channel_title=video_data['channel_title'],
-        description=video_data['description'],
-        published_at=video_data['published_at'],
-        thumbnail_url=video_data['thumbnail_url'],
-            last_synced=datetime.now(timezone.utc)
-    )
-    db.session.add(video)
-    db.session.flush()
-    
-    # Save initial metrics
-    metric = VideoMetric(
-        video_id=video.id,
-        view_count=video_data['view_count'],
-        like_count=video_data['like_count'],
-        comment_count=video_data['comment_count']
-    )
-    db.session.add(metric)
+    # Create video record with its first epoch and metric snapshot
+    video = bulk_import.create_video(video_data, datetime.now(timezone.utc),
+                                     app.config.get('METRIC_STORAGE', 'runs'))
     
     # Get and save comments
     comments_data = youtube_service.get_video_comments(video_id, max_results=1000)
@@ -285,7 +761,8 @@ def add_video():
             text=comment_data['text'],
             like_count=comment_data['like_count'],
             published_at=comment_data['published_at'],
-            updated_at=comment_data['updated_at']
+            updated_at=comment_data['updated_at'],
+            seen_epoch=1
         )
         db.session.add(comment)
         new_comments.append(comment)
@@ -293,25 +770,91 @@ def add_video():
     db.session.flush()  # Get IDs for comments
     
     # Batch sentiment analysis for initial comments
-    if new_comments:
+    if new_comments and app.config.get('SENTIMENT_ENABLED', True):
         try:
             analyzer = get_analyzer()
             texts = [c.text for c in new_comments]
             sentiments = analyzer.analyze_batch(texts)
+            min_conf = app.config.get('SENTIMENT_MIN_CONFIDENCE', 0.6)
             for comment, sentiment_result in zip(new_comments, sentiments):
-                if sentiment_result:
-                    comment.sentiment = sentiment_result['sentiment']
-                    comment.sentiment_score = sentiment_result['score']
-                    comment.sentiment_label = sentiment_result['label']
+                apply_sentiment_result(comment, sentiment_result, min_conf, analyzer.model_name)
             logger.info(f"Analyzed sentiment for {len(new_comments)} initial comments")
         except Exception as e:
             logger.warning(f"Sentiment analysis failed during video add: {e}")
     
     db.session.commit()
+    if app.config.get('KEYWORD_TRENDS_ENABLED', True):
+        _snapshot_keyword_trends(video)
     
     return jsonify({'message': 'Video added successfully', 'video': video.to_dict()}), 201
 
 
+def import_sync_workers():
+    """Parallel comment backfills for bulk imports; plain SQLite has a single writer."""
+    if db.engine.dialect.name == 'sqlite' and db_routing.READ_BIND not in db.engines:
+        return 1
+    return max(1, app.config.get('IMPORT_SYNC_WORKERS', 4))
+
+
+def _run_import(job_id, workers):
+    with app.app_context():
+        try:
+            bulk_import.run_job(job_id, youtube_service, sync_video, workers=workers,
+                                metric_storage=app.config.get('METRIC_STORAGE', 'runs'))
+        except Exception as e:
+            logger.error(f"Import job {job_id} crashed: {e}")
+        finally:
+            db.session.remove()
+
+
+@app.route('/api/videos/import', methods=['GET', 'POST'])
+def import_videos():
+    """GET lists recent import jobs. POST imports a channel, playlist or URL list in the background.
+
+    Body: exactly one of { "channel": "@handle" | "UC..." | channel URL,
+                           "playlist": "PL..." | playlist URL,
+                           "urls": ["https://youtu.be/...", ...] }
+    plus optional "max_videos" (newest first for channels; capped by IMPORT_MAX_VIDEOS).
+    Returns 202 with the job; poll GET /api/videos/import/<id> for progress. With
+    BACKGROUND_JOBS=worker the job is only queued and worker.py runs it.
+    """
+    if request.method == 'GET':
+        jobs = ImportJob.query.order_by(ImportJob.id.desc()).limit(20).all()
+        return jsonify({'jobs': [j.to_dict() for j in jobs]})
+    data = request.json or {}
+    given = [t for t in bulk_import.SOURCE_TYPES if data.get(t)]
+    if len(given) != 1:
+        return jsonify({'error': 'exactly one of channel, playlist or urls required'}), 400
+    source_type = given[0]
+    source = data[source_type]
+    if source_type == 'urls':
+        if not isinstance(source, list) or not all(isinstance(u, str) for u in source):
+            return jsonify({'error': 'urls must be a list of strings'}), 400
+    elif not isinstance(source, str):
+        return jsonify({'error': f"{source_type} must be a string"}), 400
+    try:
+        max_videos = int(data['max_videos']) if data.get('max_videos') is not None else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'max_videos must be an integer'}), 400
+    if max_videos is not None and max_videos < 1:
+        return jsonify({'error': 'max_videos must be >= 1'}), 400
+    cap = app.config.get('IMPORT_MAX_VIDEOS', 5000)
+    if cap:
+        max_videos = min(max_videos or cap, cap)
+    job = bulk_import.start_job(source_type, source, max_videos)
+    if app.config.get('BACKGROUND_JOBS') == 'worker':
+        return jsonify({'message': 'queued', 'job': job.to_dict()}), 202
+    threading.Thread(target=_run_import, args=(job.id, import_sync_workers()),
+                     name=f"import-{job.id}", daemon=True).start()
+    return jsonify({'message': 'started', 'job': job.to_dict()}), 202
+
+
+@app.route('/api/videos/import/<int:job_id>', methods=['GET'])
+def get_import_job(job_id):
+    """Progress of one import job."""
+    return jsonify(ImportJob.query.get_or_404(job_id).to_dict())
+
+
 @app.route('/api/videos/<int:video_id>', methods=['DELETE'])
 def delete_video(video_id):
     """Deactivate a video (soft delete)."""
@@ -321,12 +864,42 @@ def delete_video(video_id):
     return jsonify({'message': 'Video deactivated'})
 
 
+def _time_range_args():
+    """Parse optional ISO-8601 ``since``/``until`` query params to naive UTC. Raises ValueError."""
+    bounds = []
+    for name in ('since', 'until'):
+        raw = request.args.get(name)
+        bounds.append(_as_naive_utc(datetime.fromisoformat(raw.replace('Z', '+00:00'))) if raw else None)
+    return tuple(bounds)
+
+
+def _metrics_query(video_id, since=None, until=None):
+    """Metric runs of one video overlapping the range, in time order.
+
+    A time range lets Postgres skip monthly partitions.
+    """
+    query = metric_history.range_filter(VideoMetric.query.filter_by(video_id=video_id), since, until)
+    return query.order_by(VideoMetric.recorded_at.asc())
+
+
 @app.route('/api/videos/<int:video_id>/metrics', methods=['GET'])
 def get_video_metrics(video_id):
-    """Get metrics history for a video."""
-    video = Video.query.get_or_404(video_id)
-    metrics = VideoMetric.query.filter_by(video_id=video_id).order_by(VideoMetric.recorded_at).all()
-    return jsonify([m.to_dict() for m in metrics])
+    """Get metrics history for a video.
+
+    Query params:
+      since, until (optional): ISO-8601 timestamps bounding recorded_at
+      expand (optional): true (default) returns one point per observation boundary,
+                         false the stored runs with their valid_until
+    """
+    Video.query.get_or_404(video_id)
+    try:
+        since, until = _time_range_args()
+    except ValueError:
+        return jsonify({'error': 'since/until must be ISO-8601 timestamps'}), 400
+    runs = _metrics_query(video_id, since, until).all()
+    if request.args.get('expand', 'true').lower() == 'false':
+        return jsonify([m.to_dict() for m in runs])
+    return jsonify([p.to_dict() for p in metric_history.expand_runs(runs, since, until)])
 
 
 @app.route('/api/videos/compare', methods=['GET'])
@@ -337,6 +910,7 @@ def compare_videos():
       video1 (required): first video internal id
       video2 (required): second video internal id
       limit (optional): max number of metric points per video (most recent N)
+      since, until (optional): ISO-8601 timestamps bounding recorded_at
 
     Returns JSON with structure:
     {
@@ -363,14 +937,19 @@ def compare_videos():
     if not v1_id or not v2_id:
         return jsonify({'error': 'video1 and video2 query parameters required'}), 400
 
+    try:
+        since, until = _time_range_args()
+    except ValueError:
+        return jsonify({'error': 'since/until must be ISO-8601 timestamps'}), 400
+
     v1 = Video.query.get(v1_id)
     v2 = Video.query.get(v2_id)
     if not v1 or not v2:
         return jsonify({'error': 'One or both videos not found'}), 404
 
-    # Fetch ALL metrics (ordered ascending for chart labels)
-    full_m1 = VideoMetric.query.filter_by(video_id=v1_id).order_by(VideoMetric.recorded_at.asc()).all()
-    full_m2 = VideoMetric.query.filter_by(video_id=v2_id).order_by(VideoMetric.recorded_at.asc()).all()
+    # Fetch all metrics in range (ordered ascending for chart labels)
+    full_m1 = metric_history.expand_runs(_metrics_query(v1_id, since, until).all(), since, until)
+    full_m2 = metric_history.expand_runs(_metrics_query(v2_id, since, until).all(), since, until)
 
     # Build aligned timestamp union from full metrics; strings for JSON stability
     ts_set = set()
@@ -526,10 +1105,16 @@ def get_video_comments(video_id):
       - page: 1-based page index (default 1)
       - page_size: items per page (default 50)
             - sentiment: all|positive|neutral|negative (default all)
+      - fields: comma-separated subset of the comment keys (default: all)
 
-    Returns an object with items and pagination metadata.
+    Returns an object with items and pagination metadata. Items are read as a column
+    projection (see projection.py).
     """
     Video.query.get_or_404(video_id)
+    try:
+        fields = projection.parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
     include_deleted = request.args.get('include_deleted', 'true').lower() == 'true'
     deleted_only = request.args.get('deleted_only', 'false').lower() == 'true'
@@ -580,7 +1165,7 @@ def get_video_comments(video_id):
 
     # Pagination
     total = query.count()
-    items = query.offset((page - 1) * page_size).limit(page_size).all()
+    items = projection.comment_items(query.offset((page - 1) * page_size).limit(page_size), fields)
 
     # Global totals independent of filters (for stable UI counters)
     total_base = Comment.query.filter_by(video_id=video_id)
@@ -590,8 +1175,8 @@ def get_video_comments(video_id):
     pos_total = total_base.filter(Comment.sentiment == 'positive').count()
     neu_total = total_base.filter(Comment.sentiment == 'neutral').count()
     neg_total = total_base.filter(Comment.sentiment == 'negative').count()
-    return jsonify({
-        'items': [c.to_dict() for c in items],
+    return projection.json_response({
+        'items': items,
         'pagination': {
             'page': page,
             'page_size': page_size,
@@ -619,13 +1204,27 @@ def get_comment_replies(comment_id):
       - deleted_only: true|false (default false)
       - sort: same options as parent
             - sentiment: all|positive|neutral|negative (default all)
+      - page / page_size: pagination (default 1 / 50, max 200)
+      - fields: comma-separated subset of the comment keys (default: all)
+
+    Returns an object with items and pagination metadata.
     """
     include_deleted = request.args.get('include_deleted', 'true').lower() == 'true'
     deleted_only = request.args.get('deleted_only', 'false').lower() == 'true'
     sort_by = request.args.get('sort', 'date_desc')
     sentiment = request.args.get('sentiment', 'all')
+    page = max(1, request.args.get('page', default=1, type=int) or 1)
+    page_size = min(200, max(1, request.args.get('page_size', default=50, type=int) or 50))
+    try:
+        fields = projection.parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
     query = Comment.query.filter_by(parent_id=comment_id)
+    # Replies share the parent's video; filtering on it keeps the lookup on one comments partition
+    parent_video_id = db.session.query(Comment.video_id).filter_by(comment_id=comment_id).scalar()
+    if parent_video_id is not None:
+        query = query.filter(Comment.video_id == parent_video_id)
     if deleted_only:
         query = query.filter_by(status='deleted')
     elif not include_deleted:
@@ -663,8 +1262,370 @@ def get_comment_replies(comment_id):
     else:
         query = query.order_by(Comment.published_at.desc())
 
-    replies = query.all()
-    return jsonify([c.to_dict() for c in replies])
+    total = query.count()
+    items = projection.comment_items(query.offset((page - 1) * page_size).limit(page_size), fields)
+    return projection.json_response({
+        'items': items,
+        'pagination': {
+            'page': page,
+            'page_size': page_size,
+            'total': total,
+            'total_pages': (total + page_size - 1) // page_size
+        }
+    })
+
+
+@app.route('/api/comments/<string:comment_id>/history', methods=['GET'])
+def get_comment_history(comment_id):
+    """Edit and moderation history of a comment with every archived text version.
+
+    Query params:
+      - revision: return only this version (reconstructed from the nearest keyframe)
+
+    Versions are reconstructed from comment_revisions (see comment_revisions.py);
+    events are the comment_history entries (edited, deleted, reinstated).
+    """
+    comment = Comment.query.filter_by(comment_id=comment_id).first_or_404()
+    revision = request.args.get('revision', type=int)
+    if revision is not None:
+        version = comment_revisions.version(comment.id, revision)
+        if version is None:
+            return jsonify({'error': 'Revision not found'}), 404
+        return jsonify(version)
+    events = CommentHistory.query.filter_by(comment_id=comment.id).order_by(CommentHistory.id).all()
+    return jsonify({
+        'comment': _comments_to_dicts([comment])[0],
+        'versions': comment_revisions.versions(comment.id),
+        'events': [e.to_dict() for e in events]
+    })
+
+
+@app.route('/api/videos/<int:video_id>/threads', methods=['GET'])
+def get_comment_threads(video_id):
+    """Top-level comments of a video with reply counts and their first replies.
+
+    Query params:
+      - sort: date_desc (default) | date_asc | likes_desc | likes_asc (top-level comments)
+      - include_deleted: true|false (default true, applies to parents and embedded replies)
+      - page / page_size: pagination of top-level comments (default 1 / 20, max 100)
+      - replies: number of replies embedded per thread, oldest first (default 3, max 20, 0 = none)
+
+    Runs a fixed number of queries regardless of page size: the page, its count, one
+    grouped count over all replies of the page and one row_number() window query for
+    the embedded replies. reply_count / deleted_reply_count always cover all replies.
+    """
+    Video.query.get_or_404(video_id)
+
+    include_deleted = request.args.get('include_deleted', 'true').lower() == 'true'
+    sort_by = request.args.get('sort', 'date_desc')
+    page = max(1, request.args.get('page', default=1, type=int) or 1)
+    page_size = min(100, max(1, request.args.get('page_size', default=20, type=int) or 20))
+    reply_limit = min(20, max(0, request.args.get('replies', default=3, type=int) or 0))
+
+    query = Comment.query.filter(Comment.video_id == video_id, Comment.parent_id.is_(None))
+    if not include_deleted:
+        query = query.filter_by(status='active')
+    if sort_by == 'date_asc':
+        query = query.order_by(Comment.published_at.asc(), Comment.id.asc())
+    elif sort_by == 'likes_desc':
+        query = query.order_by(Comment.like_count.desc(), Comment.id.asc())
+    elif sort_by == 'likes_asc':
+        query = query.order_by(Comment.like_count.asc(), Comment.id.asc())
+    else:
+        query = query.order_by(Comment.published_at.desc(), Comment.id.desc())
+
+    total = query.count()
+    parents = query.offset((page - 1) * page_size).limit(page_size).all()
+    parent_ids = [c.comment_id for c in parents]
+
+    counts = {}
+    replies_by_parent = {pid: [] for pid in parent_ids}
+    if parent_ids:
+        # video_id keeps both queries on one comments partition
+        counts = {
+            parent_id: (total_replies, deleted_replies or 0)
+            for parent_id, total_replies, deleted_replies in db.session.query(
+                Comment.parent_id,
+                func.count(Comment.id),
+                func.sum(case((Comment.status == 'deleted', 1), else_=0)),
+            ).filter(Comment.video_id == video_id, Comment.parent_id.in_(parent_ids)).group_by(Comment.parent_id)
+        }
+        if reply_limit:
+            position = func.row_number().over(
+                partition_by=Comment.parent_id, order_by=(Comment.published_at.asc(), Comment.id.asc())
+            ).label('position')
+            ranked = select(Comment.id, position).where(
+                Comment.video_id == video_id, Comment.parent_id.in_(parent_ids))
+            if not include_deleted:
+                ranked = ranked.where(Comment.status == 'active')
+            ranked = ranked.subquery()
+            replies = (Comment.query.join(ranked, Comment.id == ranked.c.id)
+                       .filter(ranked.c.position <= reply_limit)
+                       .order_by(Comment.parent_id, ranked.c.position).all())
+            for reply in replies:
+                replies_by_parent[reply.parent_id].append(reply)
+
+    embedded = [r for pid in parent_ids for r in replies_by_parent[pid]]
+    serialized = iter(_comments_to_dicts(parents + embedded))
+    items = [next(serialized) for _ in parents]
+    for item, parent in zip(items, parents):
+        reply_count, deleted_reply_count = counts.get(parent.comment_id, (0, 0))
+        item['reply_count'] = reply_count
+        item['deleted_reply_count'] = deleted_reply_count
+        item['replies'] = [next(serialized) for _ in replies_by_parent[parent.comment_id]]
+        visible = reply_count if include_deleted else reply_count - deleted_reply_count
+        item['has_more_replies'] = visible > len(item['replies'])
+
+    return jsonify({
+        'items': items,
+        'pagination': {
+            'page': page,
+            'page_size': page_size,
+            'total': total,
+            'total_pages': (total + page_size - 1) // page_size
+        },
+        'replies_per_thread': reply_limit
+    })
+
+
+def _similarity_threshold():
+    value = request.args.get('threshold', default=near_duplicates.DEFAULT_THRESHOLD, type=float)
+    return min(1.0, max(0.5, value if value is not None else near_duplicates.DEFAULT_THRESHOLD))
+
+
+def _serialize_clusters(clusters, sample):
+    """Cluster dicts with up to ``sample`` comments each (earliest first), loaded in one query."""
+    wanted = [pk for c in clusters for pk in c['comment_pks'][:sample]]
+    comments = {c.id: c for c in Comment.query.filter(Comment.id.in_(wanted)).all()} if wanted else {}
+    ordered = [comments[pk] for pk in wanted if pk in comments]
+    serialized = dict(zip([c.id for c in ordered], _comments_to_dicts(ordered)))
+    return [{
+        'size': c['size'],
+        'video_ids': c['video_ids'],
+        'min_similarity': c['min_similarity'],
+        'first_published': c['first_published'].isoformat() if c['first_published'] else None,
+        'last_published': c['last_published'].isoformat() if c['last_published'] else None,
+        'comments': [serialized[pk] for pk in c['comment_pks'][:sample] if pk in serialized],
+    } for c in clusters]
+
+
+@app.route('/api/comments/<string:comment_id>/near-duplicates', methods=['GET'])
+def get_comment_near_duplicates(comment_id):
+    """Comments whose text is nearly identical to this one, on any video.
+
+    Query params:
+      - threshold: minimum estimated Jaccard similarity of the word bigrams (0.5-1, default 0.8)
+      - limit: max matches (default 50, max 200)
+    """
+    comment = Comment.query.filter_by(comment_id=comment_id).first_or_404()
+    limit = min(200, max(1, request.args.get('limit', default=50, type=int) or 50))
+    matches = near_duplicates.matches_for_comment(comment.id, _similarity_threshold(), limit)
+    items = []
+    if matches:
+        rows = {c.id: c for c in Comment.query.filter(Comment.id.in_([pk for pk, _ in matches])).all()}
+        ordered = [(rows[pk], sim) for pk, sim in matches if pk in rows]
+        for item, (_, sim) in zip(_comments_to_dicts([c for c, _ in ordered]), ordered):
+            item['similarity'] = sim
+            items.append(item)
+    return jsonify({
+        'comment': _comments_to_dicts([comment])[0],
+        'indexed': matches is not None,
+        'matches': items
+    })
+
+
+@app.route('/api/videos/<int:video_id>/near-duplicates', methods=['GET'])
+def get_video_near_duplicates(video_id):
+    """Clusters of near-identical comments involving this video (members may be on other videos).
+
+    Query params: threshold (default 0.8), min_size (default 2), limit (clusters, default 20),
+    sample (comments returned per cluster, default 10)
+    """
+    Video.query.get_or_404(video_id)
+    min_size = max(2, request.args.get('min_size', default=2, type=int) or 2)
+    limit = min(100, max(1, request.args.get('limit', default=20, type=int) or 20))
+    sample = min(100, max(1, request.args.get('sample', default=10, type=int) or 10))
+    clusters, truncated = near_duplicates.clusters_for_video(video_id, _similarity_threshold(), min_size, limit)
+    return jsonify({'video_id': video_id, 'clusters': _serialize_clusters(clusters, sample),
+                    'truncated': truncated})
+
+
+@app.route('/api/near-duplicates', methods=['GET'])
+def get_near_duplicate_waves():
+    """Clusters of near-identical comments published in a time window, e.g. bot or copy-paste waves.
+
+    Query params:
+      - since (required), until (default now): ISO-8601 window on published_at
+      - threshold (default 0.8), min_size (default 3), min_videos (default 2: only cross-video waves)
+      - limit (clusters, default 20), sample (comments per cluster, default 10)
+    """
+    try:
+        since, until = _time_range_args()
+    except ValueError:
+        return jsonify({'error': 'since/until must be ISO-8601 timestamps'}), 400
+    if since is None:
+        return jsonify({'error': 'since is required'}), 400
+    until = until or _as_naive_utc(datetime.now(timezone.utc))
+    min_size = max(2, request.args.get('min_size', default=3, type=int) or 3)
+    min_videos = max(1, request.args.get('min_videos', default=2, type=int) or 1)
+    limit = min(100, max(1, request.args.get('limit', default=20, type=int) or 20))
+    sample = min(100, max(1, request.args.get('sample', default=10, type=int) or 10))
+    clusters, truncated = near_duplicates.clusters_in_window(
+        since, until, _similarity_threshold(), min_size, min_videos, limit)
+    return jsonify({
+        'since': since.isoformat(),
+        'until': until.isoformat(),
+        'clusters': _serialize_clusters(clusters, sample),
+        'truncated': truncated
+    })
+
+
+def _author_page(video_pk):
+    sort = request.args.get('sort', 'comments')
+    if sort not in author_stats.SORTS:
+        return jsonify({'error': f"sort must be one of {', '.join(author_stats.SORTS)}"}), 400
+    descending = request.args.get('order', 'desc').lower() != 'asc'
+    page = max(1, request.args.get('page', default=1, type=int) or 1)
+    page_size = min(100, max(1, request.args.get('page_size', default=50, type=int) or 50))
+    min_comments = max(1, request.args.get('min_comments', default=1, type=int) or 1)
+    rows, total = author_stats.top_authors(video_pk, sort, descending, page, page_size, min_comments)
+    return jsonify({
+        'items': [r.to_dict() for r in rows],
+        'pagination': {
+            'page': page,
+            'page_size': page_size,
+            'total': total,
+            'total_pages': (total + page_size - 1) // page_size
+        },
+        'sort': sort,
+        'order': 'desc' if descending else 'asc'
+    })
+
+
+@app.route('/api/authors', methods=['GET'])
+def get_authors():
+    """Commenters across the whole archive from the author_stats aggregates.
+
+    Query params:
+      - sort: comments (default) | deleted | reinstated | likes | negative | first_seen | last_seen
+      - order: desc (default) | asc
+      - min_comments: only authors with at least this many archived comments (default 1)
+      - page / page_size: pagination (default 1 / 50, max 100)
+    """
+    return _author_page(author_stats.TOTALS)
+
+
+@app.route('/api/videos/<int:video_id>/authors', methods=['GET'])
+def get_video_authors(video_id):
+    """Commenters of one video; same query params as /api/authors."""
+    Video.query.get_or_404(video_id)
+    return _author_page(video_id)
+
+
+@app.route('/api/authors/<string:author_channel_id>', methods=['GET'])
+def get_author(author_channel_id):
+    """Archive-wide totals of one author plus their per-video aggregates."""
+    totals, videos = author_stats.author_detail(author_channel_id)
+    if totals is None:
+        return jsonify({'error': 'Author not found'}), 404
+    titles = dict(db.session.query(Video.id, Video.title).filter(Video.id.in_([v.video_id for v in videos])))
+    per_video = []
+    for row in videos:
+        item = row.to_dict()
+        item['video_title'] = titles.get(row.video_id)
+        per_video.append(item)
+    return jsonify({'author': totals.to_dict(), 'videos': per_video})
+
+
+@app.route('/api/authors/<string:author_channel_id>/comments', methods=['GET'])
+def get_author_comments(author_channel_id):
+    """Comments of one author, newest first (uses the author index).
+
+    Query params:
+      - video_id: limit to one video
+      - status: active | deleted (default: both)
+      - page / page_size: pagination (default 1 / 50, max 100)
+      - fields: comma-separated subset of the comment keys (default: all)
+    """
+    try:
+        fields = projection.parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    page = max(1, request.args.get('page', default=1, type=int) or 1)
+    page_size = min(100, max(1, request.args.get('page_size', default=50, type=int) or 50))
+    status = request.args.get('status')
+    if status not in (None, 'active', 'deleted'):
+        return jsonify({'error': 'status must be active or deleted'}), 400
+    query = Comment.query.filter(Comment.author_channel_id == author_channel_id)
+    video_id = request.args.get('video_id', type=int)
+    if video_id:
+        query = query.filter(Comment.video_id == video_id)
+    if status:
+        query = query.filter(Comment.status == status)
+    query = query.order_by(Comment.published_at.desc(), Comment.id.desc())
+    total = query.count()
+    return projection.json_response({
+        'items': projection.comment_items(query.offset((page - 1) * page_size).limit(page_size), fields),
+        'pagination': {
+            'page': page,
+            'page_size': page_size,
+            'total': total,
+            'total_pages': (total + page_size - 1) // page_size
+        }
+    })
+
+
+@app.route('/api/export/<string:dataset>', methods=['GET'])
+def export_dataset(dataset):
+    """Stream comments, history or metrics for bulk analysis (see export.py).
+
+    Query params:
+      - format: ndjson (default) | csv | parquet (parquet needs pyarrow on the server)
+      - video_id: internal video id, repeatable (default: all videos)
+      - since / until: ISO-8601 range (comments: published_at, history: created_at, metrics: runs overlapping)
+      - status: active | deleted (comments and history)
+
+    Rows are read from a server-side cursor and sent as they arrive; Parquet is
+    written to a temporary file in row groups first and then streamed.
+    """
+    if dataset not in export.DATASETS:
+        return jsonify({'error': f"dataset must be one of {', '.join(export.DATASETS)}"}), 404
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in export.FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(export.FORMATS)}"}), 400
+    status = request.args.get('status')
+    if status not in (None, 'active', 'deleted'):
+        return jsonify({'error': 'status must be active or deleted'}), 400
+    try:
+        since, until = _time_range_args()
+    except ValueError:
+        return jsonify({'error': 'since/until must be ISO-8601 timestamps'}), 400
+    video_ids = request.args.getlist('video_id', type=int)
+    query = export.build_query(dataset, video_ids, since, until, status)
+    batch_size = app.config['EXPORT_BATCH_SIZE']
+    mimetype, extension = export.FORMATS[fmt]
+    headers = {'Content-Disposition': f'attachment; filename="{dataset}.{extension}"'}
+
+    if fmt == 'parquet':
+        if export.pyarrow is None:
+            return jsonify({'error': 'Parquet export needs pyarrow on the server'}), 501
+        spool = tempfile.TemporaryFile()
+        export.write_parquet(query, spool, batch_size)
+        spool.seek(0)
+
+        def file_chunks():
+            with spool:
+                while True:
+                    chunk = spool.read(1 << 20)
+                    if not chunk:
+                        return
+                    yield chunk
+
+        return Response(file_chunks(), mimetype=mimetype, headers=headers)
+
+    chunks = export.ndjson_chunks if fmt == 'ndjson' else export.csv_chunks
+    return Response(stream_with_context(chunks(export.iter_batches(query, batch_size))),
+                    mimetype=mimetype, headers=headers)
 
 
 @app.route('/api/videos/<int:video_id>/sync', methods=['POST'])
@@ -699,6 +1660,33 @@ def health_check():
     return jsonify({'status': 'healthy', 'timestamp': datetime.now(timezone.utc).isoformat()})
 
 
+@app.route('/api/videos/<int:video_id>/sentiment-trend', methods=['GET'])
+def get_sentiment_trend(video_id):
+    """Sentiment of a video's active comments over time, by publication hour or day.
+
+    Query params:
+      granularity: hour|day (default day)
+      since, until (optional): ISO-8601 timestamps bounding the publication time
+      max_points (optional): adjacent buckets are summed to stay below this (default 200)
+    """
+    Video.query.get_or_404(video_id)
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in sentiment_trends.GRANULARITIES:
+        return jsonify({'error': 'granularity must be hour or day'}), 400
+    try:
+        since, until = _time_range_args()
+    except ValueError:
+        return jsonify({'error': 'since/until must be ISO-8601 timestamps'}), 400
+    max_points = request.args.get('max_points', default=200, type=int)
+    points, merged = sentiment_trends.trend(video_id, granularity, since, until, max_points)
+    return jsonify({
+        'video_id': video_id,
+        'granularity': granularity,
+        'buckets_per_point': merged,
+        'points': points
+    })
+
+
 @app.route('/api/videos/<int:video_id>/top-keywords', methods=['GET'])
 def get_top_keywords(video_id):
     """Get top keywords (unigrams + optional bigrams) for a video.
@@ -707,132 +1695,215 @@ def get_top_keywords(video_id):
       limit (default 5)
       bigrams=true|false (include bigrams)
       min_occ (default 2) minimum total occurrences
+      scoring=frequency|tfidf|pmi|hybrid (default frequency; see term_stats.py)
     """
-    Video.query.get_or_404(video_id)
     limit = request.args.get('limit', default=5, type=int)
     use_bigrams = request.args.get('bigrams', 'true').lower() == 'true'
     min_occ = request.args.get('min_occ', default=2, type=int)
 
-    comments = Comment.query.filter_by(video_id=video_id, status='active').all()
-    if not comments:
-        return jsonify([])
-
-    counter = Counter()
-    comment_contains = {}
-
-    for c in comments:
-        terms = _extract_terms(c.text or '', use_bigrams)
-        counter.update(terms)
-        for t in set(terms):
-            comment_contains[t] = comment_contains.get(t, 0) + 1
-
-    # Filter by min occurrence and sort by occurrence desc then comment_count desc then term length desc
-    filtered = [
-        (term, occ) for term, occ in counter.items() if occ >= min_occ
-    ]
-    filtered.sort(key=lambda x: (-x[1], -comment_contains.get(x[0], 0), -len(x[0])))
+    video = Video.query.get_or_404(video_id)
+    scored = _scored_keywords(video_id, limit, min_occ, use_bigrams)
+    if scored is not None:
+        return scored
+    occurrences, containing = keywords.cached_counts(
+        ('video', video_id, video.sync_epoch, video.last_synced),
+        lambda: db.session.scalars(select(Comment.text).where(Comment.video_id == video_id,
+                                                              Comment.status == 'active')),
+        use_bigrams)
+    return jsonify(keywords.top_terms(occurrences, containing, limit, min_occ))
+
+
+def _scored_keywords(video_id, limit, min_occ, use_bigrams):
+    """Response for scoring=tfidf|pmi|hybrid from the term statistics; None for plain frequency."""
+    scoring = request.args.get('scoring', 'frequency').lower()
+    if scoring not in term_stats.SCORINGS:
+        return jsonify({'error': f"scoring must be one of {', '.join(term_stats.SCORINGS)}"}), 400
+    if scoring == 'frequency':
+        return None
+    if not app.config.get('TERM_STATS_ENABLED', True):
+        return jsonify({'error': 'Term statistics are disabled (TERM_STATS_ENABLED)'}), 409
+    return jsonify(term_stats.top_terms(video_id or None, scoring, limit, min_occ, use_bigrams,
+                                        app.config['KEYWORD_SCORING_CANDIDATES']))
+
+
+@app.route('/api/videos/<int:video_id>/keyword-trends', methods=['GET'])
+def get_keyword_trends(video_id):
+    """Daily occurrences of a video's keywords, from the snapshots taken after each sync.
 
-    items = []
-    for term, occ in filtered[:limit]:
-        items.append({
-            'term': term,
-            'occurrence_count': int(occ),
-            'comment_count': int(comment_contains.get(term, 0)),
-            'ngram': 2 if ' ' in term else 1
-        })
-    return jsonify(items)
-
-
-_STOPWORDS_DE = {
-    'der','die','das','und','ist','im','in','den','zu','mit','von','für','dass','auf','ein','eine','einer','eines','sind','auch','als','an','am','es','ich','du','er','sie','wir','ihr','man','nicht','nur','oder','aber','wenn','wie','so','mal','noch','schon','da','hier','dann','dem','des','was','wer','wird','über','unter','mehr','weniger','kein','keine','keinen','keiner','mich','mir','dich','dir','sein','seine','seinen','seiner','ihr','ihre','ihren','ihm','ihr','euch','uns','zum','zur','beim','vom','vom','beim','einem','einen','eines','soll','sollte','kann','können','könnte','muss','müssen','müsste','wurde','würde','werden','wurden','wären',
-    # häufige Füllwörter/Verbformen
-    'hat','sehr','hast','habt','haben','hätte','hättest','hätten','immer','nie','ganz','halt'
-}
-_STOPWORDS_EN = {
-    'the','and','a','an','to','of','in','on','for','is','are','was','were','it','this','that','these','those','i','you','he','she','we','they','them','us','me','my','your','his','her','our','their','or','but','if','so','as','at','by','with','from','not','no','yes','be','been','have','has','had','do','did','does','can','could','should','would','will','just','more','most','some','any','other','there','here','then','than','very','also','too','into','out','up','down'
-}
-_STOPWORDS_MISC = {'http','https','www','com','net','org','youtu','youtube','video','channel','watch','amp'}
-
-# Allow environment-based custom stopwords (comma-separated)
-def _load_additional_stopwords():
-    extra_env = {s.strip().lower() for s in os.environ.get('KEYWORD_STOPWORDS', '').split(',') if s.strip()}
-    file_path = os.path.join(app.instance_path, 'stopwords.json')
-    extra_file = set()
+    Query params:
+      since, until (optional): ISO-8601 timestamps bounding the publication day
+      terms (optional): comma-separated terms to follow; default the most frequent in the range
+      limit (default 10): number of terms without ``terms``
+      bigrams=true|false (include bigrams, default true)
+    """
+    Video.query.get_or_404(video_id)
+    if not app.config.get('KEYWORD_TRENDS_ENABLED', True):
+        return jsonify({'error': 'Keyword trends are disabled (KEYWORD_TRENDS_ENABLED)'}), 409
     try:
-        if os.path.exists(file_path):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                if isinstance(data, list):
-                    extra_file = {str(x).strip().lower() for x in data if str(x).strip()}
-    except Exception as e:
-        logger.warning(f"Failed to read custom stopwords file: {e}")
-    return extra_env | extra_file
-
-_RUNTIME_EXTRA_STOPWORDS = _load_additional_stopwords()
-
-def _build_stopword_set():
-    return _STOPWORDS_DE | _STOPWORDS_EN | _STOPWORDS_MISC | _RUNTIME_EXTRA_STOPWORDS
-
-_STOPWORDS_ALL = _build_stopword_set()
-
+        since, until = _time_range_args()
+    except ValueError:
+        return jsonify({'error': 'since/until must be ISO-8601 timestamps'}), 400
+    raw_terms = request.args.get('terms')
+    terms = list(dict.fromkeys(' '.join(t.lower().split()) for t in raw_terms.split(',') if t.strip())) \
+        if raw_terms else None
+    limit = request.args.get('limit', default=10, type=int)
+    use_bigrams = request.args.get('bigrams', 'true').lower() == 'true'
+    days, items = keyword_trends.trends(video_id, since, until, terms, limit, use_bigrams)
+    return jsonify({
+        'video_id': video_id,
+        'granularity': keyword_trends.GRANULARITY,
+        'top_k': app.config.get('KEYWORD_TREND_TOP_K', 20),
+        'buckets': days,
+        'terms': items
+    })
 
-def _tokenize_text(txt: str):
-    # Keep unicode letters and numbers as token chars, split on everything else
-    tokens = re.findall(r"[\w\-]+", txt.lower())
-    cleaned = []
-    for t in tokens:
-        if len(t) < 3:
-            continue
-        if t.isdigit():
-            continue
-        if t in _STOPWORDS_ALL:
-            continue
-        cleaned.append(t)
-    return cleaned
-
-def _generate_ngrams(tokens, n):
-    return [' '.join(tokens[i:i+n]) for i in range(len(tokens)-n+1)]
-
-def _extract_terms(text: str, use_bigrams: bool):
-    toks = _tokenize_text(text or '')
-    terms = toks[:]
-    if use_bigrams:
-        bigrams = _generate_ngrams(toks, 2)
-        # Filter bigrams containing any stopword token
-        filtered_bigrams = [bg for bg in bigrams if all(part not in _STOPWORDS_ALL for part in bg.split())]
-        terms.extend(filtered_bigrams)
-    return terms
 
 @app.route('/api/admin/stopwords', methods=['GET','PUT'])
 def manage_stopwords():
-    """GET returns combined stopwords (base + custom). PUT replaces custom (file + env unaffected).
+    """GET returns combined stopwords (base + custom). PUT replaces custom (env unaffected).
 
     PUT body: { "stopwords": ["wort1", "wort2"] }
-    Writes to instance/stopwords.json
+    Stored in the stopwords table; every worker picks the new version up within
+    STOPWORDS_CHECK_SECONDS (see keywords.py). The keyword statistics are then
+    recounted in the background (by worker.py with BACKGROUND_JOBS=worker).
     """
-    global _RUNTIME_EXTRA_STOPWORDS, _STOPWORDS_ALL
     if request.method == 'GET':
+        tokenizer = keywords.refresh()
+        custom = keywords.env_stopwords() | keywords.custom_stopwords()
         return jsonify({
-            'base_count': len(_STOPWORDS_DE | _STOPWORDS_EN | _STOPWORDS_MISC),
-            'custom_count': len(_RUNTIME_EXTRA_STOPWORDS),
-            'custom': sorted(list(_RUNTIME_EXTRA_STOPWORDS)),
-            'all': sorted(list(_STOPWORDS_ALL))
+            'base_count': len(keywords.BASE_STOPWORDS),
+            'custom_count': len(custom),
+            'custom': sorted(custom),
+            'all': sorted(tokenizer.stopwords),
+            'version': tokenizer.version
         })
     data = request.json or {}
     new_list = data.get('stopwords', [])
     if not isinstance(new_list, list):
         return jsonify({'error': 'stopwords must be a list'}), 400
-    file_path = os.path.join(app.instance_path, 'stopwords.json')
     try:
-        os.makedirs(app.instance_path, exist_ok=True)
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(new_list, f, ensure_ascii=False, indent=2)
-        # Rebuild sets
-        _RUNTIME_EXTRA_STOPWORDS = _load_additional_stopwords()
-        _STOPWORDS_ALL = _build_stopword_set()
-        return jsonify({'message': 'updated', 'custom_count': len(_RUNTIME_EXTRA_STOPWORDS)})
+        tokenizer = keywords.save_stopwords(new_list)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    # Term statistics and keyword trends are recounted with the new list
+    if app.config.get('BACKGROUND_JOBS') == 'worker':
+        recount = 'queued'
+    else:
+        threading.Thread(target=_run_keyword_stats_rebuild, name='keyword-stats', daemon=True).start()
+        recount = 'started'
+    custom_count = len(keywords.env_stopwords() | keywords.custom_stopwords())
+    return jsonify({'message': 'updated', 'custom_count': custom_count, 'version': tokenizer.version,
+                    'recount': recount})
+
+
+# Upper bounds for one POST /api/sentiment/analyze request
+_ANALYZE_MAX_TEXTS = 100
+_ANALYZE_TIMEOUT_SECONDS = 30
+
+
+@app.route('/api/sentiment/analyze', methods=['POST'])
+def analyze_sentiment():
+    """Score ad-hoc texts with the sentiment model.
+
+    Body: { "text": "..." } or { "texts": ["...", ...] } (at most 100 texts)
+
+    Concurrent requests share model batches through the micro-batcher
+    (SENTIMENT_BATCH_SIZE, SENTIMENT_BATCH_MAX_WAIT_MS). Labels below
+    SENTIMENT_MIN_CONFIDENCE are returned as sentiment null, like stored comments.
+    """
+    if not app.config.get('SENTIMENT_ENABLED', True):
+        return jsonify({'error': 'Sentiment analysis is disabled'}), 409
+    data = request.json or {}
+    texts = data.get('texts')
+    if texts is None and 'text' in data:
+        texts = [data['text']]
+    if not isinstance(texts, list) or not texts or not all(isinstance(t, str) for t in texts):
+        return jsonify({'error': 'text (string) or texts (list of strings) is required'}), 400
+    if len(texts) > _ANALYZE_MAX_TEXTS:
+        return jsonify({'error': f"at most {_ANALYZE_MAX_TEXTS} texts per request"}), 400
+
+    batcher = get_batcher(app.config['SENTIMENT_BATCH_SIZE'], app.config['SENTIMENT_BATCH_MAX_WAIT_MS'],
+                          on_batch=observe_microbatch)
+    try:
+        raw = batcher.analyze(texts, timeout=_ANALYZE_TIMEOUT_SECONDS)
+    except FuturesTimeoutError:
+        return jsonify({'error': 'sentiment analysis timed out'}), 503
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        logger.error(f"On-demand sentiment analysis failed: {e}")
+        return jsonify({'error': 'sentiment analysis failed'}), 500
+
+    min_conf = app.config.get('SENTIMENT_MIN_CONFIDENCE', 0.6)
+    results = []
+    for result in raw:
+        if not result:
+            results.append(None)
+            continue
+        score = float(result.get('score') or 0.0)
+        results.append({
+            'sentiment': result.get('sentiment') if score >= float(min_conf) else None,
+            'score': score,
+            'label': result.get('label')
+        })
+    return jsonify({'model': get_analyzer().model_name, 'min_confidence': min_conf, 'results': results})
+
+
+def _run_sentiment_backfill(job_id, chunk_size, max_rate):
+    with app.app_context():
+        try:
+            node_id = coordinator.node_id if coordinator is not None else default_node_id()
+            sentiment_backfill.run_job(job_id, get_analyzer(), chunk_size=chunk_size, max_rate=max_rate,
+                                       holder=node_id)
+        except Exception as e:
+            logger.error(f"Sentiment backfill job {job_id} crashed: {e}")
+        finally:
+            db.session.remove()
+
+
+@app.route('/api/admin/sentiment-backfill', methods=['GET', 'POST'])
+def sentiment_backfill_jobs():
+    """GET lists recent backfill jobs with progress, rate and ETA.
+
+    POST starts (or resumes) the job for the current model and SENTIMENT_MIN_CONFIDENCE in
+    a background thread. Optional body: { "chunk_size": 256, "max_rate": 50 }
+    With BACKGROUND_JOBS=worker the job is only queued; worker.py runs it with the
+    configured SENTIMENT_BACKFILL_CHUNK / SENTIMENT_BACKFILL_MAX_RATE.
+    """
+    if request.method == 'GET':
+        jobs = SentimentBackfillJob.query.order_by(SentimentBackfillJob.id.desc()).limit(20).all()
+        return jsonify({'jobs': [j.to_dict() for j in jobs]})
+    if not app.config.get('SENTIMENT_ENABLED', True):
+        return jsonify({'error': 'Sentiment analysis is disabled'}), 409
+    data = request.json or {}
+    try:
+        chunk_size = int(data.get('chunk_size') or app.config['SENTIMENT_BACKFILL_CHUNK'])
+        max_rate = float(data.get('max_rate', app.config['SENTIMENT_BACKFILL_MAX_RATE']) or 0)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'chunk_size and max_rate must be numbers'}), 400
+    if chunk_size < 1 or max_rate < 0:
+        return jsonify({'error': 'chunk_size must be >= 1 and max_rate >= 0'}), 400
+    # The model is loaded by whichever process runs the job, not by every API worker
+    job = sentiment_backfill.start_job(current_model_name(), app.config['SENTIMENT_MIN_CONFIDENCE'])
+    if job.status == 'running' and job.updated_at and \
+            _as_naive_utc(datetime.now(timezone.utc)) - job.updated_at < sentiment_backfill.STALE_AFTER:
+        return jsonify({'message': 'already running', 'job': job.to_dict()}), 409
+    if app.config.get('BACKGROUND_JOBS') == 'worker':
+        # worker.py picks it up with the configured chunk size and rate
+        if job.status in ('paused', 'failed'):
+            job.status = 'pending'
+            db.session.commit()
+        return jsonify({'message': 'queued', 'job': job.to_dict()}), 202
+    threading.Thread(target=_run_sentiment_backfill, args=(job.id, chunk_size, max_rate),
+                     name=f"sentiment-backfill-{job.id}", daemon=True).start()
+    return jsonify({'message': 'started', 'job': job.to_dict()}), 202
+
+
+@app.route('/api/admin/sentiment-backfill/<int:job_id>/pause', methods=['POST'])
+def pause_sentiment_backfill(job_id):
+    """Stop a backfill job after its current chunk; POST /api/admin/sentiment-backfill resumes it."""
+    job = SentimentBackfillJob.query.get_or_404(job_id)
+    if not sentiment_backfill.pause_job(job_id):
+        return jsonify({'error': f"job is {job.status}"}), 409
+    return jsonify({'message': 'pausing', 'job_id': job_id})
 
 
 @app.route('/api/keywords/suggest', methods=['GET'])
@@ -844,123 +1915,136 @@ def suggest_keywords():
       - limit (optional, default 25): number of suggestions
       - bigrams=true|false (include bigrams)
       - min_occ (default 3)
+      - scoring=frequency|tfidf|pmi|hybrid (default frequency; see term_stats.py)
     """
     limit = request.args.get('limit', default=25, type=int)
     video_id = request.args.get('video_id', type=int)
     use_bigrams = request.args.get('bigrams', 'true').lower() == 'true'
     min_occ = request.args.get('min_occ', default=3, type=int)
 
-    query = Comment.query
+    scored = _scored_keywords(video_id, limit, min_occ, use_bigrams)
+    if scored is not None:
+        return scored
+
+    texts = select(Comment.text).where(Comment.status == 'active')
     if video_id:
-        query = query.filter_by(video_id=video_id)
-    query = query.filter_by(status='active')
-    comments = query.all()
+        texts = texts.where(Comment.video_id == video_id)
+    # Any sync of a video in scope moves its epoch and last_synced
+    videos = db.session.query(func.count(Video.id), func.sum(Video.sync_epoch), func.max(Video.last_synced))
+    if video_id:
+        videos = videos.filter(Video.id == video_id)
+    occurrences, containing = keywords.cached_counts(('comments', video_id) + tuple(videos.one()),
+                                                     lambda: db.session.scalars(texts), use_bigrams)
+    return jsonify(keywords.top_terms(occurrences, containing, limit, min_occ))
 
-    counter = Counter()
-    comment_contains = {}
 
-    for c in comments:
-        terms = _extract_terms(c.text or '', use_bigrams)
-        counter.update(terms)
-        # Track unique tokens per comment for comment_count
-        for t in set(terms):
-            comment_contains[t] = comment_contains.get(t, 0) + 1
+def init_app():
+    """Factory-style init for easier reuse in tests/WGI servers."""
+    with app.app_context():
+        db.create_all()
+        install_db_hooks(db.engine)
+        # Versioned schema changes for existing databases (one SELECT once everything is applied)
+        migrations.upgrade(db.engine)
+        keywords.refresh(force=True)
+    return app
 
-    # Apply min occurrence and order
-    pairs = [(t, occ) for t, occ in counter.items() if occ >= min_occ]
-    pairs.sort(key=lambda x: (-x[1], -comment_contains.get(x[0], 0), -len(x[0])))
 
-    items = []
-    for term, occ in pairs[:limit]:
-        items.append({
-            'term': term,
-            'occurrence_count': int(occ),
-            'comment_count': int(comment_contains.get(term, 0)),
-            'ngram': 2 if ' ' in term else 1
-        })
+def create_app(run_scheduler=None):
+    """Application factory for WSGI servers (wsgi.py) and the worker (worker.py).
 
-    return jsonify(items)
+    Routes live on the module-level ``app``; this finishes its setup (tables,
+    migrations, hooks) and starts the scheduled jobs when ``run_scheduler`` is true
+    (default: RUN_SCHEDULER). API workers pass False so that N server processes do
+    not run N schedulers.
+    """
+    init_app()
+    if run_scheduler is None:
+        run_scheduler = app.config.get('RUN_SCHEDULER', True)
+    if run_scheduler:
+        _setup_scheduler()
+    return app
 
 
-def _ensure_comment_sentiment_columns():
-    """Add sentiment columns to comments table if they do not exist (for existing DBs).
+def rebuild_keyword_stats():
+    """Recount term_stats and the keyword trends if the stopwords changed since they were counted.
 
-    This avoids OperationalError when the mapped model has new columns but the
-    SQLite table was created before. Safe to run multiple times.
+    One transaction locks the stopword version row, so syncs flushing meanwhile either
+    commit before the recount or count with the new stopwords after it (see
+    keywords.stats_tokenizer). Returns True if it recounted.
     """
+    with app.app_context():
+        with db.engine.begin() as conn:
+            version, counted = keywords.lock_stats_versions(conn)
+            if version == counted:
+                return False
+            tokenizer = keywords.load_tokenizer(conn)
+            if app.config.get('TERM_STATS_ENABLED', True):
+                term_stats.rebuild(conn, tokenizer=tokenizer)
+            if app.config.get('KEYWORD_TRENDS_ENABLED', True):
+                keyword_trends.rebuild(conn, tokenizer=tokenizer, top_k=app.config.get('KEYWORD_TREND_TOP_K', 20))
+            keywords.mark_stats_counted(conn, version)
+    logger.info(f"Recounted keyword statistics for stopword version {version}")
+    return True
+
+
+def _run_keyword_stats_rebuild():
     try:
-        engine = db.engine
-        dialect = engine.dialect.name
-        added = []
-        if dialect == 'sqlite':
-            # Inspect existing columns
-            rows = db.session.execute(text("PRAGMA table_info('comments')")).mappings().all()
-            existing_cols = {row['name'] for row in rows}
-            stmts = []
-            if 'sentiment' not in existing_cols:
-                stmts.append("ALTER TABLE comments ADD COLUMN sentiment VARCHAR(20)")
-                added.append('sentiment')
-            if 'sentiment_score' not in existing_cols:
-                stmts.append("ALTER TABLE comments ADD COLUMN sentiment_score REAL")
-                added.append('sentiment_score')
-            if 'sentiment_label' not in existing_cols:
-                stmts.append("ALTER TABLE comments ADD COLUMN sentiment_label VARCHAR(50)")
-                added.append('sentiment_label')
-            if 'last_seen' not in existing_cols:
-                stmts.append("ALTER TABLE comments ADD COLUMN last_seen DATETIME")
-                added.append('last_seen')
-            if 'reinstated_at' not in existing_cols:
-                stmts.append("ALTER TABLE comments ADD COLUMN reinstated_at DATETIME")
-                added.append('reinstated_at')
-            for s in stmts:
-                db.session.execute(text(s))
-            if stmts:
-                db.session.commit()
-        else:
-            # Generic fallback for other DBs
-            try:
-                cols_rs = db.session.execute(text(
-                    "SELECT column_name FROM information_schema.columns WHERE table_name = 'comments'"
-                ))
-                existing_cols = {r[0] for r in cols_rs}
-            except Exception:
-                existing_cols = set()
-            if 'sentiment' not in existing_cols:
-                db.session.execute(text("ALTER TABLE comments ADD COLUMN sentiment VARCHAR(20)"))
-                added.append('sentiment')
-            if 'sentiment_score' not in existing_cols:
-                db.session.execute(text("ALTER TABLE comments ADD COLUMN sentiment_score FLOAT"))
-                added.append('sentiment_score')
-            if 'sentiment_label' not in existing_cols:
-                db.session.execute(text("ALTER TABLE comments ADD COLUMN sentiment_label VARCHAR(50)"))
-                added.append('sentiment_label')
-            try:
-                # best-effort additions for last_seen and reinstated_at
-                if 'last_seen' not in existing_cols:
-                    db.session.execute(text("ALTER TABLE comments ADD COLUMN last_seen DATETIME"))
-                    added.append('last_seen')
-                if 'reinstated_at' not in existing_cols:
-                    db.session.execute(text("ALTER TABLE comments ADD COLUMN reinstated_at DATETIME"))
-                    added.append('reinstated_at')
-            except Exception:
-                # ignore failures, not critical
-                pass
-            if added:
-                db.session.commit()
-        if added:
-            logger.info(f"Applied DB migration: added columns to comments -> {', '.join(added)}")
+        rebuild_keyword_stats()
     except Exception as e:
-        # Non-fatal: log and continue; requests may still fail until fixed
-        logger.warning(f"Schema check/migration for comments failed: {e}")
+        logger.error(f"Recounting keyword statistics failed: {e}")
 
 
-def init_app():
-    """Factory-style init for easier reuse in tests/WGI servers."""
+def _queued_backfill_jobs():
+    stale = _as_naive_utc(datetime.now(timezone.utc)) - sentiment_backfill.STALE_AFTER
+    return [j.id for j in SentimentBackfillJob.query.filter(
+        (SentimentBackfillJob.status == 'pending')
+        | ((SentimentBackfillJob.status == 'running') & (SentimentBackfillJob.updated_at < stale))
+    ).order_by(SentimentBackfillJob.id)]
+
+
+def run_queued_jobs():
+    """Run import and sentiment backfill jobs queued by the API (BACKGROUND_JOBS=worker).
+
+    Also resumes backfills whose holder stopped updating them and recounts the keyword
+    statistics after stopword changes. Called in a loop by
+    worker.py; returns the number of jobs run.
+    """
+    recounted = rebuild_keyword_stats()
     with app.app_context():
-        db.create_all()
-        # Lightweight runtime migration for existing SQLite DBs missing new columns
-        _ensure_comment_sentiment_columns()
-    return app
+        try:
+            imports = [j.id for j in ImportJob.query.filter_by(status='pending').order_by(ImportJob.id)]
+            backfills = _queued_backfill_jobs() if app.config.get('SENTIMENT_ENABLED', True) else []
+            workers = import_sync_workers()
+        finally:
+            db.session.remove()
+    for job_id in imports:
+        _run_import(job_id, workers)
+    for job_id in backfills:
+        _run_sentiment_backfill(job_id, app.config['SENTIMENT_BACKFILL_CHUNK'],
+                                app.config['SENTIMENT_BACKFILL_MAX_RATE'])
+    return len(imports) + len(backfills) + int(recounted)
+
+
+def _partition_maintenance():
+    """Daily upkeep of monthly video_metrics partitions (no-op unless partitioned, Postgres only)."""
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            return
+        if coordinator is not None and not coordinator.acquire_lease('partition_maintenance', 3600):
+            return
+        try:
+            partitioning.maintain_partitions(db.engine, app.config['METRIC_PARTITION_MONTHS_AHEAD'],
+                                             app.config['METRICS_RETENTION_MONTHS'])
+        except Exception as e:
+            logger.error(f"Partition maintenance failed: {e}")
+
+
+def _coordinator_heartbeat():
+    with app.app_context():
+        try:
+            coordinator.heartbeat()
+        except Exception as e:
+            logger.warning(f"Coordinator heartbeat failed: {e}")
 
 
 def _setup_scheduler():
@@ -994,7 +2078,12 @@ def _setup_scheduler():
                 hours = int(sync_hours)
             except Exception:
                 hours = 24
-            trigger = IntervalTrigger(hours=hours)
+            if coordinator is not None:
+                # Lease mode keys ticks by fire time: every node fires on the same UTC boundaries
+                # instead of counting the interval from its own start
+                trigger = IntervalTrigger(hours=hours, start_date=datetime(1970, 1, 1, tzinfo=timezone.utc))
+            else:
+                trigger = IntervalTrigger(hours=hours)
             logger.info(f"Using interval trigger for sync: every {hours} hour(s)")
             job_name = f"Sync all videos (interval {hours}h)"
 
@@ -1007,6 +2096,28 @@ def _setup_scheduler():
         )
         logger.info("Added scheduler job 'sync_all_videos'")
 
+    if coordinator is not None and not scheduler.get_job('sync_heartbeat'):
+        # Keep this node visible to the others between ticks so sharding sees it as live
+        scheduler.add_job(
+            func=_coordinator_heartbeat,
+            trigger=IntervalTrigger(seconds=coordinator.heartbeat_interval),
+            id='sync_heartbeat',
+            name='Sync coordination heartbeat',
+            replace_existing=True
+        )
+        logger.info(f"Sync coordination enabled (lease mode) as node {coordinator.node_id}")
+
+    if app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgresql') and \
+            not scheduler.get_job('partition_maintenance'):
+        scheduler.add_job(
+            func=_partition_maintenance,
+            trigger=IntervalTrigger(hours=24),
+            id='partition_maintenance',
+            name='Metric partition maintenance',
+            next_run_time=datetime.now(timezone.utc),
+            replace_existing=True
+        )
+
     if not scheduler.running:
         scheduler.start()
         logger.info("Scheduler started with quarter-hour cron (00,15,30,45)")
@@ -1014,6 +2125,61 @@ def _setup_scheduler():
         logger.info("Scheduler already running")
 
 
+@app.route('/api/videos/<int:video_id>/archive-sweeps', methods=['GET'])
+def get_archive_sweeps(video_id):
+    """List full-archive sweeps of a video (newest first) with their checkpoint progress."""
+    Video.query.get_or_404(video_id)
+    sweeps = ArchiveSweep.query.filter_by(video_id=video_id).order_by(ArchiveSweep.id.desc()).limit(20).all()
+    return jsonify([sw.to_dict() for sw in sweeps])
+
+
+@app.route('/api/sync-runs', methods=['GET'])
+def get_sync_runs():
+    """List recorded sync run summaries, newest first.
+
+    Query params:
+      - video_id (optional): internal video id
+      - kind (optional): video|all
+      - status (optional): ok|error
+      - limit (default 50, max 500)
+    """
+    video_id = request.args.get('video_id', type=int)
+    kind = request.args.get('kind')
+    status = request.args.get('status')
+    limit = min(500, max(1, request.args.get('limit', default=50, type=int) or 50))
+
+    query = SyncRun.query
+    if video_id:
+        query = query.filter_by(video_id=video_id)
+    if kind:
+        query = query.filter_by(kind=kind)
+    if status:
+        query = query.filter_by(status=status)
+    runs = query.order_by(SyncRun.started_at.desc(), SyncRun.id.desc()).limit(limit).all()
+    return jsonify([r.to_dict() for r in runs])
+
+
+@app.route('/api/sync-nodes', methods=['GET'])
+def get_sync_nodes():
+    """List coordinated sync nodes and the work items of the most recent tick."""
+    nodes = SyncNode.query.order_by(SyncNode.node_id).all()
+    latest_tick = db.session.query(db.func.max(SyncWorkItem.tick)).scalar()
+    items = SyncWorkItem.query.filter_by(tick=latest_tick).order_by(SyncWorkItem.id).all() if latest_tick else []
+    return jsonify({
+        'coordination': app.config.get('SYNC_COORDINATION'),
+        'node_id': coordinator.node_id if coordinator is not None else None,
+        'nodes': [n.to_dict() for n in nodes],
+        'latest_tick': latest_tick,
+        'work_items': [i.to_dict() for i in items]
+    })
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Expose sync and request metrics in Prometheus text format."""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
 @app.route('/ping', methods=['GET'])
 def ping():
     return 'pong', 200
@@ -1038,7 +2204,9 @@ if __name__ == '__main__':
         debug_mode = env_debug.lower() in ('1','true','yes','on')
 
     # Start scheduler only in reloader child or when not in debug mode
-    if (not debug_mode) or (os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+    if not app.config.get('RUN_SCHEDULER', True):
+        logger.info("RUN_SCHEDULER is off; scheduled syncs run in worker.py")
+    elif (not debug_mode) or (os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
         _setup_scheduler()
     else:
         logger.info("Skipping scheduler start in reloader parent process")
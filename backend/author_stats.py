@@ -0,0 +1,270 @@
+"""
+Per-author comment aggregates.
+
+``author_stats`` holds, per ``author_channel_id`` and video, the number of
+archived comments, how many are currently deleted, how often comments were
+reinstated, their total likes, the sentiment mix and the first/last
+``published_at``. Rows with ``video_id`` 0 hold each author's totals across the
+whole archive. A flush hook (comment_deltas.py) turns every comment insert,
+edit, deletion and reinstatement into per-row deltas and applies them with one
+upsert, in the same transaction, so "top commenters of this video" or
+"accounts with the most deleted comments" read an index on ``author_stats``
+instead of grouping the comments table. Changes of the totals rows, which
+every sync touches, go to ``author_stat_deltas`` and are folded in right
+after the commit (``fold``).
+
+Deleted comments keep counting towards ``comment_count``, likes and sentiment
+(moderation analysis wants to see what was removed); ``first_seen`` and
+``last_seen`` only ever widen.
+
+Usage:
+    python author_stats.py rebuild [--video ID]   # recompute from the comments table
+"""
+
+import argparse
+import logging
+import sys
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from sqlalchemy import case, delete, func, literal, select
+
+from comment_deltas import DeltaHook, defer, dialect_insert, dialect_name
+from models import db, AuthorStat, AuthorStatDelta, Comment, CommentHistory
+
+logger = logging.getLogger(__name__)
+
+TOTALS = 0  # video_id of the archive-wide rows
+CATEGORIES = ('positive', 'neutral', 'negative', 'unscored')
+_COUNTERS = ('comment_count', 'deleted_count', 'reinstated_count', 'like_count') + CATEGORIES
+SORTS = {
+    'comments': AuthorStat.comment_count,
+    'deleted': AuthorStat.deleted_count,
+    'reinstated': AuthorStat.reinstated_count,
+    'likes': AuthorStat.like_count,
+    'negative': AuthorStat.negative,
+    'first_seen': AuthorStat.first_seen,
+    'last_seen': AuthorStat.last_seen,
+}
+
+
+class _Delta:
+    __slots__ = ('counters', 'first_seen', 'last_seen', 'author')
+
+    def __init__(self):
+        self.counters = [0] * len(_COUNTERS)
+        self.first_seen = self.last_seen = self.author = None
+
+    def seen(self, published_at, author):
+        if published_at is not None:
+            self.first_seen = min(self.first_seen or published_at, published_at)
+            self.last_seen = max(self.last_seen or published_at, published_at)
+        if author:
+            self.author = author
+
+
+def _counted_state(channel_id, video_pk, status, like_count, sentiment, published_at, author):
+    """What a comment contributes to author_stats, or None if it has no author."""
+    if not channel_id or video_pk is None:
+        return None
+    category = sentiment if sentiment in CATEGORIES else 'unscored'
+    if published_at is not None and published_at.tzinfo is not None:
+        # Fresh API values are aware, loaded rows naive UTC
+        published_at = published_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return channel_id, video_pk, status == 'deleted', like_count or 0, category, published_at, author
+
+
+def _add(deltas, state, sign, reinstated=0):
+    if state is None:
+        return
+    channel_id, video_pk, deleted, likes, category, published_at, author = state
+    for key in ((channel_id, video_pk), (channel_id, TOTALS)):
+        entry = deltas[key]
+        entry.counters[0] += sign
+        entry.counters[1] += sign * deleted
+        entry.counters[2] += reinstated
+        entry.counters[3] += sign * likes
+        entry.counters[4 + CATEGORIES.index(category)] += sign
+        if sign > 0:
+            entry.seen(published_at, author)
+
+
+def _state(get):
+    return _counted_state(get('author_channel_id'), get('video_id'), get('status'), get('like_count'),
+                          get('sentiment'), get('published_at'), get('author'))
+
+
+def _collect(deltas, before, after):
+    reinstated = int(bool(before and after and before[2] and not after[2]))
+    _add(deltas, before, -1)
+    _add(deltas, after, 1, reinstated)
+
+
+def _upsert_statement(session):
+    if dialect_name(session) == 'postgresql':
+        least, greatest = func.least, func.greatest
+    else:
+        # SQLite's multi-argument min()/max() are scalar functions
+        least, greatest = func.min, func.max
+    table = AuthorStat.__table__
+    stmt = dialect_insert(session)(table)
+    first, last = table.c.first_seen, table.c.last_seen
+    set_ = {name: table.c[name] + stmt.excluded[name] for name in _COUNTERS}
+    set_.update(
+        author=func.coalesce(stmt.excluded.author, table.c.author),
+        first_seen=least(func.coalesce(first, stmt.excluded.first_seen),
+                         func.coalesce(stmt.excluded.first_seen, first)),
+        last_seen=greatest(func.coalesce(last, stmt.excluded.last_seen),
+                           func.coalesce(stmt.excluded.last_seen, last)),
+    )
+    return stmt.on_conflict_do_update(index_elements=[table.c.author_channel_id, table.c.video_id], set_=set_)
+
+
+def _apply(session, deltas):
+    # Primary key order, so concurrent upserts lock rows in the same order
+    rows = [dict(author_channel_id=channel_id, video_id=video_pk, author=d.author,
+                 first_seen=d.first_seen, last_seen=d.last_seen, **dict(zip(_COUNTERS, d.counters)))
+            for (channel_id, video_pk), d in sorted(deltas.items()) if any(d.counters) or d.author]
+    per_video = [row for row in rows if row['video_id'] != TOTALS]
+    if per_video:
+        session.execute(_upsert_statement(session), per_video)
+    totals = [{k: v for k, v in row.items() if k != 'video_id'} for row in rows if row['video_id'] == TOTALS]
+    if totals:
+        session.execute(AuthorStatDelta.__table__.insert(), totals)
+        defer(session, fold)
+
+
+def fold(conn):
+    """Move the committed rows of author_stat_deltas into the totals rows (caller's transaction).
+
+    The DELETE ... RETURNING claims the rows, so concurrent folds never apply one twice.
+    Returns the number of authors updated.
+    """
+    pending = AuthorStatDelta.__table__
+    merged = defaultdict(_Delta)
+    claimed = conn.execute(delete(pending).returning(
+        pending.c.id, pending.c.author_channel_id, pending.c.author, pending.c.first_seen, pending.c.last_seen,
+        *[pending.c[name] for name in _COUNTERS])).all()
+    for row in sorted(claimed):
+        entry = merged[row.author_channel_id]
+        entry.counters = [a + b for a, b in zip(entry.counters, row[5:])]
+        entry.seen(row.first_seen, row.author)
+        entry.seen(row.last_seen, None)
+    rows = [dict(author_channel_id=channel_id, video_id=TOTALS, author=d.author,
+                 first_seen=d.first_seen, last_seen=d.last_seen, **dict(zip(_COUNTERS, d.counters)))
+            for channel_id, d in sorted(merged.items())]
+    if rows:
+        conn.execute(_upsert_statement(conn), rows)
+    return len(rows)
+
+
+_hook = DeltaHook('author_stat_deltas', _state, _collect, _apply, lambda: defaultdict(_Delta))
+
+
+def install(session_class):
+    """Keep author_stats in sync with every flush of ``session_class``. Idempotent."""
+    _hook.install(session_class)
+
+
+def _is(column, value):
+    return func.sum(case((column == value, 1), else_=0))
+
+
+def rebuild(conn, video_pk=None):
+    """Recompute author_stats from the comments table on ``conn`` (inside the caller's transaction).
+
+    With ``video_pk`` only that video's rows are recomputed; the totals rows are always
+    re-derived from the per-video rows. Returns the number of per-video rows written.
+    """
+    table = AuthorStat.__table__
+    per_video = (select(Comment.author_channel_id, Comment.video_id, func.max(Comment.author),
+                        func.count(), _is(Comment.status, 'deleted'),
+                        func.coalesce(func.sum(Comment.like_count), 0),
+                        _is(Comment.sentiment, 'positive'), _is(Comment.sentiment, 'neutral'),
+                        _is(Comment.sentiment, 'negative'),
+                        func.min(Comment.published_at), func.max(Comment.published_at))
+                 .where(Comment.author_channel_id.isnot(None), Comment.author_channel_id != '')
+                 .group_by(Comment.author_channel_id, Comment.video_id))
+    reinstated = (select(Comment.author_channel_id, Comment.video_id, func.count())
+                  .join(CommentHistory, CommentHistory.comment_id == Comment.id)
+                  .where(CommentHistory.action == 'reinstated', Comment.author_channel_id.isnot(None))
+                  .group_by(Comment.author_channel_id, Comment.video_id))
+    clear = delete(table).where(table.c.video_id != TOTALS)
+    if video_pk is not None:
+        per_video = per_video.where(Comment.video_id == video_pk)
+        reinstated = reinstated.where(Comment.video_id == video_pk)
+        clear = delete(table).where(table.c.video_id == video_pk)
+    conn.execute(clear)
+    conn.execute(delete(table).where(table.c.video_id == TOTALS))
+    # Deltas not folded yet are already part of the per-video rows
+    conn.execute(delete(AuthorStatDelta.__table__))
+
+    reinstated_counts = {(a, v): n for a, v, n in conn.execute(reinstated)}
+    rows = []
+    count = 0
+    for (channel_id, video, author, total, deleted, likes, positive, neutral, negative,
+         first_seen, last_seen) in conn.execute(per_video.execution_options(yield_per=5000)):
+        rows.append(dict(author_channel_id=channel_id, video_id=video, author=author, comment_count=total,
+                         deleted_count=deleted, reinstated_count=reinstated_counts.get((channel_id, video), 0),
+                         like_count=likes, positive=positive, neutral=neutral, negative=negative,
+                         unscored=total - positive - neutral - negative,
+                         first_seen=first_seen, last_seen=last_seen))
+        if len(rows) >= 1000:
+            conn.execute(table.insert(), rows)
+            count += len(rows)
+            rows = []
+    if rows:
+        conn.execute(table.insert(), rows)
+        count += len(rows)
+
+    c = table.c
+    totals = (select(c.author_channel_id, literal(TOTALS), func.max(c.author),
+                     *[func.sum(c[name]) for name in _COUNTERS], func.min(c.first_seen), func.max(c.last_seen))
+              .where(c.video_id != TOTALS).group_by(c.author_channel_id))
+    conn.execute(table.insert().from_select(
+        ['author_channel_id', 'video_id', 'author', *_COUNTERS, 'first_seen', 'last_seen'], totals))
+    return count
+
+
+def top_authors(video_pk=TOTALS, sort='comments', descending=True, page=1, page_size=50, min_comments=1):
+    """One page of authors of a video (or the archive with ``video_pk`` 0). Returns (rows, total)."""
+    column = SORTS[sort]
+    query = AuthorStat.query.filter(AuthorStat.video_id == video_pk)
+    if min_comments > 1:
+        # Comments are never hard-deleted, so every row counts at least one; skipping the
+        # filter by default keeps the sort index usable for the other orders
+        query = query.filter(AuthorStat.comment_count >= min_comments)
+    total = query.count()
+    order = (column.desc(), AuthorStat.author_channel_id.desc()) if descending else \
+        (column.asc(), AuthorStat.author_channel_id.asc())
+    rows = query.order_by(*order).offset((page - 1) * page_size).limit(page_size).all()
+    return rows, total
+
+
+def author_detail(channel_id):
+    """(totals row, per-video rows by comment count) of one author; totals is None if unknown."""
+    rows = AuthorStat.query.filter_by(author_channel_id=channel_id).all()
+    totals = next((r for r in rows if r.video_id == TOTALS), None)
+    videos = sorted((r for r in rows if r.video_id != TOTALS),
+                    key=lambda r: (-r.comment_count, r.video_id))
+    return totals, videos
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintain the author_stats aggregate table.')
+    parser.add_argument('command', choices=['rebuild'])
+    parser.add_argument('--video', type=int, help='internal video id (default: all videos)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from app import app
+
+    with app.app_context():
+        with db.engine.begin() as conn:
+            count = rebuild(conn, args.video)
+    print(f"Rebuilt {count} author rows at {datetime.now(timezone.utc).isoformat()}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
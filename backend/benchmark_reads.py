@@ -0,0 +1,121 @@
+"""
+Microbenchmark of the comment read path.
+
+Fills a temporary SQLite database from the fake YouTube API (see
+fake_youtube.py) and times one page of comments and one full reply list
+through:
+
+* ``orm`` - full ``Comment`` entities, ``to_dict()`` and ``jsonify`` (the
+  previous path),
+* ``projection`` - column projection and the fast encoder (projection.py),
+* ``projection:<fields>`` - the same with a narrow ``fields=`` list.
+
+Reports wall and CPU milliseconds per request (median over ``--requests``)
+and the payload size, and checks that the projection output equals the ORM
+output.
+
+Usage:
+    python benchmark_reads.py --comments 2000 --page-size 200
+    python benchmark_reads.py --fields id,text,published_at,like_count --requests 200
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+
+def _measure(func, requests):
+    walls, cpus, size = [], [], 0
+    for _ in range(requests):
+        wall, cpu = time.perf_counter(), time.process_time()
+        size = len(func())
+        walls.append((time.perf_counter() - wall) * 1000)
+        cpus.append((time.process_time() - cpu) * 1000)
+    return statistics.median(walls), statistics.median(cpus), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the ORM and projection comment read paths.')
+    parser.add_argument('--comments', type=int, default=1000, help='top-level threads of the video')
+    parser.add_argument('--replies', type=int, default=3, help='maximum replies per thread')
+    parser.add_argument('--page-size', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=50, help='timed requests per variant')
+    parser.add_argument('--fields', default='id,comment_id,author,text,like_count,published_at',
+                        help='narrow projection to time as well')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp.name, 'reads.db')}"
+    os.environ['SENTIMENT_ENABLED'] = 'false'
+    os.environ.setdefault('YOUTUBE_API_KEY', 'benchmark')
+    logging.basicConfig(level=logging.WARNING)
+
+    import app as tracker
+    import projection
+    from fake_youtube import FakeYouTubeArchive, FakeYouTubeTransport
+    from flask import jsonify
+    from models import db, Comment
+    from sqlalchemy import func
+    from youtube_service import YouTubeService
+
+    logging.getLogger().setLevel(logging.WARNING)
+    archive = FakeYouTubeArchive(1, args.comments, args.replies, seed=args.seed)
+    tracker.youtube_service = YouTubeService('benchmark', http=FakeYouTubeTransport(archive))
+    tracker.app.config['FULL_ARCHIVE_THRESHOLD'] = max(tracker.app.config['FULL_ARCHIVE_THRESHOLD'],
+                                                       args.comments * (args.replies + 1))
+    tracker.init_app()
+    client = tracker.app.test_client()
+    video_id = next(iter(archive.videos))
+    client.post('/api/videos', json={'video_id': video_id})
+    archive.advance(new_comments=0.02, edits=0.02, deletes=0.02)
+    tracker.sync_video(video_id)
+
+    narrow = projection.parse_fields(args.fields)
+    with tracker.app.app_context():
+        parent_id = (db.session.query(Comment.parent_id).filter(Comment.parent_id.isnot(None))
+                     .group_by(Comment.parent_id).order_by(func.count().desc()).limit(1).scalar())
+
+    def page_query():
+        return (Comment.query.filter_by(video_id=1).order_by(Comment.published_at.desc())
+                .limit(args.page_size))
+
+    def reply_query():
+        return Comment.query.filter_by(parent_id=parent_id).order_by(Comment.published_at.desc())
+
+    results = []
+    with tracker.app.test_request_context():
+        for name, make_query in (('page', page_query), ('replies', reply_query)):
+            def orm():
+                return jsonify(tracker._comments_to_dicts(make_query().all())).get_data()
+
+            def fast():
+                return projection.json_response(projection.comment_items(make_query())).get_data()
+
+            def fast_narrow():
+                return projection.json_response(projection.comment_items(make_query(), narrow)).get_data()
+
+            if json.loads(orm()) != json.loads(fast()):
+                print(f"{name}: projection output differs from the ORM output", file=sys.stderr)
+                return 1
+            rows = len(json.loads(fast()))
+            for variant, func_ in (('orm', orm), ('projection', fast), (f"projection:{len(narrow)} fields",
+                                                                          fast_narrow)):
+                db.session.remove()
+                results.append((name, rows, variant) + _measure(func_, args.requests))
+
+    encoder = 'orjson' if projection.orjson is not None else 'json'
+    print(f"{'query':<8} {'rows':>5} {'variant':<22} {'wall_ms':>9} {'cpu_ms':>9} {'bytes':>9}   (encoder: {encoder})")
+    for name, rows, variant, wall, cpu, size in results:
+        print(f"{name:<8} {rows:>5} {variant:<22} {wall:>9.2f} {cpu:>9.2f} {size:>9}")
+    tmp.cleanup()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
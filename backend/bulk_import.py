@@ -0,0 +1,200 @@
+"""
+Bulk import of channels, playlists and URL lists.
+
+An import job runs in the background in three phases, recorded on its
+``import_jobs`` row so ``GET /api/videos/import/<id>`` can report progress:
+
+1. resolving - a channel is resolved to its uploads playlist with one
+   ``channels.list`` call; playlists are paged with ``playlistItems.list``
+   (50 videos per call); URL lists are parsed locally.
+2. importing - videos that are not tracked yet are fetched with
+   ``videos.list`` 50 ids at a time and created (metadata, first metric
+   snapshot) in one commit per batch. Inactive videos are reactivated.
+3. syncing - the comment backfill of every new video runs through the
+   regular ``sync_video`` on a small thread pool.
+
+Onboarding 500 videos therefore costs about 10 playlist pages and 10
+``videos.list`` calls before the comment backfill, instead of 500 blocking
+HTTP requests. Videos created before a crash are synced by the next
+scheduled sync anyway.
+
+Usage:
+    python bulk_import.py channel @handle [--max-videos N] [--workers N]
+    python bulk_import.py playlist PLxxxx
+    python bulk_import.py urls https://youtu.be/aaa https://youtu.be/bbb
+"""
+
+import argparse
+import json
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+from sqlalchemy import update
+
+from models import db, utcnow, ImportJob, Video, VideoSyncEpoch
+import metric_history
+
+logger = logging.getLogger(__name__)
+
+SOURCE_TYPES = ('channel', 'playlist', 'urls')
+_BATCH = 50
+_MAX_FAILURES = 100
+
+
+def create_video(video_data, now, metric_storage='runs'):
+    """Insert a tracked video with its first sync epoch and metric snapshot (no commit)."""
+    video = Video(
+        video_id=video_data['video_id'],
+        title=video_data['title'],
+        channel_title=video_data['channel_title'],
+        description=video_data['description'],
+        published_at=video_data['published_at'],
+        thumbnail_url=video_data['thumbnail_url'],
+        last_synced=now,
+        sync_epoch=1
+    )
+    db.session.add(video)
+    db.session.flush()
+    db.session.add(VideoSyncEpoch(video_id=video.id, epoch=1, synced_at=now))
+    metric_history.record_snapshot(video.id, video_data, now.astimezone(timezone.utc).replace(tzinfo=None),
+                                   metric_storage)
+    return video
+
+
+def start_job(source_type, source, max_videos=None):
+    """Create a pending import job. ``source`` is a channel ref, playlist id/URL or list of URLs."""
+    if source_type not in SOURCE_TYPES:
+        raise ValueError(f"source_type must be one of {', '.join(SOURCE_TYPES)}")
+    job = ImportJob(source_type=source_type,
+                    source=json.dumps(source) if source_type == 'urls' else source,
+                    status='pending', max_videos=max_videos, total_videos=0, created_videos=0,
+                    existing_videos=0, missing_videos=0, synced_videos=0, failed_syncs=0,
+                    updated_at=utcnow())
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def resolve_video_ids(service, source_type, source, max_videos=None):
+    """Video ids of a channel, playlist or URL list, in source order without duplicates."""
+    if source_type == 'channel':
+        playlist_id = service.get_uploads_playlist_id(service.extract_channel_ref(source))
+        if not playlist_id:
+            raise ValueError(f"channel not found: {source}")
+        ids = service.iter_playlist_video_ids(playlist_id, limit=max_videos)
+    elif source_type == 'playlist':
+        ids = service.iter_playlist_video_ids(service.extract_playlist_id(source), limit=max_videos)
+    else:
+        ids = (service.extract_video_id(url) for url in source)
+    unique = list(dict.fromkeys(i for i in ids if i))
+    return unique[:max_videos] if max_videos else unique
+
+
+def _save(job, **fields):
+    for name, value in fields.items():
+        setattr(job, name, value)
+    job.updated_at = utcnow()
+    db.session.commit()
+
+
+def _import_batch(job, service, batch, metric_storage):
+    """Create the untracked videos of one batch of ids. Returns the ids of created videos."""
+    existing = {v.video_id: v for v in Video.query.filter(Video.video_id.in_(batch)).all()}
+    for video in existing.values():
+        video.is_active = True
+    new_ids = [vid for vid in batch if vid not in existing]
+    details = service.get_videos_details(new_ids) if new_ids else {}
+    now = datetime.now(timezone.utc)
+    created = []
+    for vid in new_ids:
+        if vid in details:
+            create_video(details[vid], now, metric_storage)
+            created.append(vid)
+    _save(job, existing_videos=job.existing_videos + len(existing), created_videos=job.created_videos + len(created),
+          missing_videos=job.missing_videos + len(new_ids) - len(created))
+    return created
+
+
+def run_job(job_id, service, sync_video, workers=4, metric_storage='runs'):
+    """Run an import job to completion. ``sync_video(youtube_id)`` backfills one video's comments
+    and returns an error message if that failed (or raises).
+
+    Returns the job's to_dict().
+    """
+    # Conditional UPDATE: an API thread and worker.py never both run the same job
+    claimed = db.session.execute(
+        update(ImportJob).where(ImportJob.id == job_id, ImportJob.status == 'pending')
+        .values(status='resolving', updated_at=utcnow())
+    ).rowcount
+    db.session.commit()
+    job = db.session.get(ImportJob, job_id)
+    if not claimed:
+        logger.info(f"Import job {job_id} was already started ({job.status})")
+        return job.to_dict()
+    source = json.loads(job.source) if job.source_type == 'urls' else job.source
+    try:
+        video_ids = resolve_video_ids(service, job.source_type, source, job.max_videos)
+        _save(job, status='importing', total_videos=len(video_ids))
+        created = []
+        for start in range(0, len(video_ids), _BATCH):
+            created += _import_batch(job, service, video_ids[start:start + _BATCH], metric_storage)
+        _save(job, status='syncing')
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Import job {job_id} failed: {e}")
+        job = db.session.get(ImportJob, job_id)
+        _save(job, status='failed', error=str(e), finished_at=utcnow())
+        return job.to_dict()
+    logger.info(f"Import job {job_id}: {len(created)} new videos, backfilling comments with {workers} workers")
+
+    failures = []
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix=f"import-{job_id}") as pool:
+        futures = {pool.submit(sync_video, vid): vid for vid in created}
+        for future in as_completed(futures):
+            try:
+                error = future.result()
+            except Exception as e:
+                error = str(e)
+            if error:
+                logger.error(f"Import job {job_id}: comment backfill of {futures[future]} failed: {error}")
+                job.failed_syncs += 1
+                if len(failures) < _MAX_FAILURES:
+                    failures.append({'video_id': futures[future], 'error': error})
+            else:
+                job.synced_videos += 1
+            _save(job, failures=json.dumps(failures) if failures else None)
+    _save(job, status='done', finished_at=utcnow())
+    logger.info(f"Import job {job_id} done: {job.created_videos} created, {job.existing_videos} existing, "
+                f"{job.missing_videos} missing, {job.failed_syncs} failed backfills")
+    return job.to_dict()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import all videos of a channel, playlist or URL list.')
+    parser.add_argument('source_type', choices=SOURCE_TYPES)
+    parser.add_argument('source', nargs='+', help='channel id/handle/URL, playlist id/URL, or video URLs')
+    parser.add_argument('--max-videos', type=int, help='import at most N videos (newest first for channels)')
+    parser.add_argument('--workers', type=int, help='parallel comment backfills (default IMPORT_SYNC_WORKERS)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.source_type != 'urls' and len(args.source) > 1:
+        parser.error(f"{args.source_type} takes a single source")
+
+    from app import app, import_sync_workers, sync_video, youtube_service
+
+    with app.app_context():
+        source = args.source if args.source_type == 'urls' else args.source[0]
+        job = start_job(args.source_type, source, args.max_videos)
+        result = run_job(job.id, youtube_service, sync_video, workers=args.workers or import_sync_workers(),
+                         metric_storage=app.config.get('METRIC_STORAGE', 'runs'))
+    print(f"Job {result['id']}: {result['status']}, {result['created_videos']} created, "
+          f"{result['existing_videos']} already tracked, {result['missing_videos']} unavailable, "
+          f"{result['synced_videos']} backfilled, {result['failed_syncs']} failed"
+          + (f" ({result['error']})" if result['error'] else ''))
+    return 0 if result['status'] == 'done' and not result['failed_syncs'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
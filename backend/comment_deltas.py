@@ -0,0 +1,158 @@
+"""
+Flush hooks that keep aggregate tables in step with the comments table.
+
+sentiment_trends.py, author_stats.py, term_stats.py and keyword_trends.py each
+register a ``DeltaHook``: before every flush, each inserted, edited, deleted
+or reinstated ``Comment`` is reduced to the state the aggregate counts (a
+tuple, or None if the comment does not count) before and after the change,
+and the module folds both into its deltas. After the flush the deltas are
+applied by the module, typically with one upsert per table, in the same
+transaction; a rollback discards them.
+
+Old states are read from the attribute history; columns that take part in a
+state need ``active_history=True`` on the model so the previous value is
+loaded before it is overwritten.
+
+Archive-wide rows (term_stats, the author totals) change with every sync.
+Upserting them inside a sync's transaction would hold their row locks until
+its final commit, so concurrent syncs would queue on, or deadlock over,
+them. Their deltas are appended to a deltas table instead, and ``defer``
+folds that table into the rows in a short transaction after the commit.
+"""
+
+import logging
+
+from sqlalchemy import and_, event, inspect, update
+from sqlalchemy.engine import Connection
+
+from models import db, Comment
+
+logger = logging.getLogger(__name__)
+
+
+_DEFERRED_KEY = 'deferred_folds'
+
+
+def dialect_name(bind):
+    """Database dialect of a session or connection."""
+    return (bind if isinstance(bind, Connection) else bind.connection()).dialect.name
+
+
+def dialect_insert(session):
+    """The INSERT construct with ``on_conflict_do_*`` for the database of a session or connection."""
+    if dialect_name(session) == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+def repair_negative(session, table, counters, returned):
+    """Reset ``counters`` that went below zero in upserted rows and log the drift.
+
+    ``returned`` are the rows of the upsert's RETURNING (primary key and counter
+    columns). Returns the number of repaired rows, which stays 0 unless deltas were
+    computed differently from the counts they correct.
+    """
+    keys = [c.name for c in table.primary_key.columns]
+    drifted = [row for row in returned if any(row[name] < 0 for name in counters)]
+    for row in drifted:
+        session.execute(update(table).where(and_(*[table.c[k] == row[k] for k in keys]))
+                        .values({name: max(row[name], 0) for name in counters}))
+    if drifted:
+        logger.warning(f"{len(drifted)} {table.name} rows went below zero and were reset; "
+                       f"recount them with the module's rebuild command")
+    return len(drifted)
+
+
+def defer(session, fold):
+    """Run ``fold(conn)`` in a short transaction of its own after the session's next commit.
+
+    A fold that fails leaves its deltas table as it was; the next one picks them up.
+    """
+    session.info.setdefault(_DEFERRED_KEY, {})[fold] = True
+
+
+def _run_deferred(session):
+    for fold in session.info.pop(_DEFERRED_KEY, None) or ():
+        try:
+            with db.engine.begin() as conn:
+                fold(conn)
+        except Exception as e:
+            logger.warning(f"{fold.__module__}.{fold.__name__} failed; retried after the next commit: {e}")
+
+
+def _drop_deferred(session, previous_transaction):
+    session.info.pop(_DEFERRED_KEY, None)
+
+
+def _previous_value(comment):
+    attrs = inspect(comment).attrs
+
+    def old(name):
+        history = attrs[name].history
+        if history.deleted:
+            return history.deleted[0]
+        if history.added:
+            # SQLAlchemy reports a previous None as "nothing deleted"; active_history on the
+            # model columns rules out an unloaded previous value
+            return None
+        return getattr(comment, name)
+
+    return old
+
+
+class DeltaHook:
+    """Session listeners that turn comment changes into deltas of one aggregate.
+
+    Args:
+        key: ``session.info`` key of the pending deltas
+        state: ``state(get)`` -> what a comment contributes, or None; ``get(name)`` returns
+            one attribute of the comment (current or previous value)
+        collect: ``collect(deltas, before, after)`` folds a change into the deltas; ``before``
+            is None for new comments, ``after`` for deleted ones
+        apply: ``apply(session, deltas)`` writes the deltas after the flush
+        factory: creates an empty deltas container
+    """
+
+    def __init__(self, key, state, collect, apply, factory):
+        self.key = key
+        self.state = state
+        self.collect = collect
+        self.apply = apply
+        self.factory = factory
+
+    def _before_flush(self, session, flush_context, instances):
+        deltas = session.info.get(self.key)
+        if deltas is None:
+            deltas = session.info[self.key] = self.factory()
+        for obj in session.new:
+            if isinstance(obj, Comment):
+                self.collect(deltas, None, self.state(lambda name: getattr(obj, name)))
+        for obj in session.dirty:
+            if isinstance(obj, Comment) and session.is_modified(obj):
+                before = self.state(_previous_value(obj))
+                after = self.state(lambda name: getattr(obj, name))
+                if before != after:
+                    self.collect(deltas, before, after)
+        for obj in session.deleted:
+            if isinstance(obj, Comment):
+                self.collect(deltas, self.state(_previous_value(obj)), None)
+
+    def _after_flush(self, session, flush_context):
+        deltas = session.info.pop(self.key, None)
+        if deltas:
+            self.apply(session, deltas)
+
+    def _after_soft_rollback(self, session, previous_transaction):
+        session.info.pop(self.key, None)
+
+    def install(self, session_class):
+        """Maintain the aggregate on every flush of ``session_class``. Idempotent."""
+        if not event.contains(session_class, 'before_flush', self._before_flush):
+            event.listen(session_class, 'before_flush', self._before_flush)
+            event.listen(session_class, 'after_flush', self._after_flush)
+            event.listen(session_class, 'after_soft_rollback', self._after_soft_rollback)
+        if not event.contains(session_class, 'after_commit', _run_deferred):
+            event.listen(session_class, 'after_commit', _run_deferred)
+            event.listen(session_class, 'after_soft_rollback', _drop_deferred)
@@ -0,0 +1,186 @@
+"""
+Compact edit history of comment texts.
+
+When a sync sees a comment's text change (compared by a hash of the
+normalized text, so whitespace-only differences from the API do not count),
+``record_edits`` appends a revision to ``comment_revisions`` and an 'edited'
+entry to ``comment_history``:
+
+* revision 0 is the text as first archived, stored in full (a keyframe),
+* every later revision is a delta against the previous one: the
+  ``difflib`` opcodes as a JSON list where ``[i, j]`` copies ``old[i:j]``
+  and a string is inserted text,
+* every ``KEYFRAME_INTERVAL``-th revision, and any revision whose delta
+  would not be smaller than the text itself, is stored in full.
+
+Storage therefore grows with what changed, and reconstructing a version
+replays at most ``KEYFRAME_INTERVAL`` deltas from the nearest keyframe.
+
+Usage:
+    python comment_revisions.py show COMMENT_ID [--revision N]
+"""
+
+import argparse
+import difflib
+import hashlib
+import json
+import logging
+import sys
+
+from sqlalchemy import and_, case, func, insert
+
+from models import db, Comment, CommentHistory, CommentRevision
+
+logger = logging.getLogger(__name__)
+
+KEYFRAME_INTERVAL = 10
+
+
+def normalize(text):
+    return '\n'.join(line.rstrip() for line in (text or '').replace('\r\n', '\n').split('\n')).strip()
+
+
+def text_hash(text):
+    return hashlib.blake2b(normalize(text).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def make_delta(old, new):
+    """JSON delta that turns ``old`` into ``new``."""
+    ops = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old, new, autojunk=False).get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif tag in ('replace', 'insert'):
+            ops.append(new[j1:j2])
+    return json.dumps(ops, ensure_ascii=False, separators=(',', ':'))
+
+
+def apply_delta(old, delta):
+    return ''.join(old[op[0]:op[1]] if isinstance(op, list) else op for op in json.loads(delta))
+
+
+def _latest_revisions(comment_pks):
+    """comment pk -> (latest revision, latest keyframe revision, its text) for comments with revisions."""
+    keyframes = (db.session.query(CommentRevision.comment_pk,
+                                  func.max(case((CommentRevision.kind == 'full', CommentRevision.revision)))
+                                  .label('keyframe'))
+                 .filter(CommentRevision.comment_pk.in_(comment_pks))
+                 .group_by(CommentRevision.comment_pk).subquery())
+    rows = (CommentRevision.query
+            .join(keyframes, and_(CommentRevision.comment_pk == keyframes.c.comment_pk,
+                                  CommentRevision.revision >= keyframes.c.keyframe))
+            .order_by(CommentRevision.comment_pk, CommentRevision.revision).all())
+    chains = {}
+    for row in rows:
+        chains.setdefault(row.comment_pk, []).append(row)
+    latest = {}
+    for pk, chain in chains.items():
+        row, text = list(_replay(chain))[-1]
+        latest[pk] = (row.revision, chain[0].revision, text)
+    return latest
+
+
+def record_edits(edits, now):
+    """Record text edits found by a sync (no commit).
+
+    ``edits`` is a list of (comment, old_text, old_updated_at) for comments whose text
+    was just overwritten. Returns the number of revisions recorded; edits whose
+    normalized text is unchanged are skipped.
+    """
+    edits = [e for e in edits if text_hash(e[1]) != text_hash(e[0].text)]
+    if not edits:
+        return 0
+    latest = _latest_revisions([comment.id for comment, _, _ in edits])
+    revisions, events = [], []
+    for comment, old_text, old_updated_at in edits:
+        old_text = old_text or ''
+        if comment.id not in latest:
+            # The first archived version, in full
+            revisions.append(dict(comment_pk=comment.id, revision=0, kind='full', payload=old_text,
+                                  text_hash=text_hash(old_text), length=len(old_text),
+                                  updated_at=old_updated_at or comment.published_at, recorded_at=now))
+            latest[comment.id] = (0, 0, old_text)
+        # Deltas replay on the archived previous revision, so it is their base rather than
+        # the stored text
+        previous, keyframe, base = latest[comment.id]
+        revision = previous + 1
+        new_text = comment.text or ''
+        delta = make_delta(base, new_text)
+        if revision - keyframe >= KEYFRAME_INTERVAL or len(delta) >= len(new_text):
+            kind, payload = 'full', new_text
+            keyframe = revision
+        else:
+            kind, payload = 'delta', delta
+        new_hash = text_hash(new_text)
+        revisions.append(dict(comment_pk=comment.id, revision=revision, kind=kind, payload=payload,
+                              text_hash=new_hash, length=len(new_text), updated_at=comment.updated_at,
+                              recorded_at=now))
+        events.append(dict(comment_id=comment.id, action='edited', created_at=now, meta=json.dumps({
+            'revision': revision, 'from_hash': text_hash(old_text), 'to_hash': new_hash,
+            'length_before': len(old_text), 'length_after': len(new_text), 'stored': kind})))
+        latest[comment.id] = (revision, keyframe, new_text)
+    # One executemany per table instead of a flushed INSERT per object
+    db.session.execute(insert(CommentRevision), revisions)
+    db.session.execute(insert(CommentHistory), events)
+    return len(edits)
+
+
+def _replay(rows):
+    """Yield (row, text) for consecutive revision rows starting at a keyframe."""
+    text = None
+    for row in rows:
+        text = row.payload if row.kind == 'full' else apply_delta(text, row.payload)
+        yield row, text
+
+
+def versions(comment_pk):
+    """Every archived version of a comment, oldest first, as dicts with the reconstructed text."""
+    rows = CommentRevision.query.filter_by(comment_pk=comment_pk).order_by(CommentRevision.revision).all()
+    return [dict(row.to_dict(), text=text) for row, text in _replay(rows)]
+
+
+def version(comment_pk, revision):
+    """One version of a comment, replaying deltas from the nearest keyframe; None if unknown."""
+    keyframe = (db.session.query(func.max(CommentRevision.revision))
+                .filter(CommentRevision.comment_pk == comment_pk, CommentRevision.kind == 'full',
+                        CommentRevision.revision <= revision).scalar())
+    if keyframe is None:
+        return None
+    rows = (CommentRevision.query
+            .filter(CommentRevision.comment_pk == comment_pk,
+                    CommentRevision.revision.between(keyframe, revision))
+            .order_by(CommentRevision.revision).all())
+    if not rows or rows[-1].revision != revision:
+        return None
+    row, text = list(_replay(rows))[-1]
+    return dict(row.to_dict(), text=text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Show the archived versions of a comment.')
+    parser.add_argument('command', choices=['show'])
+    parser.add_argument('comment_id', help='YouTube comment id')
+    parser.add_argument('--revision', type=int, help='only this revision')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from app import app
+
+    with app.app_context():
+        comment = Comment.query.filter_by(comment_id=args.comment_id).first()
+        if comment is None:
+            print('Comment not found.')
+            return 1
+        found = [version(comment.id, args.revision)] if args.revision is not None else versions(comment.id)
+        found = [v for v in found if v]
+        if not found:
+            print('No archived edits.')
+            return 0
+        for v in found:
+            print(f"--- revision {v['revision']} ({v['kind']}, updated {v['updated_at']})")
+            print(v['text'])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -7,21 +7,101 @@ class Config:
     # Database
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///tubetracker.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # SQLite deployment profile: 'default' or 'concurrent' (WAL, tuned pragmas, separate read
+    # pool and a single serialized writer connection; see db_routing.py)
+    SQLITE_PROFILE = os.getenv('SQLITE_PROFILE', 'default').lower()
+    SQLITE_READ_POOL_SIZE = int(os.getenv('SQLITE_READ_POOL_SIZE', 8))
+    SQLITE_WRITE_TIMEOUT = float(os.getenv('SQLITE_WRITE_TIMEOUT', 30))  # seconds to wait for the writer
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', 65536))
+    SQLITE_MMAP_SIZE_MB = int(os.getenv('SQLITE_MMAP_SIZE_MB', 256))
+    # Read replicas (comma-separated URLs) for GET requests; a client that wrote reads from the
+    # primary for READ_AFTER_WRITE_SECONDS afterwards. Syncs and jobs always use the primary.
+    DATABASE_READ_URL = os.getenv('DATABASE_READ_URL', '')
+    READ_AFTER_WRITE_SECONDS = int(os.getenv('READ_AFTER_WRITE_SECONDS', 5))
+    # Commit comment syncs every N comments (whole pages) with sentiment inference outside the write
+    # transaction; 0 = one transaction per video. Defaults to 500 with the concurrent SQLite profile.
+    SYNC_COMMIT_CHUNK = int(os.getenv('SYNC_COMMIT_CHUNK', 500 if SQLITE_PROFILE == 'concurrent' else 0))
     
     # YouTube API
     YOUTUBE_API_KEY = os.getenv('YOUTUBE_API_KEY', '')
+    # Optional alternative API host, e.g. a local fake_youtube.py server for offline testing
+    YOUTUBE_API_ENDPOINT = os.getenv('YOUTUBE_API_ENDPOINT', '')
     
     # Scheduler
     # Scheduler: either provide a cron string via SYNC_CRON (e.g. "0,15,30,45" for quarter hours)
     # or provide an integer number of hours via SYNC_INTERVAL_HOURS (default 24).
     SYNC_CRON = os.getenv('SYNC_CRON', '')
     SYNC_INTERVAL_HOURS = int(os.getenv('SYNC_INTERVAL_HOURS', 24))
+    # Process roles: RUN_SCHEDULER starts the scheduled jobs in this process (python app.py and
+    # create_app(); wsgi.py never does, worker.py always does). BACKGROUND_JOBS=worker makes the
+    # API only queue sentiment backfills and imports for worker.py instead of starting threads.
+    RUN_SCHEDULER = os.getenv('RUN_SCHEDULER', 'true').lower() in ('1', 'true', 'yes', 'on')
+    BACKGROUND_JOBS = os.getenv('BACKGROUND_JOBS', 'thread').lower()
+    WORKER_POLL_SECONDS = float(os.getenv('WORKER_POLL_SECONDS', 5))
+    # worker.py serves its sync metrics on GET :WORKER_METRICS_PORT/metrics; 0 = off
+    WORKER_METRICS_PORT = int(os.getenv('WORKER_METRICS_PORT', 9105))
+    # Videos with more comments than this are archived with resumable full sweeps
+    # (all threads, page by page) instead of a single 1000-comment window
+    FULL_ARCHIVE_THRESHOLD = int(os.getenv('FULL_ARCHIVE_THRESHOLD', 1000))
+    # Pages (100 threads each) a sweep processes per sync run before pausing; 0 = no limit
+    FULL_ARCHIVE_MAX_PAGES = int(os.getenv('FULL_ARCHIVE_MAX_PAGES', 200))
+    # Multi-replica coordination: 'none' (every process syncs everything) or 'lease'
+    # (one node plans each tick, videos are sharded across live nodes; see coordination.py)
+    SYNC_COORDINATION = os.getenv('SYNC_COORDINATION', 'none').lower()
+    SYNC_NODE_ID = os.getenv('SYNC_NODE_ID', '')
+    SYNC_LEASE_SECONDS = int(os.getenv('SYNC_LEASE_SECONDS', 300))
+    SYNC_HEARTBEAT_SECONDS = int(os.getenv('SYNC_HEARTBEAT_SECONDS', 30))
+    SYNC_TICK_WAIT_SECONDS = int(os.getenv('SYNC_TICK_WAIT_SECONDS', 30))
+    # 'runs': store a metric row only when values change and extend the previous row's valid_until
+    # otherwise; 'points': one row per sync (see metric_history.py)
+    METRIC_STORAGE = os.getenv('METRIC_STORAGE', 'runs').lower()
+    # Optional Postgres partitioning (see partitioning.py): monthly video_metrics partitions are
+    # created this many months ahead; METRICS_RETENTION_MONTHS > 0 drops older partitions whole
+    METRIC_PARTITION_MONTHS_AHEAD = int(os.getenv('METRIC_PARTITION_MONTHS_AHEAD', 3))
+    METRICS_RETENTION_MONTHS = int(os.getenv('METRICS_RETENTION_MONTHS', 0))
+    COMMENT_HASH_PARTITIONS = int(os.getenv('COMMENT_HASH_PARTITIONS', 16))
     # Sentiment analysis can be toggled via env and a minimum confidence threshold can be set.
     SENTIMENT_ENABLED = os.getenv('SENTIMENT_ENABLED', 'true').lower() in ('1', 'true', 'yes', 'on')
     try:
         SENTIMENT_MIN_CONFIDENCE = float(os.getenv('SENTIMENT_MIN_CONFIDENCE', '0.6'))
     except Exception:
         SENTIMENT_MIN_CONFIDENCE = 0.6
+    # Backfill of missing/stale sentiment (see sentiment_backfill.py): comments per chunk and an
+    # optional cap in comments/second (0 = unthrottled) so it leaves CPU for syncs
+    SENTIMENT_BACKFILL_CHUNK = int(os.getenv('SENTIMENT_BACKFILL_CHUNK', 256))
+    SENTIMENT_BACKFILL_MAX_RATE = float(os.getenv('SENTIMENT_BACKFILL_MAX_RATE', 0))
+    # POST /api/sentiment/analyze coalesces concurrent requests: a batch runs once it holds
+    # SENTIMENT_BATCH_SIZE texts or its first text waited SENTIMENT_BATCH_MAX_WAIT_MS
+    SENTIMENT_BATCH_SIZE = int(os.getenv('SENTIMENT_BATCH_SIZE', 32))
+    SENTIMENT_BATCH_MAX_WAIT_MS = float(os.getenv('SENTIMENT_BATCH_MAX_WAIT_MS', 10))
     
+    # MinHash/LSH index of comment texts for the near-duplicate endpoints (see near_duplicates.py);
+    # costs a few hashes per new or edited comment at sync time
+    NEAR_DUPLICATES_ENABLED = os.getenv('NEAR_DUPLICATES_ENABLED', 'true').lower() in ('1', 'true', 'yes', 'on')
+
+    # Keywords (see keywords.py): extra stopwords for every process (comma-separated), how often a
+    # process checks the shared stopword version, and the per-process cache of keyword term counts
+    KEYWORD_STOPWORDS = os.getenv('KEYWORD_STOPWORDS', '')
+    STOPWORDS_CHECK_SECONDS = float(os.getenv('STOPWORDS_CHECK_SECONDS', 2))
+    KEYWORD_CACHE_SECONDS = float(os.getenv('KEYWORD_CACHE_SECONDS', 60))
+    KEYWORD_CACHE_SIZE = int(os.getenv('KEYWORD_CACHE_SIZE', 32))
+    # Corpus term statistics for scoring=tfidf|pmi|hybrid (see term_stats.py); maintained at sync time.
+    # Scoring ranks the most frequent KEYWORD_SCORING_CANDIDATES terms of the video or archive
+    TERM_STATS_ENABLED = os.getenv('TERM_STATS_ENABLED', 'true').lower() in ('1', 'true', 'yes', 'on')
+    KEYWORD_SCORING_CANDIDATES = int(os.getenv('KEYWORD_SCORING_CANDIDATES', 2000))
+    # Per-day keyword trends (see keyword_trends.py): the top KEYWORD_TREND_TOP_K terms of every day a
+    # sync changed are re-ranked after the sync
+    KEYWORD_TRENDS_ENABLED = os.getenv('KEYWORD_TRENDS_ENABLED', 'true').lower() in ('1', 'true', 'yes', 'on')
+    KEYWORD_TREND_TOP_K = int(os.getenv('KEYWORD_TREND_TOP_K', 20))
+
+    # Rows per batch (and Parquet row group) for /api/export and export.py
+    EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 5000))
+
+    # Parallel comment backfills of a bulk import (see bulk_import.py); plain SQLite without
+    # SQLITE_PROFILE=concurrent always uses 1. IMPORT_MAX_VIDEOS caps one import (0 = no cap)
+    IMPORT_SYNC_WORKERS = int(os.getenv('IMPORT_SYNC_WORKERS', 4))
+    IMPORT_MAX_VIDEOS = int(os.getenv('IMPORT_MAX_VIDEOS', 5000))
+
     # Secret Key
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
@@ -0,0 +1,283 @@
+"""
+Multi-replica sync coordination backed by the database.
+
+Every process that runs the scheduler calls ``SyncCoordinator.run_tick`` on
+each scheduled tick:
+
+1. The node heartbeats into ``sync_nodes``.
+2. All nodes race to insert the ``sync_leases`` row ``tick:<fire time>``,
+   keyed by the trigger's scheduled fire time (not the wall clock when the
+   job happens to run, see ``scheduled_fire_time``); the single winner plans
+   the tick by inserting one ``sync_work_items`` row per active video in the
+   same transaction. Interval triggers must be aligned to fixed boundaries
+   (app.py does so in lease mode) so that every node shares the fire times.
+3. Every live node then claims work items with a conditional UPDATE (only
+   one node can flip an item from pending/expired to claimed). Items are
+   sharded by rendezvous hashing over the live nodes; once a node's own
+   shard is empty it takes over leftover items, so dead or slow nodes never
+   strand work. Claimed items carry a lease that a heartbeat thread extends
+   while the sync runs; an expired lease makes the item claimable again.
+
+All coordination is plain SQL on portable tables, so the same code works on
+Postgres and SQLite.
+"""
+
+import hashlib
+import logging
+import os
+import socket
+import threading
+import time
+from collections import Counter
+from datetime import timedelta, timezone
+
+from sqlalchemy import or_, and_, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, utcnow, SyncNode, SyncLease, SyncWorkItem
+
+logger = logging.getLogger(__name__)
+
+# Finished work items and tick leases are kept this long for inspection
+_RETENTION = timedelta(days=7)
+
+
+def default_node_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def scheduled_fire_time(trigger, now, lookback=timedelta(hours=1)):
+    """The latest fire time of an APScheduler ``trigger`` at or before ``now`` (aware), or None.
+
+    Fire times older than ``lookback`` are not considered; the scheduler drops
+    runs that miss their fire time by more than the misfire grace time anyway.
+    """
+    latest = None
+    fire = trigger.get_next_fire_time(None, now - lookback)
+    while fire is not None and fire <= now:
+        latest = fire
+        fire = trigger.get_next_fire_time(fire, fire + timedelta(microseconds=1))
+    return latest
+
+
+def _rendezvous_weight(node_id, video_id):
+    return hashlib.sha1(f"{node_id}:{video_id}".encode('utf-8')).digest()
+
+
+def shard_owner(video_id, live_node_ids):
+    """Return the node that owns ``video_id`` under rendezvous hashing."""
+    if not live_node_ids:
+        return None
+    return max(live_node_ids, key=lambda node_id: _rendezvous_weight(node_id, video_id))
+
+
+class SyncCoordinator:
+    """Coordinates scheduled syncs across processes via lease and work-item tables.
+
+    Args:
+        app: Flask app, used to open an app context for the heartbeat thread
+        node_id: unique id of this process (default: hostname-pid)
+        lease_seconds: how long a claimed work item stays reserved without a heartbeat
+        heartbeat_seconds: heartbeat / lease renewal period
+        tick_wait_seconds: how long non-leader nodes wait for the leader to plan a tick
+    """
+
+    def __init__(self, app, node_id=None, lease_seconds=300, heartbeat_seconds=30, tick_wait_seconds=30):
+        self.app = app
+        self.node_id = node_id or default_node_id()
+        self.lease = timedelta(seconds=lease_seconds)
+        self.heartbeat_interval = heartbeat_seconds
+        self.node_ttl = timedelta(seconds=heartbeat_seconds * 3)
+        self.tick_wait_seconds = tick_wait_seconds
+        self._current_item = None
+        self._lock = threading.Lock()
+
+    # -- membership -------------------------------------------------------
+    def heartbeat(self):
+        """Record that this node is alive and extend the lease of the item in progress."""
+        now = utcnow()
+        node = db.session.get(SyncNode, self.node_id)
+        if node is None:
+            db.session.add(SyncNode(node_id=self.node_id, started_at=now, last_heartbeat=now))
+        else:
+            node.last_heartbeat = now
+        with self._lock:
+            item_id = self._current_item
+        if item_id is not None:
+            db.session.execute(
+                update(SyncWorkItem)
+                .where(SyncWorkItem.id == item_id, SyncWorkItem.claimed_by == self.node_id,
+                       SyncWorkItem.status == 'claimed')
+                .values(lease_expires_at=now + self.lease)
+            )
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another thread of this process inserted the node row concurrently
+            db.session.rollback()
+
+    def live_nodes(self):
+        cutoff = utcnow() - self.node_ttl
+        rows = db.session.query(SyncNode.node_id).filter(SyncNode.last_heartbeat >= cutoff).all()
+        live = {r[0] for r in rows}
+        live.add(self.node_id)
+        return sorted(live)
+
+    # -- leases -----------------------------------------------------------
+    def acquire_lease(self, name, ttl_seconds):
+        """Take or renew the named lease. Returns True if this node now holds it."""
+        now = utcnow()
+        expires = now + timedelta(seconds=ttl_seconds)
+        result = db.session.execute(
+            update(SyncLease)
+            .where(SyncLease.name == name, or_(SyncLease.expires_at < now, SyncLease.holder == self.node_id))
+            .values(holder=self.node_id, acquired_at=now, expires_at=expires)
+        )
+        if result.rowcount:
+            db.session.commit()
+            return True
+        try:
+            db.session.add(SyncLease(name=name, holder=self.node_id, acquired_at=now, expires_at=expires))
+            db.session.commit()
+            return True
+        except IntegrityError:
+            db.session.rollback()
+            return False
+
+    # -- ticks ------------------------------------------------------------
+    @staticmethod
+    def tick_key(when=None):
+        """Ticks are identified by their scheduled minute (UTC), identical on every node.
+
+        ``when`` should be the scheduled fire time; the current minute is only a fallback.
+        """
+        if when is None:
+            when = utcnow()
+        elif when.tzinfo is not None:
+            when = when.astimezone(timezone.utc).replace(tzinfo=None)
+        return f"tick:{when.strftime('%Y-%m-%dT%H:%M')}"
+
+    def _plan_tick(self, tick, video_ids):
+        """Insert the tick lease and its work items atomically. Returns False if another node won."""
+        now = utcnow()
+        try:
+            db.session.add(SyncLease(name=tick, holder=self.node_id, acquired_at=now, expires_at=now + _RETENTION))
+            db.session.flush()
+            for vid in video_ids:
+                db.session.add(SyncWorkItem(tick=tick, video_id=vid, status='pending', created_at=now))
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return False
+        # Housekeeping for old ticks; done by the leader only
+        cutoff = now - _RETENTION
+        SyncWorkItem.query.filter(SyncWorkItem.created_at < cutoff).delete(synchronize_session=False)
+        SyncLease.query.filter(SyncLease.name.like('tick:%'), SyncLease.expires_at < now).delete(
+            synchronize_session=False)
+        db.session.commit()
+        return True
+
+    def _wait_for_plan(self, tick):
+        deadline = time.monotonic() + self.tick_wait_seconds
+        while time.monotonic() < deadline:
+            if db.session.get(SyncLease, tick) is not None:
+                return True
+            db.session.rollback()  # end the read transaction so the next poll sees new commits
+            time.sleep(0.5)
+        return False
+
+    def _claimable(self, now):
+        return or_(SyncWorkItem.status == 'pending',
+                   and_(SyncWorkItem.status == 'claimed', SyncWorkItem.lease_expires_at < now))
+
+    def claim_next(self, tick):
+        """Claim one work item of ``tick``, preferring this node's shard. Returns it or None."""
+        now = utcnow()
+        candidates = (
+            db.session.query(SyncWorkItem.id, SyncWorkItem.video_id)
+            .filter(SyncWorkItem.tick == tick, self._claimable(now))
+            .order_by(SyncWorkItem.id)
+            .all()
+        )
+        if not candidates:
+            return None
+        live = self.live_nodes()
+        candidates.sort(key=lambda c: shard_owner(c[1], live) != self.node_id)
+        for item_id, _ in candidates:
+            result = db.session.execute(
+                update(SyncWorkItem)
+                .where(SyncWorkItem.id == item_id, self._claimable(now))
+                .values(status='claimed', claimed_by=self.node_id, lease_expires_at=now + self.lease,
+                        attempts=SyncWorkItem.attempts + 1)
+            )
+            db.session.commit()
+            if result.rowcount:
+                return db.session.get(SyncWorkItem, item_id)
+        return None
+
+    def _finish(self, item_id, status):
+        db.session.execute(
+            update(SyncWorkItem)
+            .where(SyncWorkItem.id == item_id, SyncWorkItem.claimed_by == self.node_id)
+            .values(status=status, finished_at=utcnow(), lease_expires_at=None)
+        )
+        db.session.commit()
+
+    def run_tick(self, plan, work, tick=None):
+        """Run one scheduled tick on this node.
+
+        Args:
+            plan: callable returning the internal ids of the videos to sync (leader only)
+            work: callable taking an internal video id; an exception or a returned error
+                message marks the item failed
+            tick: tick key (see tick_key); defaults to the current minute
+
+        Returns a Counter with 'leader', 'synced' and 'failed'.
+        """
+        tick = tick or self.tick_key()
+        stats = Counter()
+        self.heartbeat()
+        if self._plan_tick(tick, plan()):
+            stats['leader'] = 1
+            logger.info(f"Node {self.node_id} planned {tick}")
+        elif not self._wait_for_plan(tick):
+            logger.warning(f"Node {self.node_id}: {tick} was not planned within {self.tick_wait_seconds}s")
+            return stats
+
+        stop = threading.Event()
+        beat = threading.Thread(target=self._heartbeat_loop, args=(stop,), daemon=True)
+        beat.start()
+        try:
+            while True:
+                item = self.claim_next(tick)
+                if item is None:
+                    break
+                with self._lock:
+                    self._current_item = item.id
+                try:
+                    error = work(item.video_id)
+                except Exception as e:
+                    db.session.rollback()
+                    error = str(e)
+                finally:
+                    with self._lock:
+                        self._current_item = None
+                if error:
+                    logger.error(f"Work item {item.id} (video {item.video_id}) failed on {self.node_id}: {error}")
+                    self._finish(item.id, 'failed')
+                    stats['failed'] += 1
+                else:
+                    self._finish(item.id, 'done')
+                    stats['synced'] += 1
+        finally:
+            stop.set()
+            beat.join(timeout=self.heartbeat_interval)
+        return stats
+
+    def _heartbeat_loop(self, stop):
+        while not stop.wait(self.heartbeat_interval):
+            try:
+                with self.app.app_context():
+                    self.heartbeat()
+            except Exception as e:
+                logger.warning(f"Heartbeat failed for {self.node_id}: {e}")
@@ -0,0 +1,204 @@
+"""
+Read/write routing for ``db.session`` and the SQLite concurrent profile.
+
+``RoutingSession`` sends plain SELECTs to the ``read`` bind when one is
+configured, and everything else (flushes, INSERT/UPDATE/DELETE, SELECT ...
+FOR UPDATE, raw SQL) to the default engine. Once a session transaction has
+written, all of its later statements stay on the default engine so it reads
+its own writes; the next transaction starts on the read bind again.
+
+With ``DATABASE_READ_URL`` (one or more comma-separated replica URLs, e.g.
+Postgres streaming replicas) the replicas become the ``read``, ``read_1``,
+... binds. Replicas lag behind the primary, so they only serve:
+
+* GET/HEAD requests - each session transaction picks one replica and keeps it,
+* unless the client wrote within the last ``READ_AFTER_WRITE_SECONDS``: every
+  other request sets a short-lived cookie, and requests carrying it read from
+  the primary, so a client always sees its own changes.
+
+Syncs, background jobs, CLI tools and write requests always use the primary.
+More read capacity is one more URL in ``DATABASE_READ_URL``; endpoints do not
+change.
+
+With ``SQLITE_PROFILE=concurrent`` a file-based SQLite database gets:
+
+* WAL journaling, so readers never block behind the writer,
+* tuned ``synchronous``, ``cache_size``, ``mmap_size`` and ``busy_timeout``
+  pragmas,
+* a separate read pool (``read`` bind, ``query_only`` connections),
+* a single writer connection (pool of one) whose transactions start with
+  ``BEGIN IMMEDIATE``, so all writers of the process queue for it instead of
+  failing with "database is locked" on lock upgrades.
+"""
+
+import logging
+import random
+import time
+
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql import Select, CompoundSelect, TextClause
+from sqlalchemy.sql.dml import UpdateBase
+
+logger = logging.getLogger(__name__)
+
+READ_BIND = 'read'
+STICKY_COOKIE = 'tt_read_primary'
+_REPLICA_METHODS = ('GET', 'HEAD')
+
+
+def _is_read_only(clause):
+    if clause is None or isinstance(clause, UpdateBase):
+        return False
+    if isinstance(clause, Select):
+        return clause._for_update_arg is None
+    if isinstance(clause, CompoundSelect):
+        return True
+    if isinstance(clause, TextClause):
+        return clause.text.lstrip()[:6].upper() == 'SELECT'
+    return False
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that sends reads to the ``read`` bind if there is one."""
+
+    def __init__(self, db, **kwargs):
+        super().__init__(db, **kwargs)
+        self._wrote = False
+        self._read_bind = None
+
+    def _read_engine(self):
+        engines = self._db.engines
+        if READ_BIND not in engines:
+            return None
+        replicas = current_app.config.get('READ_REPLICA_BINDS')
+        if not replicas:
+            # SQLite read pool: same database file, never stale
+            return engines[READ_BIND]
+        if not (has_request_context() and g.get('db_read_replica')):
+            return None
+        if self._read_bind is None:
+            self._read_bind = random.choice(replicas)
+        return engines[self._read_bind]
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._wrote and not self._flushing and _is_read_only(clause):
+            engine = self._read_engine()
+            if engine is not None:
+                return engine
+        if bind is None:
+            self._wrote = True
+            if has_request_context() and g.get('db_read_replica'):
+                # A GET that writes reads its own writes for the rest of the request
+                g.db_read_replica = False
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def _reset_routing(session, transaction):
+    if transaction.parent is None:
+        session._wrote = False
+        session._read_bind = None
+
+
+def _route_request():
+    sticky_until = request.cookies.get(STICKY_COOKIE, '')
+    g.db_read_replica = (request.method in _REPLICA_METHODS
+                         and not (sticky_until.isdigit() and int(sticky_until) > time.time()))
+
+
+def _stick_to_primary(response):
+    if request.method not in _REPLICA_METHODS and request.method != 'OPTIONS':
+        window = current_app.config['READ_AFTER_WRITE_SECONDS']
+        response.set_cookie(STICKY_COOKIE, str(int(time.time()) + window), max_age=window,
+                            httponly=True, samesite='Lax')
+    return response
+
+
+def _is_file_sqlite(uri):
+    return uri.startswith('sqlite') and ':memory:' not in uri and uri.rstrip('/') not in ('sqlite:', 'sqlite:/')
+
+
+def configure(app):
+    """Derive engine options and the read bind from the config. Call before ``db.init_app``."""
+    config = app.config
+    uri = config['SQLALCHEMY_DATABASE_URI']
+    replicas = [url.strip() for url in (config.get('DATABASE_READ_URL') or '').split(',') if url.strip()]
+    if replicas:
+        binds = {READ_BIND if i == 0 else f"{READ_BIND}_{i}": {'url': url, 'pool_pre_ping': True}
+                 for i, url in enumerate(replicas)}
+        config['SQLALCHEMY_BINDS'] = {**config.get('SQLALCHEMY_BINDS', {}), **binds}
+        config['READ_REPLICA_BINDS'] = list(binds)
+    if config.get('SQLITE_PROFILE') != 'concurrent':
+        return
+    if not _is_file_sqlite(uri):
+        logger.warning("SQLITE_PROFILE=concurrent needs a file-based SQLite DATABASE_URL; ignoring")
+        return
+    # One writer connection: threads queue for it (up to SQLITE_WRITE_TIMEOUT) instead of
+    # racing for SQLite's write lock
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        **config.get('SQLALCHEMY_ENGINE_OPTIONS', {}),
+        'pool_size': 1,
+        'max_overflow': 0,
+        'pool_timeout': config['SQLITE_WRITE_TIMEOUT'],
+    }
+    if not replicas:
+        config['SQLALCHEMY_BINDS'] = {
+            **config.get('SQLALCHEMY_BINDS', {}),
+            READ_BIND: {'url': uri, 'pool_size': config['SQLITE_READ_POOL_SIZE'], 'max_overflow': 0},
+        }
+
+
+def _sqlite_pragmas(config, writer):
+    pragmas = [
+        f"PRAGMA busy_timeout = {int(config['SQLITE_BUSY_TIMEOUT_MS'])}",
+        # NORMAL is durable across application crashes in WAL mode; only an OS crash can lose
+        # the last commits
+        "PRAGMA synchronous = NORMAL",
+        f"PRAGMA cache_size = -{int(config['SQLITE_CACHE_SIZE_KB'])}",
+        f"PRAGMA mmap_size = {int(config['SQLITE_MMAP_SIZE_MB']) * 1024 * 1024}",
+        "PRAGMA temp_store = MEMORY",
+    ]
+    if writer:
+        return ["PRAGMA journal_mode = WAL"] + pragmas
+    return pragmas + ["PRAGMA query_only = ON"]
+
+
+def _install_sqlite_hooks(engine, pragmas, begin):
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        # Let SQLAlchemy issue BEGIN itself instead of pysqlite's implicit, deferred one
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def _on_begin(conn):
+        conn.exec_driver_sql(begin)
+
+
+def install(app, db):
+    """Attach the request routing for replicas and the SQLite profile's connection hooks.
+
+    Call after ``db.init_app``.
+    """
+    if READ_BIND not in app.config.get('SQLALCHEMY_BINDS', {}):
+        return
+    replicas = app.config.get('READ_REPLICA_BINDS')
+    if replicas:
+        window = app.config['READ_AFTER_WRITE_SECONDS']
+        app.before_request(_route_request)
+        if window > 0:
+            app.after_request(_stick_to_primary)
+        logger.info(f"Read replicas: {len(replicas)} (GET requests; primary for {window}s after a client's write)")
+        return
+    with app.app_context():
+        engines = db.engines
+        if engines[None].dialect.name == 'sqlite':
+            _install_sqlite_hooks(engines[None], _sqlite_pragmas(app.config, writer=True), 'BEGIN IMMEDIATE')
+            _install_sqlite_hooks(engines[READ_BIND], _sqlite_pragmas(app.config, writer=False), 'BEGIN')
+            logger.info(f"SQLite concurrent profile: WAL, 1 writer, "
+                        f"{app.config['SQLITE_READ_POOL_SIZE']} reader connections")
@@ -0,0 +1,225 @@
+"""
+Streaming bulk export of comments, comment history and video metrics.
+
+Rows are read with server-side cursors (``stream_results`` on Postgres;
+SQLite iterates natively) in batches of ``EXPORT_BATCH_SIZE`` and written
+out as they arrive, so memory stays flat regardless of the archive size:
+
+* ``ndjson`` - one JSON object per line,
+* ``csv`` - header plus one line per row,
+* ``parquet`` - columnar file, one row group per batch (needs ``pyarrow``).
+
+Exports are ordered by primary key and can be filtered by video, time range
+(comments: ``published_at``, history: ``created_at``, metrics: runs
+overlapping the range) and comment status.
+
+Usage:
+    python export.py comments --format ndjson > comments.ndjson
+    python export.py history --format csv --video 3 --since 2024-01-01 --out history.csv
+    python export.py metrics --format parquet --out metrics.parquet
+"""
+
+import argparse
+import csv
+import io
+import json
+import logging
+import sys
+from datetime import datetime, timezone
+
+from sqlalchemy import DateTime, Float, Integer, select
+
+from models import db, Comment, CommentHistory, Video, VideoMetric
+from db_routing import READ_BIND
+import metric_history
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # optional, only needed for Parquet
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+DATASETS = ('comments', 'history', 'metrics')
+FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+def _comments_select():
+    return (select(*Comment.__table__.c, Video.video_id.label('youtube_video_id'))
+            .join(Video, Video.id == Comment.video_id))
+
+
+def _history_select():
+    return (select(*CommentHistory.__table__.c, Comment.comment_id.label('youtube_comment_id'),
+                   Comment.video_id.label('video_id'))
+            .join(Comment, Comment.id == CommentHistory.comment_id))
+
+
+def _metrics_select():
+    return (select(*VideoMetric.__table__.c, Video.video_id.label('youtube_video_id'))
+            .join(Video, Video.id == VideoMetric.video_id))
+
+
+def build_query(dataset, video_ids=None, since=None, until=None, status=None):
+    """SELECT for one dataset with the given filters, ordered by primary key."""
+    if dataset == 'comments':
+        query = _comments_select()
+        if video_ids:
+            query = query.where(Comment.video_id.in_(video_ids))
+        if since:
+            query = query.where(Comment.published_at >= since)
+        if until:
+            query = query.where(Comment.published_at < until)
+        if status:
+            query = query.where(Comment.status == status)
+        return query.order_by(Comment.id)
+    if dataset == 'history':
+        query = _history_select()
+        if video_ids:
+            query = query.where(Comment.video_id.in_(video_ids))
+        if since:
+            query = query.where(CommentHistory.created_at >= since)
+        if until:
+            query = query.where(CommentHistory.created_at < until)
+        if status:
+            query = query.where(Comment.status == status)
+        return query.order_by(CommentHistory.id)
+    if dataset == 'metrics':
+        query = _metrics_select()
+        if video_ids:
+            query = query.where(VideoMetric.video_id.in_(video_ids))
+        # Runs overlapping the range; also prunes monthly partitions
+        return metric_history.range_filter(query, since, until).order_by(VideoMetric.id)
+    raise ValueError(f"unknown dataset: {dataset}")
+
+
+def _engine():
+    # Exports are long reads; keep them off the writer when a read bind exists
+    engines = db.engines
+    return engines[READ_BIND] if READ_BIND in engines else engines[None]
+
+
+def iter_batches(query, batch_size=5000):
+    """Yield (column names, list of row tuples) batches from a server-side cursor."""
+    with _engine().connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(query)
+        columns = list(result.keys())
+        for batch in result.partitions():
+            yield columns, batch
+
+
+def _plain(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def ndjson_chunks(batches):
+    for columns, rows in batches:
+        yield ''.join(json.dumps(dict(zip(columns, map(_plain, row))), ensure_ascii=False) + '\n'
+                      for row in rows)
+
+
+def csv_chunks(batches):
+    header_written = False
+    for columns, rows in batches:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if not header_written:
+            writer.writerow(columns)
+            header_written = True
+        writer.writerows([_plain(v) for v in row] for row in rows)
+        yield buffer.getvalue()
+
+
+def _arrow_schema(query):
+    types = []
+    for column in query.selected_columns:
+        if isinstance(column.type, DateTime):
+            types.append(pyarrow.timestamp('us'))
+        elif isinstance(column.type, Float):
+            types.append(pyarrow.float64())
+        elif isinstance(column.type, Integer):
+            types.append(pyarrow.int64())
+        else:
+            types.append(pyarrow.string())
+    return pyarrow.schema(list(zip([c.name for c in query.selected_columns], types)))
+
+
+def write_parquet(query, target, batch_size=5000):
+    """Write the query result to ``target`` (path or binary file), one row group per batch.
+
+    Returns the number of rows written.
+    """
+    if pyarrow is None:
+        raise RuntimeError('Parquet export needs pyarrow (pip install pyarrow)')
+    schema = _arrow_schema(query)
+    total = 0
+    with pyarrow.parquet.ParquetWriter(target, schema, compression='zstd') as writer:
+        for columns, rows in iter_batches(query, batch_size):
+            arrays = [pyarrow.array(list(values), type=schema.field(i).type)
+                      for i, values in enumerate(zip(*rows))]
+            writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+            total += len(rows)
+    return total
+
+
+def _parse_time(value):
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the TubeTracker archive.')
+    parser.add_argument('dataset', choices=DATASETS)
+    parser.add_argument('--format', choices=list(FORMATS), default='ndjson')
+    parser.add_argument('--out', help='output file (default: stdout; required for parquet)')
+    parser.add_argument('--video', type=int, action='append', help='internal video id (repeatable)')
+    parser.add_argument('--since', type=_parse_time, help='ISO-8601 lower bound (inclusive)')
+    parser.add_argument('--until', type=_parse_time, help='ISO-8601 upper bound (exclusive)')
+    parser.add_argument('--status', choices=['active', 'deleted'], help='comment status')
+    parser.add_argument('--batch-size', type=int, help='rows per batch / row group (default EXPORT_BATCH_SIZE)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    if args.format == 'parquet' and not args.out:
+        parser.error('parquet needs --out')
+
+    from app import app
+
+    with app.app_context():
+        batch_size = args.batch_size or app.config['EXPORT_BATCH_SIZE']
+        query = build_query(args.dataset, args.video, args.since, args.until, args.status)
+        started = datetime.now(timezone.utc)
+        if args.format == 'parquet':
+            total = write_parquet(query, args.out, batch_size)
+        else:
+            chunks = ndjson_chunks if args.format == 'ndjson' else csv_chunks
+            total = 0
+
+            def counted():
+                nonlocal total
+                for columns, rows in iter_batches(query, batch_size):
+                    total += len(rows)
+                    yield columns, rows
+
+            out = open(args.out, 'w', encoding='utf-8', newline='') if args.out else sys.stdout
+            try:
+                for chunk in chunks(counted()):
+                    out.write(chunk)
+            finally:
+                if args.out:
+                    out.close()
+        seconds = (datetime.now(timezone.utc) - started).total_seconds()
+    logger.info(f"Exported {total} {args.dataset} rows in {seconds:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
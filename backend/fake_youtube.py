@@ -0,0 +1,489 @@
+"""
+Local stand-in for the YouTube Data API v3.
+
+Serves ``videos.list``, ``commentThreads.list``, ``comments.list``,
+``channels.list``, ``playlistItems.list`` and channel ``search.list`` from
+generated fixtures so the sync pipeline can be exercised and benchmarked
+without network access or API quota.
+
+Two ways to use it:
+
+* In-process: pass a ``FakeYouTubeTransport`` as the ``http`` object of
+  ``YouTubeService`` (googleapiclient talks to it like to httplib2).
+* Over HTTP: ``python fake_youtube.py --port 8765`` and point the backend at
+  it with ``YOUTUBE_API_ENDPOINT=http://127.0.0.1:8765/``.
+"""
+
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import httplib2
+
+logger = logging.getLogger(__name__)
+
+_ID_CHARS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_-'
+
+_WORDS = [
+    'video', 'great', 'tutorial', 'thanks', 'music', 'camera', 'editing', 'sound', 'channel', 'upload',
+    'toll', 'super', 'danke', 'schlecht', 'genial', 'musik', 'kamera', 'schnitt', 'inhalt', 'weiter',
+    'python', 'flask', 'database', 'sync', 'archive', 'comment', 'deleted', 'censorship', 'moderation',
+    'awesome', 'boring', 'helpful', 'confusing', 'amazing', 'terrible', 'learned', 'question', 'answer',
+]
+
+# Maximum number of replies YouTube embeds in a commentThreads item.
+INLINE_REPLY_LIMIT = 5
+
+
+def _iso(dt):
+    return dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class FakeComment:
+    """A single generated comment (top-level or reply)."""
+
+    __slots__ = ('id', 'video_id', 'parent_id', 'author', 'author_channel_id', 'text',
+                 'like_count', 'published_at', 'updated_at', 'deleted')
+
+    def __init__(self, id, video_id, parent_id, author, author_channel_id, text, like_count, published_at):
+        self.id = id
+        self.video_id = video_id
+        self.parent_id = parent_id
+        self.author = author
+        self.author_channel_id = author_channel_id
+        self.text = text
+        self.like_count = like_count
+        self.published_at = published_at
+        self.updated_at = published_at
+        self.deleted = False
+
+    def resource(self):
+        snippet = {
+            'videoId': self.video_id,
+            'textDisplay': self.text,
+            'textOriginal': self.text,
+            'authorDisplayName': self.author,
+            'authorChannelId': {'value': self.author_channel_id},
+            'likeCount': self.like_count,
+            'publishedAt': _iso(self.published_at),
+            'updatedAt': _iso(self.updated_at),
+        }
+        if self.parent_id:
+            snippet['parentId'] = self.parent_id
+        return {'kind': 'youtube#comment', 'id': self.id, 'snippet': snippet}
+
+
+class FakeVideo:
+    """A generated video with its comment threads (newest thread first)."""
+
+    def __init__(self, video_id, title, channel_id, channel_title, published_at, view_count, like_count):
+        self.video_id = video_id
+        self.title = title
+        self.channel_id = channel_id
+        self.channel_title = channel_title
+        self.published_at = published_at
+        self.view_count = view_count
+        self.like_count = like_count
+        self.comments_disabled = False
+        self.threads = []   # top-level FakeComment, newest first
+        self.replies = {}   # thread id -> [FakeComment] oldest first
+
+    def visible_threads(self):
+        return [t for t in self.threads if not t.deleted]
+
+    def visible_replies(self, thread_id):
+        return [r for r in self.replies.get(thread_id, []) if not r.deleted]
+
+    def visible_comment_count(self):
+        total = 0
+        for t in self.threads:
+            if t.deleted:
+                continue
+            total += 1 + len(self.visible_replies(t.id))
+        return total
+
+
+class FakeYouTubeArchive:
+    """Deterministic fixture generator plus API response builder.
+
+    Args:
+        videos: number of videos to generate
+        comments_per_video: number of top-level comment threads per video
+        max_replies: maximum replies per thread (drawn uniformly 0..max_replies)
+        seed: random seed; the same seed always yields the same archive
+    """
+
+    def __init__(self, videos=3, comments_per_video=200, max_replies=3, seed=42):
+        self.rng = random.Random(seed)
+        self.now = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        self.videos = {}
+        self._thread_video = {}
+        self.playlists = {}  # playlist id -> [video id]; channel uploads playlists are derived
+        self._lock = threading.RLock()
+        for i in range(videos):
+            self.add_video(comments_per_video, max_replies, index=i)
+
+    # -- generation -------------------------------------------------------
+    def _rand_id(self, n):
+        return ''.join(self.rng.choice(_ID_CHARS) for _ in range(n))
+
+    def _rand_text(self):
+        return ' '.join(self.rng.choice(_WORDS) for _ in range(self.rng.randint(3, 18)))
+
+    def _rand_author(self):
+        n = self.rng.randint(1, 5000)
+        return f"user{n}", f"UC{n:022d}"
+
+    def _new_comment(self, video, parent_id=None):
+        author, channel_id = self._rand_author()
+        if parent_id:
+            cid = f"{parent_id}.{self._rand_id(22)}"
+        else:
+            cid = 'Ugz' + self._rand_id(23)
+        return FakeComment(cid, video.video_id, parent_id, author, channel_id, self._rand_text(),
+                           self.rng.randint(0, 50), self.now)
+
+    def add_video(self, comments=200, max_replies=3, index=None):
+        """Generate a video with ``comments`` threads and return its id."""
+        with self._lock:
+            index = len(self.videos) if index is None else index
+            video_id = f"fake{index:07d}"
+            video = FakeVideo(
+                video_id=video_id,
+                title=f"Fake video {index}",
+                channel_id=f"UCfakechannel{index % 10:011d}",
+                channel_title=f"Fake channel {index % 10}",
+                published_at=self.now - timedelta(days=30),
+                view_count=self.rng.randint(1000, 1000000),
+                like_count=self.rng.randint(10, 10000),
+            )
+            # Publish timestamps spread over the past, oldest first, then reverse for API order
+            start = self.now - timedelta(days=29)
+            step = timedelta(seconds=max(1, int(29 * 86400 / max(comments, 1))))
+            for n in range(comments):
+                thread = self._new_comment(video)
+                thread.published_at = thread.updated_at = start + step * n
+                video.threads.append(thread)
+                self._thread_video[thread.id] = video_id
+                replies = []
+                for r in range(self.rng.randint(0, max_replies)):
+                    reply = self._new_comment(video, parent_id=thread.id)
+                    reply.published_at = reply.updated_at = thread.published_at + timedelta(minutes=r + 1)
+                    replies.append(reply)
+                video.replies[thread.id] = replies
+            video.threads.reverse()
+            self.videos[video_id] = video
+            return video_id
+
+    def add_playlist(self, video_ids):
+        """Create a playlist of the given (possibly unknown) video ids and return its id."""
+        with self._lock:
+            playlist_id = f"PLfake{len(self.playlists):028d}"
+            self.playlists[playlist_id] = list(video_ids)
+            return playlist_id
+
+    @staticmethod
+    def uploads_playlist(channel_id):
+        return 'UU' + channel_id[2:]
+
+    def advance(self, minutes=15, new_comments=0.02, edits=0.01, deletes=0.005, reinstates=0.5,
+                like_churn=0.05, views=0.01):
+        """Apply one round of churn, as happens between two real syncs.
+
+        Rates are fractions of the current comment population (``reinstates`` is a
+        fraction of currently deleted comments). Returns a Counter of applied changes.
+        """
+        applied = Counter()
+        with self._lock:
+            self.now += timedelta(minutes=minutes)
+            for video in self.videos.values():
+                everything = list(video.threads)
+                for lst in video.replies.values():
+                    everything.extend(lst)
+                live = [c for c in everything if not c.deleted]
+                gone = [c for c in everything if c.deleted]
+                for c in self.rng.sample(gone, int(len(gone) * reinstates)):
+                    c.deleted = False
+                    applied['reinstated'] += 1
+                for c in self.rng.sample(live, int(len(live) * deletes)):
+                    c.deleted = True
+                    applied['deleted'] += 1
+                for c in self.rng.sample(live, int(len(live) * edits)):
+                    c.text = c.text + ' ' + self.rng.choice(_WORDS)
+                    c.updated_at = self.now
+                    applied['edited'] += 1
+                for c in self.rng.sample(live, int(len(live) * like_churn)):
+                    c.like_count += self.rng.randint(1, 5)
+                    applied['liked'] += 1
+                for _ in range(int(len(video.threads) * new_comments)):
+                    if self.rng.random() < 0.7 or not video.threads:
+                        thread = self._new_comment(video)
+                        video.threads.insert(0, thread)
+                        video.replies[thread.id] = []
+                        self._thread_video[thread.id] = video.video_id
+                    else:
+                        parent = self.rng.choice(video.threads[:50])
+                        video.replies.setdefault(parent.id, []).append(
+                            self._new_comment(video, parent_id=parent.id))
+                    applied['created'] += 1
+                video.view_count += int(video.view_count * views) + 1
+        return applied
+
+    # -- API responses ----------------------------------------------------
+    @staticmethod
+    def _page(items, params, default_size=20, cap=100):
+        try:
+            size = min(cap, max(1, int(params.get('maxResults', default_size))))
+        except ValueError:
+            size = default_size
+        token = params.get('pageToken') or ''
+        offset = int(token[1:]) if token.startswith('p') and token[1:].isdigit() else 0
+        chunk = items[offset:offset + size]
+        next_token = f"p{offset + size}" if offset + size < len(items) else None
+        return chunk, next_token
+
+    def videos_list(self, params):
+        ids = [i for i in (params.get('id') or '').split(',') if i]
+        items = []
+        for vid in ids:
+            video = self.videos.get(vid)
+            if not video:
+                continue
+            items.append({
+                'kind': 'youtube#video',
+                'id': video.video_id,
+                'snippet': {
+                    'publishedAt': _iso(video.published_at),
+                    'channelId': video.channel_id,
+                    'title': video.title,
+                    'description': f"Generated fixture video {video.video_id}",
+                    'channelTitle': video.channel_title,
+                    'thumbnails': {'high': {'url': f"https://i.ytimg.com/vi/{video.video_id}/hqdefault.jpg"}},
+                },
+                'statistics': {
+                    'viewCount': str(video.view_count),
+                    'likeCount': str(video.like_count),
+                    'commentCount': str(video.visible_comment_count()),
+                },
+            })
+        return 200, {'kind': 'youtube#videoListResponse', 'items': items,
+                     'pageInfo': {'totalResults': len(items), 'resultsPerPage': len(items)}}
+
+    def comment_threads_list(self, params):
+        video = self.videos.get(params.get('videoId') or '')
+        if not video:
+            return _error(404, 'videoNotFound', 'The video identified by the videoId parameter could not be found.')
+        if video.comments_disabled:
+            return _error(403, 'commentsDisabled', 'The video has disabled comments.')
+        threads, next_token = self._page(video.visible_threads(), params)
+        with_replies = 'replies' in (params.get('part') or '')
+        items = []
+        for t in threads:
+            replies = video.visible_replies(t.id)
+            item = {
+                'kind': 'youtube#commentThread',
+                'id': t.id,
+                'snippet': {
+                    'videoId': video.video_id,
+                    'topLevelComment': t.resource(),
+                    'canReply': True,
+                    'totalReplyCount': len(replies),
+                    'isPublic': True,
+                },
+            }
+            if with_replies and replies:
+                item['replies'] = {'comments': [r.resource() for r in replies[:INLINE_REPLY_LIMIT]]}
+            items.append(item)
+        body = {'kind': 'youtube#commentThreadListResponse', 'items': items,
+                'pageInfo': {'totalResults': len(items), 'resultsPerPage': len(items)}}
+        if next_token:
+            body['nextPageToken'] = next_token
+        return 200, body
+
+    def comments_list(self, params):
+        parent_id = params.get('parentId')
+        if parent_id:
+            video = self.videos.get(self._thread_video.get(parent_id))
+            replies = video.visible_replies(parent_id) if video else []
+            page, next_token = self._page(replies, params)
+        else:
+            wanted = set((params.get('id') or '').split(','))
+            page, next_token = [], None
+            for video in self.videos.values():
+                for t in video.threads:
+                    if t.id in wanted and not t.deleted:
+                        page.append(t)
+                    for r in video.replies.get(t.id, []):
+                        if r.id in wanted and not r.deleted:
+                            page.append(r)
+        body = {'kind': 'youtube#commentListResponse', 'items': [c.resource() for c in page]}
+        if next_token:
+            body['nextPageToken'] = next_token
+        return 200, body
+
+    def _channels(self):
+        channels = {}
+        for video in self.videos.values():
+            handle = '@' + video.channel_title.replace(' ', '').lower()
+            channels.setdefault(video.channel_id, (handle, video.channel_title))
+        return channels
+
+    def channels_list(self, params):
+        wanted = set((params.get('id') or '').split(','))
+        items = [{
+            'kind': 'youtube#channel',
+            'id': cid,
+            'contentDetails': {'relatedPlaylists': {'uploads': self.uploads_playlist(cid)}},
+        } for cid in self._channels() if cid in wanted]
+        return 200, {'kind': 'youtube#channelListResponse', 'items': items,
+                     'pageInfo': {'totalResults': len(items), 'resultsPerPage': len(items)}}
+
+    def search_list(self, params):
+        # Only channel searches are served; a query matches handles and titles by substring
+        query = (params.get('q') or '').lower().lstrip('@')
+        items = [{
+            'kind': 'youtube#searchResult',
+            'id': {'kind': 'youtube#channel', 'channelId': cid},
+            'snippet': {'channelId': cid, 'channelTitle': title, 'title': title},
+        } for cid, (handle, title) in self._channels().items()
+            if params.get('type') == 'channel' and query and (query in handle or query in title.lower())]
+        items = items[:min(int(params.get('maxResults', 5)), 50)]
+        return 200, {'kind': 'youtube#searchListResponse', 'items': items,
+                     'pageInfo': {'totalResults': len(items), 'resultsPerPage': len(items)}}
+
+    def playlist_items_list(self, params):
+        playlist_id = params.get('playlistId') or ''
+        if playlist_id in self.playlists:
+            video_ids = self.playlists[playlist_id]
+        else:
+            # Uploads playlists list the channel's videos, newest first
+            uploads = sorted((v for v in self.videos.values() if self.uploads_playlist(v.channel_id) == playlist_id),
+                             key=lambda v: (v.published_at, v.video_id), reverse=True)
+            if not uploads:
+                return _error(404, 'playlistNotFound', 'The playlist identified by the playlistId parameter '
+                                                       'cannot be found.')
+            video_ids = [v.video_id for v in uploads]
+        page, next_token = self._page(video_ids, params, default_size=5, cap=50)
+        items = [{
+            'kind': 'youtube#playlistItem',
+            'id': f"{playlist_id}.{n}",
+            'contentDetails': {'videoId': vid},
+        } for n, vid in enumerate(page)]
+        body = {'kind': 'youtube#playlistItemListResponse', 'items': items,
+                'pageInfo': {'totalResults': len(video_ids), 'resultsPerPage': len(items)}}
+        if next_token:
+            body['nextPageToken'] = next_token
+        return 200, body
+
+    def dispatch(self, path, params):
+        """Route an API path (``.../youtube/v3/<resource>``) to its handler."""
+        resource = path.rstrip('/').rsplit('/', 1)[-1]
+        with self._lock:
+            if resource == 'videos':
+                return self.videos_list(params)
+            if resource == 'commentThreads':
+                return self.comment_threads_list(params)
+            if resource == 'comments':
+                return self.comments_list(params)
+            if resource == 'channels':
+                return self.channels_list(params)
+            if resource == 'playlistItems':
+                return self.playlist_items_list(params)
+            if resource == 'search':
+                return self.search_list(params)
+        return _error(404, 'notFound', f"Unknown resource: {resource}")
+
+
+def _error(status, reason, message):
+    return status, {'error': {'code': status, 'message': message,
+                              'errors': [{'reason': reason, 'message': message}]}}
+
+
+class FakeYouTubeTransport:
+    """httplib2-compatible transport that answers from a FakeYouTubeArchive.
+
+    Args:
+        archive: the fixture archive to serve
+        latency: seconds to sleep per request, simulating network round trips
+        jitter: additional uniform random latency in seconds
+    """
+
+    def __init__(self, archive, latency=0.0, jitter=0.0):
+        self.archive = archive
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = Counter()
+
+    @property
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        parsed = urlparse(uri)
+        params = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+        resource = parsed.path.rstrip('/').rsplit('/', 1)[-1]
+        self.calls[f"{resource}.list"] += 1
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+        status, payload = self.archive.dispatch(parsed.path, params)
+        response = httplib2.Response({'status': status, 'content-type': 'application/json; charset=UTF-8'})
+        return response, json.dumps(payload).encode('utf-8')
+
+
+def make_handler(transport):
+    """Build an HTTP request handler class serving ``transport`` over the network."""
+
+    class FakeYouTubeHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            response, content = transport.request(self.path)
+            self.send_response(int(response.status))
+            self.send_header('Content-Type', 'application/json; charset=UTF-8')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, fmt, *args):
+            logger.debug(fmt, *args)
+
+    return FakeYouTubeHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a fake YouTube Data API from generated fixtures.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--videos', type=int, default=3)
+    parser.add_argument('--comments', type=int, default=200, help='top-level threads per video')
+    parser.add_argument('--replies', type=int, default=3, help='maximum replies per thread')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds per request')
+    parser.add_argument('--churn-every', type=float, default=0.0,
+                        help='apply one churn round every N seconds (0 = static archive)')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    archive = FakeYouTubeArchive(args.videos, args.comments, args.replies, seed=args.seed)
+    transport = FakeYouTubeTransport(archive, latency=args.latency)
+
+    if args.churn_every > 0:
+        def churn_loop():
+            while True:
+                time.sleep(args.churn_every)
+                logger.info(f"Applied churn: {dict(archive.advance())}")
+        threading.Thread(target=churn_loop, daemon=True).start()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(transport))
+    logger.info(f"Fake YouTube API on http://{args.host}:{args.port}/ serving videos: {', '.join(archive.videos)}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
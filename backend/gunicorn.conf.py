@@ -0,0 +1,52 @@
+"""
+Gunicorn settings for the API (see wsgi.py).
+
+Every setting can be overridden on the command line or with
+GUNICORN_CMD_ARGS; the defaults come from the environment:
+
+* PORT - listen port (5055)
+* WEB_CONCURRENCY - worker processes (default: CPU count, at most 4; each
+  process that scores comments loads its own copy of the sentiment model)
+* GUNICORN_THREADS - threads per worker (4)
+* GUNICORN_TIMEOUT - seconds before a stuck worker is restarted (120)
+* METRICS_DIR - directory the workers share their /metrics values through, so
+  any worker answers a scrape with the totals of all of them (a temp directory)
+
+Usage:
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+import glob
+import multiprocessing
+import os
+import tempfile
+
+port = os.getenv('PORT', '5055')
+bind = f"0.0.0.0:{port}"
+workers = int(os.getenv('WEB_CONCURRENCY', min(4, multiprocessing.cpu_count())))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+accesslog = '-'
+# Import the app (tables, migrations) once in the master instead of once per worker
+preload_app = True
+metrics_dir = os.getenv('METRICS_DIR') or os.path.join(tempfile.gettempdir(), f"tubetracker-metrics-{port}")
+
+
+def on_starting(server):
+    """Start the shared metrics from zero, like a single process would."""
+    os.makedirs(metrics_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(metrics_dir, 'metrics-*.json')):
+        os.remove(path)
+
+
+def post_fork(server, worker):
+    """Drop connections inherited from the master; each worker opens its own."""
+    from app import app
+    from instrumentation import REGISTRY
+    from models import db
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    REGISTRY.share(metrics_dir)
@@ -0,0 +1,387 @@
+"""
+Sync instrumentation and Prometheus metrics.
+
+Provides timed spans for the phases of a sync run, per-thread counters for
+YouTube API calls and SQL statements (the latter via SQLAlchemy cursor
+events), sentiment batch statistics and request latency histograms. All
+metrics are kept in-process and rendered in the Prometheus text exposition
+format, so no prometheus_client dependency is required.
+
+Processes that serve one endpoint together (gunicorn workers) share their
+metrics through a directory (``Registry.share``): each writes its values to
+its own file, and a scrape of any of them renders the sum over all files.
+worker.py exposes its own registry with ``serve_metrics``.
+"""
+
+import atexit
+import bisect
+import glob
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import Counter as _Tally
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple((name, labels.get(name, '')) for name in self.labelnames)
+
+    def dump(self):
+        """The current values as JSON-serializable [labels, value] pairs."""
+        with self._lock:
+            return [[list(key), json.loads(json.dumps(value))] for key, value in self._values.items()]
+
+    def render(self, values=None):
+        """Render ``values`` (label key -> value, default: this process's values)."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        if values is None:
+            with self._lock:
+                values = dict(self._values)
+        for key, value in sorted(values.items()):
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    @staticmethod
+    def combine(a, b):
+        return a + b
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][idx] += 1
+            state[1] += value
+
+    @staticmethod
+    def combine(a, b):
+        return [[x + y for x, y in zip(a[0], b[0])], a[1] + b[1]]
+
+    def _render_sample(self, key, value):
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{_format_labels(key + (('le', _format_value(bound)),))} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered together for the /metrics endpoint."""
+
+    def __init__(self):
+        self._metrics = []
+        self._shared_dir = None
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def share(self, directory, interval=5.0):
+        """Publish this process's values to ``directory`` and render the sum of all its files.
+
+        Values are written every ``interval`` seconds, before each render and at exit. Files of
+        exited processes are kept so that counters never go backwards; clear the
+        directory when the server (re)starts.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self._shared_dir = directory
+        self._write_shared()
+
+        def _publish():
+            while True:
+                time.sleep(interval)
+                try:
+                    self._write_shared()
+                except OSError as e:
+                    logger.warning(f"Could not publish metrics to {directory}: {e}")
+
+        threading.Thread(target=_publish, name='metrics-publish', daemon=True).start()
+        atexit.register(self._write_shared)
+
+    def _write_shared(self):
+        path = os.path.join(self._shared_dir, f"metrics-{os.getpid()}.json")
+        with open(path + '.tmp', 'w') as f:
+            json.dump({metric.name: metric.dump() for metric in self._metrics}, f)
+        os.replace(path + '.tmp', path)
+
+    def _read_shared(self):
+        """metric name -> label key -> value summed over the files in the shared directory."""
+        combined = {metric.name: {} for metric in self._metrics}
+        combine = {metric.name: metric.combine for metric in self._metrics}
+        for path in glob.glob(os.path.join(self._shared_dir, 'metrics-*.json')):
+            try:
+                with open(path) as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, samples in state.items():
+                if name not in combined:
+                    continue
+                values = combined[name]
+                for key, value in samples:
+                    key = tuple(tuple(label) for label in key)
+                    values[key] = combine[name](values[key], value) if key in values else value
+        return combined
+
+    def render(self):
+        shared = None
+        if self._shared_dir:
+            self._write_shared()
+            shared = self._read_shared()
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render(shared[metric.name] if shared is not None else None))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    'tubetracker_http_request_duration_seconds', 'Latency of /api/* requests by route.',
+    ('method', 'route', 'status'))
+SYNC_RUNS = REGISTRY.counter(
+    'tubetracker_sync_runs_total', 'Finished sync runs by kind and status.', ('kind', 'status'))
+SYNC_RUN_SECONDS = REGISTRY.histogram(
+    'tubetracker_sync_run_duration_seconds', 'Wall time of whole sync runs.', ('kind',))
+SYNC_PHASE_SECONDS = REGISTRY.histogram(
+    'tubetracker_sync_phase_duration_seconds', 'Wall time of individual sync phases.', ('phase',))
+SYNC_COMMENTS = REGISTRY.counter(
+    'tubetracker_sync_comments_total', 'Comments processed by sync, by outcome.', ('outcome',))
+API_CALLS = REGISTRY.counter(
+    'tubetracker_youtube_api_calls_total', 'YouTube Data API requests by method.', ('method',))
+DB_STATEMENTS = REGISTRY.counter(
+    'tubetracker_db_statements_total', 'SQL statements executed, by sync phase (or "none").', ('phase',))
+SENTIMENT_TEXTS = REGISTRY.counter(
+    'tubetracker_sentiment_texts_total', 'Texts sent to sentiment inference, by result.', ('result',))
+SENTIMENT_BATCHES = REGISTRY.counter(
+    'tubetracker_sentiment_batches_total', 'Model batches run for sentiment inference.')
+SENTIMENT_SECONDS = REGISTRY.histogram(
+    'tubetracker_sentiment_inference_seconds', 'Wall time of analyze_batch calls.')
+MICROBATCH_SIZE = REGISTRY.histogram(
+    'tubetracker_sentiment_microbatch_size', 'Texts per micro-batch of POST /api/sentiment/analyze.',
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+MICROBATCH_WAIT_SECONDS = REGISTRY.histogram(
+    'tubetracker_sentiment_microbatch_wait_seconds', 'Time the first text of a micro-batch was queued.',
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0))
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_local = threading.local()
+
+
+def _thread_counters():
+    counters = getattr(_local, 'counters', None)
+    if counters is None:
+        counters = _local.counters = {'api_calls': 0, 'db_statements': 0}
+    return counters
+
+
+def _snapshot():
+    counters = _thread_counters()
+    return counters['api_calls'], counters['db_statements']
+
+
+def record_api_call(method):
+    """Count one YouTube Data API request (called by YouTubeService)."""
+    API_CALLS.inc(method=method)
+    _thread_counters()['api_calls'] += 1
+
+
+def _on_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    DB_STATEMENTS.inc(phase=getattr(_local, 'phase', None) or 'none')
+    _thread_counters()['db_statements'] += 1
+
+
+def install_db_hooks(engine):
+    """Count SQL statements executed on ``engine``. Safe to call repeatedly."""
+    if not event.contains(engine, 'before_cursor_execute', _on_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _on_cursor_execute)
+
+
+def observe_microbatch(size, wait_seconds, seconds):
+    MICROBATCH_SIZE.observe(size)
+    MICROBATCH_WAIT_SECONDS.observe(wait_seconds)
+    SENTIMENT_SECONDS.observe(seconds)
+
+
+def observe_request(method, route, status, seconds):
+    HTTP_REQUEST_SECONDS.observe(seconds, method=method, route=route, status=str(status))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port, host='0.0.0.0'):
+    """Serve GET /metrics for processes without an HTTP endpoint (worker.py).
+
+    Runs in a daemon thread; returns the server (call ``shutdown()`` to stop it).
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
+
+
+class SyncTrace:
+    """Timed spans and counters for a single sync run.
+
+    Counters are per-thread, so concurrent syncs on other threads never leak
+    into this trace. ``summary()`` returns the values stored as a SyncRun row.
+    """
+
+    def __init__(self, kind, video_id=None):
+        self.kind = kind
+        self.video_id = video_id
+        self.started_at = datetime.now(timezone.utc)
+        self.phases = {}
+        self.stats = _Tally()
+        self._t0 = time.perf_counter()
+        self._start = _snapshot()
+        self._finished = None
+
+    @contextmanager
+    def span(self, phase):
+        api_before, db_before = _snapshot()
+        previous_phase = getattr(_local, 'phase', None)
+        _local.phase = phase
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            _local.phase = previous_phase
+            api_after, db_after = _snapshot()
+            entry = self.phases.setdefault(phase, {'seconds': 0.0, 'api_calls': 0, 'db_statements': 0})
+            entry['seconds'] += elapsed
+            entry['api_calls'] += api_after - api_before
+            entry['db_statements'] += db_after - db_before
+            SYNC_PHASE_SECONDS.observe(elapsed, phase=phase)
+
+    def count(self, outcome, amount=1):
+        """Count processed comments by outcome (fetched, created, updated, deleted, ...)."""
+        if amount:
+            self.stats[f"comments_{outcome}"] += amount
+            SYNC_COMMENTS.inc(amount, outcome=outcome)
+
+    def record_inference(self, texts, scored, seconds, batch_size):
+        batches = math.ceil(texts / batch_size) if texts and batch_size else 0
+        self.stats['sentiment_texts'] += texts
+        self.stats['sentiment_scored'] += scored
+        self.stats['sentiment_batches'] += batches
+        self.stats['sentiment_ms'] += int(seconds * 1000)
+        SENTIMENT_TEXTS.inc(scored, result='scored')
+        SENTIMENT_TEXTS.inc(texts - scored, result='unscored')
+        SENTIMENT_BATCHES.inc(batches)
+        SENTIMENT_SECONDS.observe(seconds)
+
+    def finish(self, status):
+        """Close the trace and update the run-level metrics. Returns self."""
+        if self._finished is None:
+            self._finished = datetime.now(timezone.utc)
+            self.duration = time.perf_counter() - self._t0
+            api_after, db_after = _snapshot()
+            self.api_calls = api_after - self._start[0]
+            self.db_statements = db_after - self._start[1]
+            self.status = status
+            SYNC_RUNS.inc(kind=self.kind, status=status)
+            SYNC_RUN_SECONDS.observe(self.duration, kind=self.kind)
+        return self
+
+    def summary(self):
+        return {
+            'kind': self.kind,
+            'status': self.status,
+            'started_at': self.started_at,
+            'finished_at': self._finished,
+            'duration_seconds': round(self.duration, 4),
+            'api_calls': self.api_calls,
+            'db_statements': self.db_statements,
+            'comments_processed': self.stats.get('comments_fetched', 0),
+            'stats': dict(self.stats),
+            'phases': {k: {'seconds': round(v['seconds'], 4), 'api_calls': v['api_calls'],
+                           'db_statements': v['db_statements']} for k, v in self.phases.items()},
+        }
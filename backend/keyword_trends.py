@@ -0,0 +1,250 @@
+"""
+Keyword trends per video and day.
+
+``keyword_bucket_terms`` counts, per video, publication day and keyword term,
+the active comments containing the term and its occurrences (the empty term
+'' counts the day's comments). A flush hook (comment_deltas.py) tokenizes
+inserted, edited, deleted and reinstated comments, applies the deltas with
+one upsert and marks the touched days in ``keyword_trend_dirty``.
+
+After each sync, ``snapshot`` re-ranks only the dirty days of the video and
+stores their top ``KEYWORD_TREND_TOP_K`` terms in ``keyword_snapshots``
+(rank 0 holds the day's comment count), so the cost of a sync follows the
+comments that arrived or vanished, not the size of the archive. The range
+endpoint reads the snapshots of a video with one primary-key range scan.
+
+Days changed outside a sync (sweeps, rescoring) are picked up by the next
+sync of the video or ``python keyword_trends.py snapshot``. The day counts
+share the stopword version of term_stats.py: after a stopword change they
+are recounted together, and deltas are skipped until then.
+
+Usage:
+    python keyword_trends.py snapshot [--video ID]   # re-rank the days changed since the last snapshot
+    python keyword_trends.py rebuild [--video ID]    # recompute from the comments table
+"""
+
+import argparse
+import logging
+import sys
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+from sqlalchemy import case, delete, func, literal, select, tuple_
+
+from comment_deltas import DeltaHook, dialect_insert, repair_negative
+from models import db, utcnow, Comment, KeywordBucketTerm, KeywordSnapshot, KeywordTrendDirty
+from sentiment_trends import bucket_start
+from term_stats import TOTAL, term_counts
+import keywords
+
+logger = logging.getLogger(__name__)
+
+GRANULARITY = 'day'
+_CHUNK = 500
+
+
+def _counted_state(video_pk, status, published_at, text):
+    """What a comment contributes to the day counts, or None if it is not counted."""
+    # status is still None on new comments (the column default applies at INSERT)
+    if video_pk is None or published_at is None or status == 'deleted':
+        return None
+    return video_pk, bucket_start(published_at, GRANULARITY), text or ''
+
+
+def _add(deltas, state, sign, tokenizer):
+    video_pk, day, text = state
+    for term, occurrences in term_counts(text, tokenizer).items():
+        entry = deltas[(video_pk, day, term)]
+        entry[0] += sign
+        entry[1] += sign * occurrences
+
+
+def _state(get):
+    return _counted_state(get('video_id'), get('status'), get('published_at'), get('text'))
+
+
+def _collect(changes, before, after):
+    # Tokenized after the flush, with the stopwords the day counts were made with
+    if before is not None:
+        changes[before] -= 1
+    if after is not None:
+        changes[after] += 1
+
+
+def _apply(session, changes):
+    changes = {state: sign for state, sign in changes.items() if sign}
+    if not changes:
+        return
+    tokenizer = keywords.stats_tokenizer(session)
+    if tokenizer is None:
+        logger.debug("Keyword trends are being recounted for new stopwords; skipping deltas")
+        return
+    deltas = defaultdict(lambda: [0, 0])
+    for state, sign in changes.items():
+        _add(deltas, state, sign, tokenizer)
+    rows = [dict(video_id=video_pk, bucket_start=day, term=term, comment_count=comments, occurrence_count=occ)
+            for (video_pk, day, term), (comments, occ) in deltas.items() if comments or occ]
+    if not rows:
+        return
+    insert = dialect_insert(session)
+    table = KeywordBucketTerm.__table__
+    counters = ('comment_count', 'occurrence_count')
+    stmt = insert(table)
+    returned = session.execute(stmt.on_conflict_do_update(
+        index_elements=[table.c.video_id, table.c.bucket_start, table.c.term],
+        set_={name: table.c[name] + stmt.excluded[name] for name in counters})
+        .returning(table.c.video_id, table.c.bucket_start, table.c.term, *[table.c[name] for name in counters]),
+        rows).mappings().all()
+    repair_negative(session, table, counters, returned)
+    days = {(row['video_id'], row['bucket_start']) for row in rows}
+    session.execute(insert(KeywordTrendDirty.__table__).on_conflict_do_nothing(),
+                    [dict(video_id=video_pk, bucket_start=day) for video_pk, day in sorted(days)])
+
+
+_hook = DeltaHook('keyword_trend_deltas', _state, _collect, _apply, Counter)
+
+
+def install(session_class):
+    """Keep keyword_bucket_terms and the dirty days in sync with every flush of ``session_class``. Idempotent."""
+    _hook.install(session_class)
+
+
+def _rank_days(conn, days, top_k, now):
+    """Replace the snapshots of ``days`` [(video_pk, day)] with their current top terms."""
+    terms, snapshots = KeywordBucketTerm.__table__, KeywordSnapshot.__table__
+    c = terms.c
+    conn.execute(delete(snapshots).where(tuple_(snapshots.c.video_id, snapshots.c.bucket_start).in_(days)))
+    ranked = (select(c.video_id, c.bucket_start, c.term, c.comment_count, c.occurrence_count,
+                     func.row_number().over(
+                         partition_by=(c.video_id, c.bucket_start),
+                         order_by=(case((c.term == TOTAL, 0), else_=1), c.occurrence_count.desc(),
+                                   c.comment_count.desc(), c.term)).label('position'))
+              .where(tuple_(c.video_id, c.bucket_start).in_(days), c.comment_count > 0)
+              .subquery())
+    conn.execute(snapshots.insert().from_select(
+        ['video_id', 'bucket_start', 'rank', 'term', 'comment_count', 'occurrence_count', 'snapshot_at'],
+        select(ranked.c.video_id, ranked.c.bucket_start, ranked.c.position - 1, ranked.c.term,
+               ranked.c.comment_count, ranked.c.occurrence_count, literal(now, KeywordSnapshot.snapshot_at.type))
+        .where(ranked.c.position <= top_k + 1)))
+    # Terms that left a day for good no longer need a counter
+    conn.execute(delete(terms).where(tuple_(c.video_id, c.bucket_start).in_(days), c.comment_count <= 0))
+    dirty = KeywordTrendDirty.__table__
+    conn.execute(delete(dirty).where(tuple_(dirty.c.video_id, dirty.c.bucket_start).in_(days)))
+
+
+def snapshot(conn, video_pk=None, top_k=20):
+    """Re-rank the days changed since the last snapshot on ``conn`` (caller's transaction).
+
+    With ``video_pk`` only that video's days are re-ranked. Returns the number of days.
+    """
+    dirty = select(KeywordTrendDirty.video_id, KeywordTrendDirty.bucket_start)
+    if video_pk is not None:
+        dirty = dirty.where(KeywordTrendDirty.video_id == video_pk)
+    days = [tuple(row) for row in conn.execute(dirty)]
+    now = utcnow()
+    for start in range(0, len(days), _CHUNK):
+        _rank_days(conn, days[start:start + _CHUNK], top_k, now)
+    return len(days)
+
+
+def rebuild(conn, video_pk=None, tokenizer=None, top_k=20):
+    """Recount the day terms from the comments table and re-rank every day (caller's transaction).
+
+    Returns the number of days.
+    """
+    tokenizer = tokenizer or keywords.load_tokenizer(conn)
+    terms, snapshots, dirty = (KeywordBucketTerm.__table__, KeywordSnapshot.__table__,
+                               KeywordTrendDirty.__table__)
+    texts = (select(Comment.video_id, Comment.published_at, Comment.text)
+             .where(Comment.status == 'active', Comment.published_at.isnot(None)))
+    clears = [delete(terms), delete(snapshots), delete(dirty)]
+    if video_pk is not None:
+        texts = texts.where(Comment.video_id == video_pk)
+        clears = [clear.where(table.c.video_id == video_pk)
+                  for clear, table in zip(clears, (terms, snapshots, dirty))]
+    for clear in clears:
+        conn.execute(clear)
+
+    counts = defaultdict(lambda: [0, 0])
+    for video, published_at, text in conn.execute(texts.execution_options(yield_per=5000)):
+        day = bucket_start(published_at, GRANULARITY)
+        for term, occurrences in term_counts(text, tokenizer).items():
+            entry = counts[(video, day, term)]
+            entry[0] += 1
+            entry[1] += occurrences
+    rows = [dict(video_id=video, bucket_start=day, term=term, comment_count=comments, occurrence_count=occ)
+            for (video, day, term), (comments, occ) in counts.items()]
+    for start in range(0, len(rows), 5000):
+        conn.execute(terms.insert(), rows[start:start + 5000])
+    days = sorted({(row['video_id'], row['bucket_start']) for row in rows})
+    if days:
+        conn.execute(dirty.insert(), [dict(video_id=video, bucket_start=day) for video, day in days])
+    return snapshot(conn, video_pk, top_k)
+
+
+def trends(video_pk, since=None, until=None, terms=None, limit=10, bigrams=True):
+    """Trajectories of keyword terms of one video over the days in [since, until).
+
+    ``terms`` picks the terms; otherwise the ``limit`` terms with the most occurrences
+    in the snapshots of the range. A term's value is None on days it was not in the top K.
+    Returns (days, term items).
+    """
+    query = KeywordSnapshot.query.filter(KeywordSnapshot.video_id == video_pk)
+    if since:
+        query = query.filter(KeywordSnapshot.bucket_start >= bucket_start(since, GRANULARITY))
+    if until:
+        query = query.filter(KeywordSnapshot.bucket_start < until)
+    rows = query.order_by(KeywordSnapshot.bucket_start.asc(), KeywordSnapshot.rank.asc()).all()
+
+    days, index = [], {}
+    per_term = defaultdict(dict)
+    for row in rows:
+        if row.rank == 0:
+            index[row.bucket_start] = len(days)
+            days.append({'bucket_start': row.bucket_start.isoformat(), 'comments': row.comment_count})
+        elif bigrams or ' ' not in row.term:
+            per_term[row.term][row.bucket_start] = row
+    if terms is None:
+        totals = sorted(((sum(r.occurrence_count for r in found.values()), term) for term, found in per_term.items()),
+                        key=lambda x: (-x[0], x[1]))
+        terms = [term for _, term in totals[:limit]]
+
+    items = []
+    for term in terms:
+        found = per_term.get(term, {})
+        occurrences, comments = [None] * len(days), [None] * len(days)
+        for day, row in found.items():
+            occurrences[index[day]] = row.occurrence_count
+            comments[index[day]] = row.comment_count
+        items.append({
+            'term': term,
+            'ngram': 2 if ' ' in term else 1,
+            'total_occurrences': sum(r.occurrence_count for r in found.values()),
+            'occurrences': occurrences,
+            'comments': comments,
+        })
+    return days, items
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintain the keyword trend snapshots.')
+    parser.add_argument('command', choices=['snapshot', 'rebuild'])
+    parser.add_argument('--video', type=int, help='internal video id (default: all videos)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from app import app
+
+    with app.app_context():
+        top_k = app.config.get('KEYWORD_TREND_TOP_K', 20)
+        with db.engine.begin() as conn:
+            if args.command == 'rebuild':
+                count = rebuild(conn, args.video, top_k=top_k)
+            else:
+                count = snapshot(conn, args.video, top_k)
+    print(f"Ranked {count} video days at {datetime.now(timezone.utc).isoformat()}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
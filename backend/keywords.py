@@ -0,0 +1,292 @@
+"""
+Keyword tokenizer and the shared stopword store.
+
+Custom stopwords live in the ``stopwords`` table and every change bumps the
+single ``stopword_version`` row. Each process keeps one compiled
+``Tokenizer`` for the version it loaded last; ``refresh()`` compares the
+version (a primary-key SELECT, at most every ``STOPWORDS_CHECK_SECONDS``)
+and rebuilds the tokenizer when it changed, so a
+``PUT /api/admin/stopwords`` handled by one worker reaches every other API
+worker and worker.py within seconds.
+
+A tokenizer holds one frozenset of stopwords (built-in lists, the
+``KEYWORD_STOPWORDS`` environment variable and the table) and uses one
+module-level compiled regex: lower-cased runs of word characters and dashes
+of at least three characters, without pure numbers and stopwords. Bigrams
+join consecutive kept tokens in the same pass.
+
+Term counts of the keyword endpoints are cached per stopword version (and the
+caller's freshness key) for ``KEYWORD_CACHE_SECONDS``; a version change
+drops the cache.
+
+Usage:
+    python keywords.py list
+    python keywords.py add WORD [WORD ...]
+    python keywords.py remove WORD [WORD ...]
+"""
+
+import argparse
+import logging
+import re
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from flask import current_app
+from sqlalchemy import delete, insert, select, update
+
+from models import db, utcnow, Stopword, StopwordVersion
+
+logger = logging.getLogger(__name__)
+
+STOPWORDS_DE = frozenset({
+    'der','die','das','und','ist','im','in','den','zu','mit','von','für','dass','auf','ein','eine','einer','eines','sind','auch','als','an','am','es','ich','du','er','sie','wir','ihr','man','nicht','nur','oder','aber','wenn','wie','so','mal','noch','schon','da','hier','dann','dem','des','was','wer','wird','über','unter','mehr','weniger','kein','keine','keinen','keiner','mich','mir','dich','dir','sein','seine','seinen','seiner','ihr','ihre','ihren','ihm','ihr','euch','uns','zum','zur','beim','vom','vom','beim','einem','einen','eines','soll','sollte','kann','können','könnte','muss','müssen','müsste','wurde','würde','werden','wurden','wären',
+    # häufige Füllwörter/Verbformen
+    'hat','sehr','hast','habt','haben','hätte','hättest','hätten','immer','nie','ganz','halt'
+})
+STOPWORDS_EN = frozenset({
+    'the','and','a','an','to','of','in','on','for','is','are','was','were','it','this','that','these','those','i','you','he','she','we','they','them','us','me','my','your','his','her','our','their','or','but','if','so','as','at','by','with','from','not','no','yes','be','been','have','has','had','do','did','does','can','could','should','would','will','just','more','most','some','any','other','there','here','then','than','very','also','too','into','out','up','down'
+})
+STOPWORDS_MISC = frozenset({'http','https','www','com','net','org','youtu','youtube','video','channel','watch','amp'})
+BASE_STOPWORDS = STOPWORDS_DE | STOPWORDS_EN | STOPWORDS_MISC
+
+_VERSION_ROW = 1
+_MAX_WORD_LENGTH = 100
+# Unicode letters, digits, '_' and '-'; shorter tokens never count
+_TOKEN = re.compile(r"[\w\-]{3,}")
+
+
+class Tokenizer:
+    """Tokenizer for one stopword version."""
+
+    __slots__ = ('version', 'stopwords')
+
+    def __init__(self, version, stopwords):
+        self.version = version
+        self.stopwords = frozenset(stopwords)
+
+    def tokens(self, text):
+        stopwords = self.stopwords
+        return [t for t in _TOKEN.findall(text.lower()) if t not in stopwords and not t.isdigit()]
+
+    def terms(self, text, bigrams=True):
+        """Tokens followed by the bigrams of consecutive tokens."""
+        tokens = self.tokens(text)
+        if bigrams and len(tokens) > 1:
+            return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        return tokens
+
+
+_tokenizer = Tokenizer(None, BASE_STOPWORDS)  # replaced by the first refresh()
+_base_tokenizer = Tokenizer(None, BASE_STOPWORDS)  # never replaced (near_duplicates.py)
+_checked_at = 0.0
+_STATS_TOKENIZER_KEY = 'keyword_stats_tokenizer'
+_lock = threading.Lock()
+_cache = OrderedDict()  # (version, key, bigrams) -> (expires, occurrences, containing)
+
+
+def normalize(words):
+    """Lower-cased, stripped, de-duplicated stopwords; raises ValueError for overlong entries."""
+    cleaned = {str(w).strip().lower() for w in words if str(w).strip()}
+    too_long = [w for w in cleaned if len(w) > _MAX_WORD_LENGTH]
+    if too_long:
+        raise ValueError(f"stopwords are limited to {_MAX_WORD_LENGTH} characters: {too_long[0][:20]}...")
+    return cleaned
+
+
+def env_stopwords():
+    return normalize((current_app.config.get('KEYWORD_STOPWORDS') or '').split(','))
+
+
+def current_version():
+    return db.session.execute(
+        select(StopwordVersion.version).where(StopwordVersion.id == _VERSION_ROW)).scalar() or 0
+
+
+def custom_stopwords():
+    return set(db.session.execute(select(Stopword.word)).scalars())
+
+
+def load_tokenizer(conn):
+    """A tokenizer for the stopwords currently stored, read on ``conn`` (e.g. inside a migration)."""
+    version = conn.execute(
+        select(StopwordVersion.version).where(StopwordVersion.id == _VERSION_ROW)).scalar() or 0
+    words = set(conn.execute(select(Stopword.word)).scalars())
+    return Tokenizer(version, BASE_STOPWORDS | env_stopwords() | words)
+
+
+def refresh(force=False):
+    """The tokenizer for the current stopword version, reloaded if another process changed it.
+
+    Needs an app context. Between checks (``STOPWORDS_CHECK_SECONDS``) no query is made.
+    """
+    global _tokenizer, _checked_at
+    now = time.monotonic()
+    if not force and _tokenizer.version is not None and \
+            now - _checked_at < current_app.config.get('STOPWORDS_CHECK_SECONDS', 2):
+        return _tokenizer
+    _checked_at = now
+    version = current_version()
+    if version != _tokenizer.version:
+        with _lock:
+            if version != _tokenizer.version:
+                words = BASE_STOPWORDS | env_stopwords() | custom_stopwords()
+                _tokenizer = Tokenizer(version, words)
+                _cache.clear()
+                logger.info(f"Loaded stopword version {version} ({len(words)} stopwords)")
+    return _tokenizer
+
+
+def stats_tokenizer(session):
+    """Tokenizer for the keyword aggregates updated at flush time, or None while they are stale.
+
+    term_stats.py and keyword_trends.py hold counts made with one stopword version
+    (``stats_version``). A decrement has to tokenize the old text exactly as it was
+    counted, so deltas are only applied while that is the current version; after a
+    stopword change they are skipped until ``rebuild_keyword_stats`` in app.py has
+    recounted everything. The row is read once per transaction, FOR SHARE on Postgres
+    so that a recount waits for this transaction (and vice versa).
+    """
+    transaction = session.get_transaction()
+    cached = session.info.get(_STATS_TOKENIZER_KEY)
+    if cached is not None and cached[0] is transaction:
+        return cached[1]
+    conn = session.connection()
+    row = conn.execute(select(StopwordVersion.version, StopwordVersion.stats_version)
+                       .where(StopwordVersion.id == _VERSION_ROW).with_for_update(read=True)).first()
+    version, counted = row if row is not None else (0, 0)
+    if version != counted:
+        tokenizer = None
+    elif _tokenizer.version == version:
+        tokenizer = _tokenizer
+    else:
+        # This process has not reloaded the stopwords yet
+        tokenizer = load_tokenizer(conn)
+    session.info[_STATS_TOKENIZER_KEY] = (transaction, tokenizer)
+    return tokenizer
+
+
+def lock_stats_versions(conn):
+    """(stopword version, version the aggregates were counted with), locking the row on Postgres."""
+    row = conn.execute(select(StopwordVersion.version, StopwordVersion.stats_version)
+                       .where(StopwordVersion.id == _VERSION_ROW).with_for_update()).first()
+    return tuple(row) if row is not None else (0, 0)
+
+
+def mark_stats_counted(conn, version):
+    """Record that the keyword aggregates were recounted with stopword ``version``."""
+    table = StopwordVersion.__table__
+    conn.execute(update(table).where(table.c.id == _VERSION_ROW).values(stats_version=version))
+
+
+def tokenize(text):
+    """Tokens of ``text`` with the loaded stopwords (no query; see refresh())."""
+    return _tokenizer.tokens(text or '')
+
+
+def base_tokenize(text):
+    """Tokens of ``text`` with only the built-in stopwords, the same in every process and version."""
+    return _base_tokenizer.tokens(text or '')
+
+
+def terms(text, bigrams=True):
+    """Tokens and bigrams of ``text`` with the loaded stopwords (no query)."""
+    return _tokenizer.terms(text or '', bigrams)
+
+
+def write_stopwords(conn, words):
+    """Replace the custom stopwords on ``conn`` and bump the version (caller's transaction)."""
+    now = utcnow()
+    conn.execute(delete(Stopword.__table__))
+    if words:
+        conn.execute(insert(Stopword.__table__), [dict(word=w, added_at=now) for w in sorted(words)])
+    table = StopwordVersion.__table__
+    bumped = conn.execute(update(table).where(table.c.id == _VERSION_ROW)
+                          .values(version=table.c.version + 1, updated_at=now)).rowcount
+    if not bumped:
+        conn.execute(insert(table).values(id=_VERSION_ROW, version=1, updated_at=now))
+
+
+def save_stopwords(words):
+    """Replace the custom stopwords, commit and reload this process's tokenizer."""
+    write_stopwords(db.session.connection(), normalize(words))
+    db.session.commit()
+    return refresh(force=True)
+
+
+def count_terms(texts, bigrams=True, tokenizer=None):
+    """(occurrences, comments containing the term) Counters over ``texts``."""
+    terms_of = (tokenizer or _tokenizer).terms
+    occurrences, containing = Counter(), Counter()
+    for text in texts:
+        found = terms_of(text or '', bigrams)
+        occurrences.update(found)
+        containing.update(set(found))
+    return occurrences, containing
+
+
+def cached_counts(key, load_texts, bigrams=True):
+    """count_terms(load_texts()) cached per stopword version, ``key`` and ``bigrams``.
+
+    ``key`` must change whenever the underlying comments do (e.g. sync epoch and
+    last_synced); entries also expire after KEYWORD_CACHE_SECONDS.
+    """
+    tokenizer = refresh()
+    ttl = current_app.config.get('KEYWORD_CACHE_SECONDS', 60)
+    cache_key = (tokenizer.version, key, bigrams)
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(cache_key)
+        if entry is not None and entry[0] > now:
+            _cache.move_to_end(cache_key)
+            return entry[1], entry[2]
+    occurrences, containing = count_terms(load_texts(), bigrams, tokenizer)
+    if ttl > 0:
+        with _lock:
+            _cache[cache_key] = (now + ttl, occurrences, containing)
+            while len(_cache) > current_app.config.get('KEYWORD_CACHE_SIZE', 32):
+                _cache.popitem(last=False)
+    return occurrences, containing
+
+
+def top_terms(occurrences, containing, limit, min_occ):
+    """Keyword items by occurrences, then comments containing the term, then term length."""
+    pairs = [(term, occ) for term, occ in occurrences.items() if occ >= min_occ]
+    pairs.sort(key=lambda x: (-x[1], -containing.get(x[0], 0), -len(x[0])))
+    return [{
+        'term': term,
+        'occurrence_count': int(occ),
+        'comment_count': int(containing.get(term, 0)),
+        'ngram': 2 if ' ' in term else 1
+    } for term, occ in pairs[:limit]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage the custom keyword stopwords.')
+    parser.add_argument('command', choices=['list', 'add', 'remove'])
+    parser.add_argument('words', nargs='*')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.command != 'list' and not args.words:
+        parser.error(f"{args.command} needs at least one word")
+
+    from app import app, rebuild_keyword_stats
+
+    with app.app_context():
+        words = custom_stopwords()
+        if args.command == 'add':
+            save_stopwords(words | normalize(args.words))
+        elif args.command == 'remove':
+            save_stopwords(words - normalize(args.words))
+        if args.command != 'list' and rebuild_keyword_stats():
+            print('Recounted the keyword statistics')
+        words = custom_stopwords()
+        print(f"Stopword version {current_version()}: {len(words)} custom stopwords")
+        for word in sorted(words):
+            print(word)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""
+Run-length storage of video metric snapshots.
+
+With ``METRIC_STORAGE=runs`` (default) a sync only inserts a ``video_metrics``
+row when views, likes or comment count differ from the video's latest row;
+otherwise it moves that row's ``valid_until`` forward. A row therefore stands
+for every observation from ``recorded_at`` through ``valid_until`` with the
+same values. Runs never cross a calendar month, so a run lives entirely in the
+monthly partition of its ``recorded_at`` (see partitioning.py) and a range
+query can still bound ``recorded_at``.
+
+``METRIC_STORAGE=points`` keeps the old one-row-per-sync behaviour
+(``valid_until`` stays NULL).
+
+Readers that need points call ``expand_runs``: every run becomes its first and,
+if longer than an instant, its last observation, which reproduces the shape of
+the original step series.
+
+Usage:
+    python metric_history.py compact [--video ID] [--dry-run]   # collapse existing point history
+"""
+
+import argparse
+import logging
+import sys
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+from models import db, VideoMetric
+
+logger = logging.getLogger(__name__)
+
+_VALUES = ('view_count', 'like_count', 'comment_count')
+
+
+class MetricPoint(namedtuple('MetricPoint', ['id', 'video_id', 'recorded_at'] + list(_VALUES))):
+    """One observation expanded from a run; serializes like VideoMetric.to_dict()."""
+
+    __slots__ = ()
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'video_id': self.video_id,
+            'recorded_at': self.recorded_at.isoformat(),
+            'view_count': self.view_count,
+            'like_count': self.like_count,
+            'comment_count': self.comment_count
+        }
+
+
+def _month(when):
+    return (when.year, when.month)
+
+
+def _month_start(when):
+    return datetime(when.year, when.month, 1)
+
+
+def _same_values(metric, values):
+    return all(getattr(metric, name) == values[name] for name in _VALUES)
+
+
+def record_snapshot(video_pk, values, now, mode='runs'):
+    """Store one observation of ``values`` (view/like/comment counts) for a video.
+
+    In runs mode the latest row is extended when nothing changed and it started in
+    the current month. Returns the inserted or extended VideoMetric.
+    """
+    if mode == 'runs':
+        latest = (VideoMetric.query.filter_by(video_id=video_pk)
+                  .order_by(VideoMetric.recorded_at.desc()).first())
+        if latest is not None and _same_values(latest, values) and _month(latest.recorded_at) == _month(now):
+            latest.valid_until = now
+            return latest
+    metric = VideoMetric(video_id=video_pk, recorded_at=now, valid_until=now if mode == 'runs' else None,
+                         **{name: values[name] for name in _VALUES})
+    db.session.add(metric)
+    return metric
+
+
+def range_filter(query, since=None, until=None):
+    """Restrict a VideoMetric query to runs overlapping [since, until).
+
+    The extra ``recorded_at >= month start`` bound is implied by month-capped runs and
+    keeps partition pruning on recorded_at working.
+    """
+    if since:
+        query = query.filter(
+            VideoMetric.recorded_at >= _month_start(since),
+            or_(VideoMetric.valid_until >= since,
+                and_(VideoMetric.valid_until.is_(None), VideoMetric.recorded_at >= since)))
+    if until:
+        query = query.filter(VideoMetric.recorded_at < until)
+    return query
+
+
+def expand_runs(metrics, since=None, until=None):
+    """Turn runs (ordered by recorded_at) into observation points clipped to [since, until)."""
+    points = []
+    for m in metrics:
+        values = [getattr(m, name) for name in _VALUES]
+        times = [m.recorded_at]
+        if m.valid_until and m.valid_until > m.recorded_at:
+            times.append(m.valid_until)
+        for when in times:
+            if (since and when < since) or (until and when >= until):
+                continue
+            points.append(MetricPoint(m.id, m.video_id, when, *values))
+    return points
+
+
+def compact_history(video_pk=None, dry_run=False):
+    """Collapse consecutive identical snapshots into runs, one commit per video.
+
+    Returns (rows_before, rows_after).
+    """
+    video_pks = [video_pk] if video_pk else [
+        row[0] for row in db.session.query(VideoMetric.video_id).distinct().order_by(VideoMetric.video_id)]
+    before = after = 0
+    for pk in video_pks:
+        run = None
+        redundant = []
+        for metric in (VideoMetric.query.filter_by(video_id=pk)
+                       .order_by(VideoMetric.recorded_at.asc(), VideoMetric.id.asc()).yield_per(1000)):
+            before += 1
+            values = {name: getattr(metric, name) for name in _VALUES}
+            end = metric.valid_until or metric.recorded_at
+            if run is not None and _same_values(run, values) and _month(run.recorded_at) == _month(metric.recorded_at):
+                run.valid_until = max(run.valid_until or run.recorded_at, end)
+                redundant.append(metric.id)
+                continue
+            if metric.valid_until is None:
+                metric.valid_until = metric.recorded_at
+            run = metric
+            after += 1
+        if dry_run:
+            db.session.rollback()
+            continue
+        for start in range(0, len(redundant), 1000):
+            VideoMetric.query.filter(VideoMetric.id.in_(redundant[start:start + 1000])).delete(
+                synchronize_session=False)
+        db.session.commit()
+        if redundant:
+            logger.info(f"Video {pk}: merged {len(redundant)} metric rows")
+    return before, after
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compact the video_metrics history into runs.')
+    parser.add_argument('command', choices=['compact'])
+    parser.add_argument('--video', type=int, help='internal video id (default: all videos)')
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from app import app
+
+    with app.app_context():
+        before, after = compact_history(args.video, dry_run=args.dry_run)
+    print(f"{before} rows -> {after} runs{' (dry run)' if args.dry_run else ''}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
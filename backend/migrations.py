@@ -0,0 +1,454 @@
+"""
+Versioned schema migrations.
+
+``db.create_all()`` creates missing tables, but never touches tables that
+already exist. Everything else (new columns, new indexes, dropped indexes) is
+a numbered migration in this module. Applied versions are recorded in
+``schema_migrations``, so a normal boot costs a single SELECT; each pending
+migration runs once, in its own transaction (on Postgres under an advisory
+lock, so replicas booting together do not race).
+
+Migrations must be idempotent against a database created by the current
+``create_all()``: a fresh install runs every migration once and they all
+find the schema already in place.
+
+Usage:
+    python migrations.py status     # applied / pending versions
+    python migrations.py upgrade    # apply pending migrations
+    python migrations.py explain    # EXPLAIN the hot queries, flag scans and sorts
+    python migrations.py explain --strict   # exit code 1 on plan regressions
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+
+from sqlalchemy import inspect, select, text
+from sqlalchemy.exc import IntegrityError
+
+from models import (db, utcnow, Comment, CommentSignature, Video, VideoMetric, SchemaMigration, Stopword,
+                    StopwordVersion)
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary but fixed key for pg_advisory_xact_lock
+_ADVISORY_LOCK_KEY = 0x7475_6265
+
+MIGRATIONS = []
+
+
+def migration(version, name):
+    """Register ``func(conn)`` as migration ``version``."""
+    def register(func):
+        MIGRATIONS.append((version, name, func))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return func
+    return register
+
+
+def _add_missing_columns(conn, model, names, defaults=None):
+    """ALTER TABLE ADD COLUMN for mapped columns missing from the live table. Returns added names."""
+    table = model.__table__
+    existing = {col['name'] for col in inspect(conn).get_columns(table.name)}
+    added = []
+    for name in names:
+        if name in existing:
+            continue
+        column_type = table.c[name].type.compile(dialect=conn.dialect)
+        default = f" DEFAULT {defaults[name]}" if defaults and name in defaults else ''
+        conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {name} {column_type}{default}"))
+        added.append(f"{table.name}.{name}")
+    return added
+
+
+def _create_indexes(conn, model, names):
+    """Create the named indexes declared in ``model.__table_args__`` if they do not exist yet."""
+    for index in model.__table__.indexes:
+        if index.name in names:
+            index.create(conn, checkfirst=True)
+
+
+# -- migrations ----------------------------------------------------------
+
+@migration(1, 'legacy_runtime_columns')
+def _legacy_runtime_columns(conn):
+    # Columns previously added by the startup probe in app.py
+    added = _add_missing_columns(conn, Comment, [
+        'sentiment', 'sentiment_score', 'sentiment_label', 'last_seen', 'reinstated_at', 'seen_epoch'])
+    added += _add_missing_columns(conn, Video, ['sync_epoch', 'comment_digest'], defaults={'sync_epoch': 0})
+    if added:
+        logger.info(f"Added columns: {', '.join(added)}")
+
+
+@migration(2, 'hot_path_indexes')
+def _hot_path_indexes(conn):
+    _create_indexes(conn, Comment, {
+        'ix_comments_video_status_published', 'ix_comments_video_published', 'ix_comments_video_sentiment',
+        'ix_comments_video_likes', 'ix_comments_parent_published', 'ix_comments_deleted'})
+    _create_indexes(conn, VideoMetric, {'ix_video_metrics_video_recorded'})
+    # Left-prefixes of the composite indexes above; dropping them saves a write per insert
+    for name in ('ix_comments_video_id', 'ix_comments_parent_id', 'ix_video_metrics_video_id'):
+        conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+
+@migration(3, 'metric_runs')
+def _metric_runs(conn):
+    _add_missing_columns(conn, VideoMetric, ['valid_until'])
+
+
+@migration(4, 'sentiment_buckets_backfill')
+def _sentiment_buckets_backfill(conn):
+    # The table itself comes from create_all(); fill it from the existing comments once
+    import sentiment_trends
+    count = sentiment_trends.rebuild(conn)
+    logger.info(f"Built {count} sentiment buckets")
+
+
+@migration(5, 'reply_lookup_index')
+def _reply_lookup_index(conn):
+    _create_indexes(conn, Comment, {'ix_comments_parent_video_published'})
+    conn.execute(text("DROP INDEX IF EXISTS ix_comments_parent_published"))
+
+
+@migration(6, 'sentiment_model_stamp')
+def _sentiment_model_stamp(conn):
+    _add_missing_columns(conn, Comment, ['sentiment_model'])
+
+
+@migration(7, 'author_stats')
+def _author_stats(conn):
+    # The table itself comes from create_all(); index the author column and fill it once
+    _create_indexes(conn, Comment, {'ix_comments_author_published'})
+    import author_stats
+    count = author_stats.rebuild(conn)
+    logger.info(f"Built {count} author rows")
+
+
+@migration(8, 'stopwords_table')
+def _stopwords_table(conn):
+    # Custom stopwords used to live in instance/stopwords.json of each process
+    from flask import current_app, has_app_context
+    import keywords
+    path = os.path.join(current_app.instance_path, 'stopwords.json') if has_app_context() else None
+    words = set()
+    if path and os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if isinstance(data, list):
+                words = keywords.normalize(data)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not import {path}: {e}")
+    keywords.write_stopwords(conn, words)
+    logger.info(f"Imported {len(words)} custom stopwords")
+
+
+@migration(9, 'term_stats')
+def _term_stats(conn):
+    # The tables come from create_all(); count the existing comments once
+    import term_stats
+    count = term_stats.rebuild(conn)
+    logger.info(f"Built {count} video term rows")
+
+
+@migration(10, 'keyword_trends')
+def _keyword_trends(conn):
+    # The tables come from create_all(); count and rank the existing comments once
+    from flask import current_app, has_app_context
+    import keyword_trends
+    top_k = current_app.config.get('KEYWORD_TREND_TOP_K', 20) if has_app_context() else 20
+    count = keyword_trends.rebuild(conn, top_k=top_k)
+    logger.info(f"Ranked keywords of {count} video days")
+
+
+@migration(11, 'keyword_stats_version')
+def _keyword_stats_version(conn):
+    # Record the stopword version of the keyword aggregates; counts made before could have
+    # drifted on stopword changes, so recount them once with the current list
+    from flask import current_app, has_app_context
+    import keywords
+    import keyword_trends
+    import term_stats
+    _add_missing_columns(conn, StopwordVersion, ['stats_version'])
+    version, _ = keywords.lock_stats_versions(conn)
+    tokenizer = keywords.load_tokenizer(conn)
+    term_stats.rebuild(conn, tokenizer=tokenizer)
+    top_k = current_app.config.get('KEYWORD_TREND_TOP_K', 20) if has_app_context() else 20
+    keyword_trends.rebuild(conn, tokenizer=tokenizer, top_k=top_k)
+    keywords.mark_stats_counted(conn, version)
+
+
+@migration(12, 'near_duplicates_base_stopwords')
+def _near_duplicates_base_stopwords(conn):
+    # Signatures no longer use custom stopwords; re-index those built with them
+    from flask import current_app, has_app_context
+    import keywords
+    import near_duplicates
+    if conn.execute(select(CommentSignature.comment_pk).limit(1)).first() is None:
+        return
+    customized = conn.execute(select(Stopword.word).limit(1)).first() is not None
+    if customized or (has_app_context() and current_app.config.get('KEYWORD_STOPWORDS')):
+        count = near_duplicates.rebuild(keywords.base_tokenize, conn=conn)
+        logger.info(f"Re-indexed {count} comments for near-duplicate detection")
+
+
+@migration(13, 'comment_thread_digests')
+def _comment_thread_digests(conn):
+    # Page-position digests moved with every new thread; the thread-keyed table comes from
+    # create_all(). Forget the old rolling digests so the next sync diffs every thread once
+    conn.execute(text("DROP TABLE IF EXISTS comment_page_digests"))
+    conn.execute(Video.__table__.update().values(comment_digest=None))
+
+
+# -- runner --------------------------------------------------------------
+
+def applied_versions(engine):
+    SchemaMigration.__table__.create(engine, checkfirst=True)
+    with engine.connect() as conn:
+        return {row[0] for row in conn.execute(select(SchemaMigration.version))}
+
+
+def pending_migrations(engine):
+    applied = applied_versions(engine)
+    return [m for m in MIGRATIONS if m[0] not in applied]
+
+
+def upgrade(engine=None):
+    """Apply all pending migrations. Returns the list of versions applied by this call."""
+    engine = engine or db.engine
+    done = []
+    for version, name, func in pending_migrations(engine):
+        try:
+            with engine.begin() as conn:
+                if conn.dialect.name == 'postgresql':
+                    conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': _ADVISORY_LOCK_KEY})
+                    already = conn.execute(
+                        select(SchemaMigration.version).where(SchemaMigration.version == version)).first()
+                    if already:
+                        continue
+                func(conn)
+                conn.execute(SchemaMigration.__table__.insert().values(
+                    version=version, name=name, applied_at=utcnow()))
+        except IntegrityError:
+            # Another process recorded the same version first
+            logger.info(f"Migration {version} ({name}) was applied concurrently")
+            continue
+        logger.info(f"Applied migration {version} ({name})")
+        done.append(version)
+    return done
+
+
+# -- plan checks ---------------------------------------------------------
+
+# Hot queries of the API with the indexes they are expected to use. ``sort`` is
+# False when the index must also deliver the ORDER BY (no separate sort step).
+EXPLAIN_CHECKS = [
+    {
+        'name': 'latest_metric',
+        'sql': "SELECT * FROM video_metrics WHERE video_id = :video_id ORDER BY recorded_at DESC LIMIT 1",
+        'indexes': ['ix_video_metrics_video_recorded'],
+        'sort': False,
+    },
+    {
+        'name': 'metrics_history',
+        'sql': "SELECT * FROM video_metrics WHERE video_id = :video_id ORDER BY recorded_at",
+        'indexes': ['ix_video_metrics_video_recorded'],
+        'sort': False,
+    },
+    {
+        'name': 'comments_newest',
+        'sql': "SELECT * FROM comments WHERE video_id = :video_id ORDER BY published_at DESC LIMIT 50",
+        'indexes': ['ix_comments_video_published'],
+        'sort': False,
+    },
+    {
+        'name': 'comments_active_newest',
+        'sql': ("SELECT * FROM comments WHERE video_id = :video_id AND status = 'active' "
+                "ORDER BY published_at DESC LIMIT 50"),
+        'indexes': ['ix_comments_video_status_published'],
+        'sort': False,
+    },
+    {
+        'name': 'comments_top_liked',
+        'sql': "SELECT * FROM comments WHERE video_id = :video_id ORDER BY like_count DESC LIMIT 50",
+        'indexes': ['ix_comments_video_likes'],
+        'sort': False,
+    },
+    {
+        'name': 'comments_sentiment_count',
+        'sql': "SELECT count(*) FROM comments WHERE video_id = :video_id AND sentiment = 'positive'",
+        'indexes': ['ix_comments_video_sentiment'],
+        'sort': True,
+    },
+    {
+        'name': 'comments_deleted_count',
+        'sql': "SELECT count(*) FROM comments WHERE video_id = :video_id AND status = 'deleted'",
+        'indexes': ['ix_comments_deleted', 'ix_comments_video_status_published'],
+        'sort': True,
+    },
+    {
+        'name': 'deleted_total',
+        'sql': "SELECT count(*) FROM comments WHERE status = 'deleted'",
+        'indexes': ['ix_comments_deleted'],
+        'sort': True,
+    },
+    {
+        'name': 'replies_newest',
+        'sql': ("SELECT * FROM comments WHERE video_id = :video_id AND parent_id = :parent_id "
+                "ORDER BY published_at DESC"),
+        'indexes': ['ix_comments_parent_video_published'],
+        'sort': False,
+    },
+    {
+        'name': 'thread_reply_counts',
+        'sql': ("SELECT parent_id, count(*) FROM comments "
+                "WHERE video_id = :video_id AND parent_id IN (:parent_id) GROUP BY parent_id"),
+        'indexes': ['ix_comments_parent_video_published'],
+        'sort': True,
+    },
+    {
+        'name': 'author_comments',
+        'sql': ("SELECT * FROM comments WHERE author_channel_id = :author_channel_id "
+                "ORDER BY published_at DESC LIMIT 50"),
+        'indexes': ['ix_comments_author_published'],
+        'sort': False,
+    },
+    {
+        'name': 'top_authors_deleted',
+        'sql': ("SELECT * FROM author_stats WHERE video_id = 0 "
+                "ORDER BY deleted_count DESC, author_channel_id DESC LIMIT 50"),
+        'indexes': ['ix_author_stats_video_deleted'],
+        'sort': False,
+    },
+    {
+        'name': 'top_authors_video',
+        'sql': ("SELECT * FROM author_stats WHERE video_id = :video_id "
+                "ORDER BY comment_count DESC, author_channel_id DESC LIMIT 50"),
+        'indexes': ['ix_author_stats_video_comments'],
+        'sort': False,
+    },
+    {
+        'name': 'video_keyword_candidates',
+        'sql': ("SELECT term, occurrence_count, comment_count FROM video_terms "
+                "WHERE video_id = :video_id AND ngram IN (1, 2) AND occurrence_count >= 2 "
+                "ORDER BY occurrence_count DESC LIMIT 2000"),
+        'indexes': ['ix_video_terms_video_occurrences'],
+        'sort': False,
+    },
+    {
+        'name': 'video_keyword_trends',
+        'sql': ("SELECT * FROM keyword_snapshots WHERE video_id = :video_id "
+                "AND bucket_start >= '2024-01-01' ORDER BY bucket_start, rank"),
+        'indexes': ['keyword_snapshots_pkey', 'sqlite_autoindex_keyword_snapshots_1'],
+        'sort': False,
+    },
+]
+
+
+def _sqlite_plan(conn, sql, params):
+    rows = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params).all()
+    lines = [row[-1] for row in rows]
+    scans = [line for line in lines if line.startswith('SCAN') and ' USING ' not in line]
+    sorts = [line for line in lines if 'TEMP B-TREE' in line]
+    return lines, scans, sorts
+
+
+def _postgres_plan(conn, sql, params):
+    # Small or empty tables make the planner prefer seq scans regardless of indexes;
+    # disabling them shows whether an index is usable at all.
+    conn.execute(text("SET LOCAL enable_seqscan = off"))
+    plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"), params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    lines, scans, sorts = [], [], []
+
+    def walk(node, depth):
+        label = node['Node Type']
+        if node.get('Index Name'):
+            label += f" using {node['Index Name']}"
+        if node.get('Relation Name'):
+            label += f" on {node['Relation Name']}"
+        lines.append('  ' * depth + label)
+        if node['Node Type'] == 'Seq Scan':
+            scans.append(label)
+        if node['Node Type'] in ('Sort', 'Incremental Sort'):
+            sorts.append(label)
+        for child in node.get('Plans', []):
+            walk(child, depth + 1)
+
+    walk(plan[0]['Plan'], 0)
+    return lines, scans, sorts
+
+
+def explain_checks(engine=None):
+    """EXPLAIN every query in EXPLAIN_CHECKS. Returns one result dict per check."""
+    engine = engine or db.engine
+    results = []
+    with engine.connect() as conn:
+        params = {
+            'video_id': conn.execute(text("SELECT min(id) FROM videos")).scalar() or 1,
+            'parent_id': conn.execute(text(
+                "SELECT min(parent_id) FROM comments WHERE parent_id IS NOT NULL")).scalar() or '',
+            'author_channel_id': conn.execute(text(
+                "SELECT min(author_channel_id) FROM comments")).scalar() or '',
+        }
+        conn.rollback()
+        for check in EXPLAIN_CHECKS:
+            trans = conn.begin()
+            try:
+                if conn.dialect.name == 'postgresql':
+                    lines, scans, sorts = _postgres_plan(conn, check['sql'], params)
+                else:
+                    lines, scans, sorts = _sqlite_plan(conn, check['sql'], params)
+            finally:
+                trans.rollback()
+            plan_text = '\n'.join(lines)
+            problems = [f"full scan: {s}" for s in scans]
+            if not any(name in plan_text for name in check['indexes']):
+                problems.append(f"expected index not used: {' or '.join(check['indexes'])}")
+            if not check['sort']:
+                problems += [f"sort: {s}" for s in sorts]
+            results.append({'name': check['name'], 'ok': not problems, 'problems': problems, 'plan': lines})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='TubeTracker schema migrations and query plan checks.')
+    parser.add_argument('command', choices=['status', 'upgrade', 'explain'])
+    parser.add_argument('--strict', action='store_true', help='explain: exit with 1 if any check fails')
+    parser.add_argument('--verbose', action='store_true', help='explain: print full plans')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from app import app
+
+    with app.app_context():
+        if args.command == 'upgrade':
+            db.create_all()
+            applied = upgrade()
+            print(f"Applied: {applied}" if applied else 'Nothing to apply.')
+            return 0
+
+        if args.command == 'status':
+            applied = applied_versions(db.engine)
+            for version, name, _ in MIGRATIONS:
+                print(f"{version:>4}  {name:<32} {'applied' if version in applied else 'PENDING'}")
+            return 0
+
+        failed = 0
+        for result in explain_checks():
+            print(f"{'ok  ' if result['ok'] else 'FAIL'}  {result['name']}")
+            for problem in result['problems']:
+                print(f"        {problem}")
+            if args.verbose or not result['ok']:
+                for line in result['plan']:
+                    print(f"        | {line}")
+            failed += not result['ok']
+        print(f"\n{len(EXPLAIN_CHECKS) - failed}/{len(EXPLAIN_CHECKS)} checks passed.")
+        return 1 if failed and args.strict else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,17 @@
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from sqlalchemy import text
+from datetime import datetime, timezone
+import json
+
+from db_routing import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+def utcnow():
+    """Naive UTC now, matching how the schema stores timestamps."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
 
-db = SQLAlchemy()
 
 class Video(db.Model):
     __tablename__ = 'videos'
@@ -16,6 +26,8 @@ class Video(db.Model):
     added_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_synced = db.Column(db.DateTime)
     is_active = db.Column(db.Boolean, default=True)
+    sync_epoch = db.Column(db.Integer, default=0)  # number of the latest completed sync (see VideoSyncEpoch)
+    comment_digest = db.Column(db.String(32))  # rolling fingerprint of all comment threads at the last full fetch
     
     metrics = db.relationship('VideoMetric', backref='video', lazy='dynamic', cascade='all, delete-orphan')
     comments = db.relationship('Comment', backref='video', lazy='dynamic', cascade='all, delete-orphan')
@@ -37,10 +49,16 @@ class Video(db.Model):
 
 class VideoMetric(db.Model):
     __tablename__ = 'video_metrics'
+    # Composite indexes are created for existing databases by migrations.py; keep both in sync
+    __table_args__ = (
+        db.Index('ix_video_metrics_video_recorded', 'video_id', 'recorded_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    video_id = db.Column(db.Integer, db.ForeignKey('videos.id'), nullable=False, index=True)
+    video_id = db.Column(db.Integer, db.ForeignKey('videos.id'), nullable=False)
     recorded_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    # Last observation with identical values (run-length storage, see metric_history.py); None = single point
+    valid_until = db.Column(db.DateTime)
     view_count = db.Column(db.BigInteger, default=0)
     like_count = db.Column(db.Integer, default=0)
     comment_count = db.Column(db.Integer, default=0)
@@ -50,6 +68,7 @@ class VideoMetric(db.Model):
             'id': self.id,
             'video_id': self.video_id,
             'recorded_at': self.recorded_at.isoformat(),
+            'valid_until': self.valid_until.isoformat() if self.valid_until else None,
             'view_count': self.view_count,
             'like_count': self.like_count,
             'comment_count': self.comment_count
@@ -58,29 +77,53 @@ class VideoMetric(db.Model):
 
 class Comment(db.Model):
     __tablename__ = 'comments'
+    # Built around the filters/sorts of the comment and reply listings (video_id / parent_id
+    # prefixes replace the former single-column indexes). Created for existing databases by
+    # migrations.py; keep both in sync.
+    __table_args__ = (
+        db.Index('ix_comments_video_status_published', 'video_id', 'status', 'published_at'),
+        db.Index('ix_comments_video_published', 'video_id', 'published_at'),
+        db.Index('ix_comments_video_sentiment', 'video_id', 'sentiment'),
+        db.Index('ix_comments_video_likes', 'video_id', 'like_count'),
+        # video_id after parent_id: reply lookups filter on both, and without it SQLite prefers a
+        # video_id index for parent_id IN (...) queries
+        db.Index('ix_comments_parent_video_published', 'parent_id', 'video_id', 'published_at'),
+        # status is redundant in the key but makes the partial index covering for deleted counts
+        db.Index('ix_comments_deleted', 'video_id', 'status',
+                 sqlite_where=text("status = 'deleted'"), postgresql_where=text("status = 'deleted'")),
+        db.Index('ix_comments_author_published', 'author_channel_id', 'published_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    video_id = db.Column(db.Integer, db.ForeignKey('videos.id'), nullable=False, index=True)
+    video_id = db.Column(db.Integer, db.ForeignKey('videos.id'), nullable=False)
     comment_id = db.Column(db.String(100), unique=True, nullable=False, index=True)
-    parent_id = db.Column(db.String(100), index=True)  # For replies
+    parent_id = db.Column(db.String(100))  # For replies
     author = db.Column(db.String(200))
     author_channel_id = db.Column(db.String(100))
-    text = db.Column(db.Text)
-    like_count = db.Column(db.Integer, default=0)
+    text = db.column_property(db.Column(db.Text), active_history=True)  # old value: see status
+    like_count = db.column_property(db.Column(db.Integer, default=0), active_history=True)  # old value: see status
     published_at = db.Column(db.DateTime)
     updated_at = db.Column(db.DateTime)
-    status = db.Column(db.String(20), default='active')  # active, deleted
+    # active_history: the old value is needed at flush time to keep sentiment_buckets, author_stats and
+    # term_stats in sync
+    status = db.column_property(db.Column(db.String(20), default='active'), active_history=True)  # active, deleted
     deleted_at = db.Column(db.DateTime)
-    last_seen = db.Column(db.DateTime)
+    last_seen = db.Column(db.DateTime)  # legacy; now derived from seen_epoch / the video's sync epoch
     reinstated_at = db.Column(db.DateTime)
     first_seen = db.Column(db.DateTime, default=datetime.utcnow)
+    # Sync epoch in which this row was last written. Active comments are implicitly confirmed in the
+    # video's current epoch, so this only changes on insert, real field changes and status transitions.
+    seen_epoch = db.Column(db.Integer)
     
     # Sentiment analysis fields
-    sentiment = db.Column(db.String(20))  # positive, neutral, negative
-    sentiment_score = db.Column(db.Float)  # confidence score (0-1)
+    sentiment = db.column_property(db.Column(db.String(20)), active_history=True)  # positive, neutral, negative
+    sentiment_score = db.column_property(db.Column(db.Float), active_history=True)  # confidence score (0-1)
     sentiment_label = db.Column(db.String(50))  # raw model label (e.g., "5 stars")
+    sentiment_model = db.Column(db.String(200))  # model that produced the score; NULL = never scored
 
-    def to_dict(self):
+    def to_dict(self, last_seen=None):
+        """Serialize the comment; ``last_seen`` is the epoch-derived time (falls back to the legacy column)."""
+        last_seen = last_seen or self.last_seen
         return {
             'id': self.id,
             'video_id': self.video_id,
@@ -95,14 +138,80 @@ class Comment(db.Model):
             'status': self.status,
             'deleted_at': self.deleted_at.isoformat() if self.deleted_at else None,
             'first_seen': self.first_seen.isoformat() if self.first_seen else None,
-            'last_seen': self.last_seen.isoformat() if self.last_seen else None,
+            'last_seen': last_seen.isoformat() if last_seen else None,
             'reinstated_at': self.reinstated_at.isoformat() if self.reinstated_at else None,
             'sentiment': self.sentiment,
             'sentiment_score': self.sentiment_score,
-            'sentiment_label': self.sentiment_label
+            'sentiment_label': self.sentiment_label,
+            'sentiment_model': self.sentiment_model
+        }
+
+
+class SchemaMigration(db.Model):
+    """A migration from migrations.py that has been applied to this database."""
+    __tablename__ = 'schema_migrations'
+    version = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    applied_at = db.Column(db.DateTime, nullable=False)
+
+
+class VideoSyncEpoch(db.Model):
+    """One completed sync of a video; comments reference epochs instead of storing last_seen per sync."""
+    __tablename__ = 'video_sync_epochs'
+    __table_args__ = (db.UniqueConstraint('video_id', 'epoch', name='uq_video_sync_epochs_video_epoch'),)
+    id = db.Column(db.Integer, primary_key=True)
+    video_id = db.Column(db.Integer, db.ForeignKey('videos.id'), nullable=False, index=True)
+    epoch = db.Column(db.Integer, nullable=False)
+    synced_at = db.Column(db.DateTime, nullable=False)
+
+
+class CommentThreadDigest(db.Model):
+    """Fingerprint of one comment thread (top-level comment plus replies) as of the last sync that reconciled it."""
+    __tablename__ = 'comment_thread_digests'
+    video_id = db.Column(db.Integer, db.ForeignKey('videos.id'), primary_key=True)
+    thread_id = db.Column(db.String(100), primary_key=True)  # comment_id of the top-level comment
+    digest = db.Column(db.String(16), nullable=False)
+
+
+class ArchiveSweep(db.Model):
+    """Checkpointed full-archive pass over all comment threads of a large video.
+
+    ``page_token`` is the next commentThreads page to fetch, so an interrupted sweep
+    resumes where it stopped. Deletions are only derived once status is 'complete'.
+    """
+    __tablename__ = 'archive_sweeps'
+    id = db.Column(db.Integer, primary_key=True)
+    video_id = db.Column(db.Integer, db.ForeignKey('videos.id'), nullable=False, index=True)
+    epoch = db.Column(db.Integer, nullable=False)  # sync epoch closed by this sweep
+    status = db.Column(db.String(20), default='running', index=True)  # running, complete, abandoned
+    page_token = db.Column(db.String(500))
+    pages_done = db.Column(db.Integer, default=0)
+    comments_seen = db.Column(db.Integer, default=0)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime)
+    completed_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'video_id': self.video_id,
+            'epoch': self.epoch,
+            'status': self.status,
+            'pages_done': self.pages_done,
+            'comments_seen': self.comments_seen,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
         }
 
 
+class ArchiveSweepSeen(db.Model):
+    """Comment ids confirmed by a running sweep; cleared once the sweep completes."""
+    __tablename__ = 'archive_sweep_seen'
+    sweep_id = db.Column(db.Integer, db.ForeignKey('archive_sweeps.id'), primary_key=True)
+    comment_id = db.Column(db.String(100), primary_key=True)
+
+
 class CommentHistory(db.Model):
     __tablename__ = 'comment_history'
     id = db.Column(db.Integer, primary_key=True)
@@ -122,3 +231,386 @@ class CommentHistory(db.Model):
             'meta': self.meta,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
+
+
+class CommentRevision(db.Model):
+    """One archived version of a comment's text: a full keyframe or a delta (see comment_revisions.py)."""
+    __tablename__ = 'comment_revisions'
+    __table_args__ = (db.UniqueConstraint('comment_pk', 'revision', name='uq_comment_revisions_comment_revision'),)
+    id = db.Column(db.Integer, primary_key=True)
+    # No foreign key: comments may be hash-partitioned on Postgres (see partitioning.py)
+    comment_pk = db.Column(db.Integer, nullable=False)  # comments.id
+    revision = db.Column(db.Integer, nullable=False)  # 0 = text as first archived
+    kind = db.Column(db.String(8), nullable=False)  # full, delta
+    payload = db.Column(db.Text, nullable=False)  # full text or JSON opcodes against the previous revision
+    text_hash = db.Column(db.String(32), nullable=False)  # blake2b of the normalized text
+    length = db.Column(db.Integer, nullable=False)  # characters of the reconstructed text
+    updated_at = db.Column(db.DateTime)  # YouTube's updatedAt of this version
+    recorded_at = db.Column(db.DateTime, nullable=False)
+
+    def to_dict(self):
+        return {
+            'revision': self.revision,
+            'kind': self.kind,
+            'text_hash': self.text_hash,
+            'length': self.length,
+            'stored_bytes': len(self.payload.encode('utf-8')),
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'recorded_at': self.recorded_at.isoformat() if self.recorded_at else None
+        }
+
+
+class Stopword(db.Model):
+    """A custom keyword stopword (on top of the built-in lists in keywords.py)."""
+    __tablename__ = 'stopwords'
+    word = db.Column(db.String(100), primary_key=True)
+    added_at = db.Column(db.DateTime, nullable=False)
+
+
+class StopwordVersion(db.Model):
+    """Single row (id 1) counting changes to ``stopwords``; every process compares it to reload."""
+    __tablename__ = 'stopword_version'
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
+    # Version the keyword aggregates (term_stats.py, keyword_trends.py) were counted with
+    stats_version = db.Column(db.Integer)
+
+
+class TermStat(db.Model):
+    """Corpus-wide counts of one keyword term over active comments; term '' holds the totals (see term_stats.py)."""
+    __tablename__ = 'term_stats'
+    __table_args__ = (db.Index('ix_term_stats_occurrences', 'occurrence_count'),)
+    term = db.Column(db.String(200), primary_key=True)
+    ngram = db.Column(db.SmallInteger, nullable=False)  # 1, 2; 0 for the totals row
+    comment_count = db.Column(db.Integer, nullable=False, default=0)  # comments containing the term
+    occurrence_count = db.Column(db.Integer, nullable=False, default=0)
+    video_count = db.Column(db.Integer, nullable=False, default=0)  # videos with at least one such comment
+
+
+class TermStatDelta(db.Model):
+    """A committed change of term_stats that is not folded into it yet (see term_stats.py)."""
+    __tablename__ = 'term_stat_deltas'
+    id = db.Column(db.Integer, primary_key=True)
+    term = db.Column(db.String(200), nullable=False)
+    ngram = db.Column(db.SmallInteger, nullable=False)
+    comment_count = db.Column(db.Integer, nullable=False)
+    occurrence_count = db.Column(db.Integer, nullable=False)
+    video_count = db.Column(db.Integer, nullable=False)
+
+
+class VideoTerm(db.Model):
+    """Counts of one keyword term over a video's active comments; term '' holds the totals (see term_stats.py)."""
+    __tablename__ = 'video_terms'
+    __table_args__ = (db.Index('ix_video_terms_video_occurrences', 'video_id', 'occurrence_count'),)
+    # No foreign key, like author_stats
+    video_id = db.Column(db.Integer, primary_key=True)
+    term = db.Column(db.String(200), primary_key=True)
+    ngram = db.Column(db.SmallInteger, nullable=False)
+    comment_count = db.Column(db.Integer, nullable=False, default=0)
+    occurrence_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class KeywordBucketTerm(db.Model):
+    """Counts of one keyword term over a video's active comments published on one day (see keyword_trends.py)."""
+    __tablename__ = 'keyword_bucket_terms'
+    __table_args__ = (db.Index('ix_keyword_bucket_terms_top', 'video_id', 'bucket_start', 'occurrence_count'),)
+    video_id = db.Column(db.Integer, primary_key=True)
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    term = db.Column(db.String(200), primary_key=True)  # '' = all comments of the bucket
+    comment_count = db.Column(db.Integer, nullable=False, default=0)
+    occurrence_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class KeywordTrendDirty(db.Model):
+    """A video day whose keyword counts changed since its last snapshot."""
+    __tablename__ = 'keyword_trend_dirty'
+    video_id = db.Column(db.Integer, primary_key=True)
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+
+
+class KeywordSnapshot(db.Model):
+    """Top terms of one video and day as of the last snapshot; rank 0 (term '') counts the bucket's comments."""
+    __tablename__ = 'keyword_snapshots'
+    video_id = db.Column(db.Integer, primary_key=True)
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True)
+    term = db.Column(db.String(200), nullable=False)
+    comment_count = db.Column(db.Integer, nullable=False)
+    occurrence_count = db.Column(db.Integer, nullable=False)
+    snapshot_at = db.Column(db.DateTime, nullable=False)
+
+
+class SentimentBucket(db.Model):
+    """Sentiment counts of a video's active comments published in one hour or day (see sentiment_trends.py)."""
+    __tablename__ = 'sentiment_buckets'
+    video_id = db.Column(db.Integer, db.ForeignKey('videos.id'), primary_key=True)
+    granularity = db.Column(db.String(8), primary_key=True)  # hour, day
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    positive = db.Column(db.Integer, nullable=False, default=0)
+    neutral = db.Column(db.Integer, nullable=False, default=0)
+    negative = db.Column(db.Integer, nullable=False, default=0)
+    unscored = db.Column(db.Integer, nullable=False, default=0)
+    score_sum = db.Column(db.Float, nullable=False, default=0.0)  # sum of sentiment_score where set
+    score_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class AuthorStat(db.Model):
+    """Comments of one author on one video; video_id 0 holds the author's archive-wide totals (see author_stats.py)."""
+    __tablename__ = 'author_stats'
+    __table_args__ = (
+        # author_channel_id last: the listings break ties on it, so the index delivers the full order
+        db.Index('ix_author_stats_video_comments', 'video_id', 'comment_count', 'author_channel_id'),
+        db.Index('ix_author_stats_video_deleted', 'video_id', 'deleted_count', 'author_channel_id'),
+        db.Index('ix_author_stats_video_likes', 'video_id', 'like_count', 'author_channel_id'),
+    )
+    # No foreign key: video_id 0 is the totals row
+    author_channel_id = db.Column(db.String(100), primary_key=True)
+    video_id = db.Column(db.Integer, primary_key=True)
+    author = db.Column(db.String(200))  # latest display name
+    comment_count = db.Column(db.Integer, nullable=False, default=0)  # archived comments, deleted included
+    deleted_count = db.Column(db.Integer, nullable=False, default=0)  # currently deleted
+    reinstated_count = db.Column(db.Integer, nullable=False, default=0)  # deleted -> active transitions
+    like_count = db.Column(db.Integer, nullable=False, default=0)
+    positive = db.Column(db.Integer, nullable=False, default=0)
+    neutral = db.Column(db.Integer, nullable=False, default=0)
+    negative = db.Column(db.Integer, nullable=False, default=0)
+    unscored = db.Column(db.Integer, nullable=False, default=0)
+    first_seen = db.Column(db.DateTime)  # earliest published_at
+    last_seen = db.Column(db.DateTime)  # latest published_at
+
+    def to_dict(self):
+        return {
+            'author_channel_id': self.author_channel_id,
+            'author': self.author,
+            'video_id': self.video_id or None,
+            'comment_count': self.comment_count,
+            'deleted_count': self.deleted_count,
+            'reinstated_count': self.reinstated_count,
+            'deleted_ratio': round(self.deleted_count / self.comment_count, 4) if self.comment_count else 0.0,
+            'like_count': self.like_count,
+            'sentiment': {'positive': self.positive, 'neutral': self.neutral,
+                          'negative': self.negative, 'unscored': self.unscored},
+            'first_seen': self.first_seen.isoformat() if self.first_seen else None,
+            'last_seen': self.last_seen.isoformat() if self.last_seen else None
+        }
+
+
+class AuthorStatDelta(db.Model):
+    """A committed change of an author's archive-wide totals, not folded into author_stats yet."""
+    __tablename__ = 'author_stat_deltas'
+    id = db.Column(db.Integer, primary_key=True)
+    author_channel_id = db.Column(db.String(100), nullable=False)
+    author = db.Column(db.String(200))
+    comment_count = db.Column(db.Integer, nullable=False)
+    deleted_count = db.Column(db.Integer, nullable=False)
+    reinstated_count = db.Column(db.Integer, nullable=False)
+    like_count = db.Column(db.Integer, nullable=False)
+    positive = db.Column(db.Integer, nullable=False)
+    neutral = db.Column(db.Integer, nullable=False)
+    negative = db.Column(db.Integer, nullable=False)
+    unscored = db.Column(db.Integer, nullable=False)
+    first_seen = db.Column(db.DateTime)
+    last_seen = db.Column(db.DateTime)
+
+
+class CommentSignature(db.Model):
+    """MinHash signature of a comment's normalized text (see near_duplicates.py)."""
+    __tablename__ = 'comment_signatures'
+    # No foreign key: comments may be hash-partitioned on Postgres (see partitioning.py)
+    comment_pk = db.Column(db.Integer, primary_key=True)  # comments.id
+    video_id = db.Column(db.Integer, nullable=False)
+    published_at = db.Column(db.DateTime)
+    signature = db.Column(db.LargeBinary, nullable=False)
+
+
+class CommentLshBand(db.Model):
+    """One LSH band bucket of a comment signature; comments sharing a bucket are near-duplicate candidates."""
+    __tablename__ = 'comment_lsh_bands'
+    __table_args__ = (
+        db.Index('ix_comment_lsh_bands_video', 'video_id', 'band', 'bucket'),
+        db.Index('ix_comment_lsh_bands_published', 'published_at', 'band', 'bucket'),
+    )
+    band = db.Column(db.SmallInteger, primary_key=True)
+    bucket = db.Column(db.BigInteger, primary_key=True)
+    comment_pk = db.Column(db.Integer, primary_key=True)
+    # Copied from the comment so video and time-window lookups stay on this table
+    video_id = db.Column(db.Integer, nullable=False)
+    published_at = db.Column(db.DateTime)
+
+
+class SentimentBackfillJob(db.Model):
+    """Checkpoint of a sentiment backfill over the comments table (see sentiment_backfill.py)."""
+    __tablename__ = 'sentiment_backfill_jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    model_name = db.Column(db.String(200), nullable=False)
+    min_confidence = db.Column(db.Float)
+    status = db.Column(db.String(20), default='pending', index=True)  # pending, running, paused, done, failed
+    holder = db.Column(db.String(200))  # process running the job
+    last_comment_id = db.Column(db.Integer, default=0)  # keyset checkpoint: comments.id <= this are done
+    max_comment_id = db.Column(db.Integer)  # newer comments are scored by the syncs that insert them
+    total_estimate = db.Column(db.Integer, default=0)  # candidates counted when the job was created
+    processed = db.Column(db.Integer, default=0)
+    scored = db.Column(db.Integer, default=0)  # ran inference
+    relabeled = db.Column(db.Integer, default=0)  # label re-derived from the stored score
+    skipped = db.Column(db.Integer, default=0)  # changed by a sync while being scored
+    active_seconds = db.Column(db.Float, default=0.0)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        rate = self.processed / self.active_seconds if self.active_seconds else None
+        remaining = max(0, (self.total_estimate or 0) - (self.processed or 0))
+        return {
+            'id': self.id,
+            'model_name': self.model_name,
+            'min_confidence': self.min_confidence,
+            'status': self.status,
+            'holder': self.holder,
+            'last_comment_id': self.last_comment_id,
+            'max_comment_id': self.max_comment_id,
+            'total_estimate': self.total_estimate,
+            'processed': self.processed,
+            'scored': self.scored,
+            'relabeled': self.relabeled,
+            'skipped': self.skipped,
+            'comments_per_second': round(rate, 2) if rate else None,
+            'eta_seconds': round(remaining / rate) if rate and self.status != 'done' else None,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class ImportJob(db.Model):
+    """Bulk import of a channel, playlist or URL list (see bulk_import.py)."""
+    __tablename__ = 'import_jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    source_type = db.Column(db.String(20))  # channel, playlist, urls
+    source = db.Column(db.Text)  # channel ref / playlist id / JSON list of URLs
+    status = db.Column(db.String(20), default='pending', index=True)  # pending, resolving, importing, syncing, done, failed
+    max_videos = db.Column(db.Integer)
+    total_videos = db.Column(db.Integer, default=0)  # resolved video ids
+    created_videos = db.Column(db.Integer, default=0)
+    existing_videos = db.Column(db.Integer, default=0)  # already tracked (inactive ones are reactivated)
+    missing_videos = db.Column(db.Integer, default=0)  # not returned by videos.list (private, deleted)
+    synced_videos = db.Column(db.Integer, default=0)  # comment backfill finished
+    failed_syncs = db.Column(db.Integer, default=0)
+    failures = db.Column(db.Text)  # JSON list of {video_id, error}, capped
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        to_sync = self.created_videos or 0
+        return {
+            'id': self.id,
+            'source_type': self.source_type,
+            'source': json.loads(self.source) if self.source_type == 'urls' else self.source,
+            'status': self.status,
+            'max_videos': self.max_videos,
+            'total_videos': self.total_videos,
+            'created_videos': self.created_videos,
+            'existing_videos': self.existing_videos,
+            'missing_videos': self.missing_videos,
+            'synced_videos': self.synced_videos,
+            'failed_syncs': self.failed_syncs,
+            'progress': round(((self.synced_videos or 0) + (self.failed_syncs or 0)) / to_sync, 4) if to_sync
+            else (1.0 if self.status == 'done' else 0.0),
+            'failures': json.loads(self.failures) if self.failures else [],
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class SyncRun(db.Model):
+    """Summary of one sync run (a single video or a full sync_all_videos tick)."""
+    __tablename__ = 'sync_runs'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), index=True)  # 'video' or 'all'
+    video_id = db.Column(db.Integer, db.ForeignKey('videos.id'), index=True)  # None for 'all'
+    status = db.Column(db.String(20), index=True)  # ok, error
+    error = db.Column(db.Text)
+    started_at = db.Column(db.DateTime, index=True)
+    finished_at = db.Column(db.DateTime)
+    duration_seconds = db.Column(db.Float)
+    api_calls = db.Column(db.Integer, default=0)
+    db_statements = db.Column(db.Integer, default=0)
+    comments_processed = db.Column(db.Integer, default=0)
+    stats = db.Column(db.Text)  # JSON: per-outcome comment counts and sentiment batch stats
+    phases = db.Column(db.Text)  # JSON: phase -> {seconds, api_calls, db_statements}
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'video_id': self.video_id,
+            'status': self.status,
+            'error': self.error,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'duration_seconds': self.duration_seconds,
+            'api_calls': self.api_calls,
+            'db_statements': self.db_statements,
+            'comments_processed': self.comments_processed,
+            'stats': json.loads(self.stats) if self.stats else {},
+            'phases': json.loads(self.phases) if self.phases else {}
+        }
+
+
+class SyncNode(db.Model):
+    """A backend process taking part in coordinated syncing (see coordination.py)."""
+    __tablename__ = 'sync_nodes'
+    node_id = db.Column(db.String(200), primary_key=True)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_heartbeat = db.Column(db.DateTime, index=True)
+
+    def to_dict(self):
+        return {
+            'node_id': self.node_id,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'last_heartbeat': self.last_heartbeat.isoformat() if self.last_heartbeat else None
+        }
+
+
+class SyncLease(db.Model):
+    """Named, expiring lease; one row per scheduled tick ('tick:<minute>') or other singleton job."""
+    __tablename__ = 'sync_leases'
+    name = db.Column(db.String(200), primary_key=True)
+    holder = db.Column(db.String(200))
+    acquired_at = db.Column(db.DateTime)
+    expires_at = db.Column(db.DateTime, index=True)
+
+
+class SyncWorkItem(db.Model):
+    """One video to sync within a scheduled tick, claimed by exactly one node at a time."""
+    __tablename__ = 'sync_work_items'
+    __table_args__ = (db.UniqueConstraint('tick', 'video_id', name='uq_sync_work_items_tick_video'),)
+    id = db.Column(db.Integer, primary_key=True)
+    tick = db.Column(db.String(200), nullable=False, index=True)
+    video_id = db.Column(db.Integer, db.ForeignKey('videos.id'), nullable=False)
+    status = db.Column(db.String(20), default='pending', index=True)  # pending, claimed, done, failed
+    claimed_by = db.Column(db.String(200))
+    lease_expires_at = db.Column(db.DateTime)
+    attempts = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'tick': self.tick,
+            'video_id': self.video_id,
+            'status': self.status,
+            'claimed_by': self.claimed_by,
+            'lease_expires_at': self.lease_expires_at.isoformat() if self.lease_expires_at else None,
+            'attempts': self.attempts,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
@@ -0,0 +1,348 @@
+"""
+Near-duplicate comment detection with MinHash and locality-sensitive hashing.
+
+Every comment text is tokenized with the keyword tokenizer (lower-cased words,
+built-in stopwords and short tokens removed) and turned into a set of word bigrams. A
+MinHash signature of ``NUM_PERM`` values estimates the Jaccard similarity of
+two such sets: the fraction of equal positions. The signature is cut into
+``BANDS`` bands of ``ROWS`` values; each band is hashed into a bucket and
+stored in ``comment_lsh_bands``. Two comments with Jaccard similarity s share
+at least one bucket with probability 1 - (1 - s^ROWS)^BANDS, i.e. pairs
+above ~0.77 are almost always found and pairs below ~0.5 almost never, so
+lookups only compare a comment against its bucket mates instead of the
+whole table.
+
+Signatures and bands are written by a session ``after_flush`` hook for
+inserted comments and text edits, in the same transaction. Comments with
+fewer than ``MIN_TOKENS`` tokens are not indexed (too short to tell copies
+from coincidence). Custom stopwords are deliberately left out: a stopword
+change would otherwise leave old and new signatures unable to match.
+
+Usage:
+    python near_duplicates.py rebuild [--video ID]   # (re)index existing comments
+"""
+
+import argparse
+import contextlib
+import hashlib
+import logging
+import random
+import struct
+import sys
+from collections import defaultdict
+
+from sqlalchemy import delete, event, func, inspect, select, tuple_
+
+from models import db, Comment, CommentSignature, CommentLshBand
+
+logger = logging.getLogger(__name__)
+
+NUM_PERM = 64
+BANDS = 8
+ROWS = NUM_PERM // BANDS
+MIN_TOKENS = 3
+DEFAULT_THRESHOLD = 0.8
+
+_PRIME = (1 << 61) - 1
+_MASK = 0xFFFFFFFF
+_rng = random.Random(0x6d696e68)  # fixed seed: signatures must be identical across processes and restarts
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+_PACK = struct.Struct(f'<{NUM_PERM}I')
+_CHUNK = 300
+
+
+def _hash64(value):
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def signature(tokens):
+    """MinHash signature (tuple of NUM_PERM ints) of the token bigrams, or None for short texts."""
+    if len(tokens) < MIN_TOKENS:
+        return None
+    hashes = {_hash64(f"{a} {b}") for a, b in zip(tokens, tokens[1:])}
+    return tuple(min(((a * h + b) % _PRIME) & _MASK for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def band_keys(sig):
+    """(band, bucket) pairs of a signature; bucket is a signed 64-bit hash of the band's rows."""
+    packed = _PACK.pack(*sig)
+    keys = []
+    for band in range(BANDS):
+        rows = packed[band * ROWS * 4:(band + 1) * ROWS * 4]
+        keys.append((band, int.from_bytes(hashlib.blake2b(rows, digest_size=8).digest(), 'little', signed=True)))
+    return keys
+
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+
+def _pack(sig):
+    return _PACK.pack(*sig)
+
+
+def _unpack(blob):
+    return _PACK.unpack(bytes(blob))
+
+
+def _index_rows(comments, tokenize):
+    """Signature and band rows for (pk, video_id, published_at, text) tuples."""
+    signatures, bands = [], []
+    for pk, video_pk, published_at, text in comments:
+        sig = signature(tokenize(text or ''))
+        if sig is None:
+            continue
+        signatures.append({'comment_pk': pk, 'video_id': video_pk, 'published_at': published_at,
+                           'signature': _pack(sig)})
+        bands.extend({'band': band, 'bucket': bucket, 'comment_pk': pk, 'video_id': video_pk,
+                      'published_at': published_at} for band, bucket in band_keys(sig))
+    return signatures, bands
+
+
+def _write(conn, signatures, bands):
+    if signatures:
+        conn.execute(CommentSignature.__table__.insert(), signatures)
+    if bands:
+        conn.execute(CommentLshBand.__table__.insert(), bands)
+
+
+def _remove(conn, pks):
+    """Drop signatures and bands of the given comments (bands located via the stored signature)."""
+    bands = CommentLshBand.__table__
+    for start in range(0, len(pks), _CHUNK):
+        chunk = pks[start:start + _CHUNK]
+        keys = [(band, bucket, pk) for pk, blob in conn.execute(
+            select(CommentSignature.comment_pk, CommentSignature.signature)
+            .where(CommentSignature.comment_pk.in_(chunk)))
+            for band, bucket in band_keys(_unpack(blob))]
+        for k in range(0, len(keys), _CHUNK):
+            conn.execute(delete(bands).where(
+                tuple_(bands.c.band, bands.c.bucket, bands.c.comment_pk).in_(keys[k:k + _CHUNK])))
+        conn.execute(delete(CommentSignature.__table__).where(CommentSignature.comment_pk.in_(chunk)))
+
+
+# -- maintenance at flush time -------------------------------------------
+
+_tokenize = None
+
+
+def _index_flushed(session, flush_context):
+    added, changed, removed = [], [], []
+    for obj in session.new:
+        if isinstance(obj, Comment):
+            added.append(obj)
+    for obj in session.dirty:
+        if isinstance(obj, Comment) and inspect(obj).attrs.text.history.has_changes():
+            changed.append(obj)
+    for obj in session.deleted:
+        if isinstance(obj, Comment):
+            removed.append(obj)
+    if not (added or changed or removed):
+        return
+    conn = session.connection()
+    stale = [c.id for c in changed + removed if c.id is not None]
+    if stale:
+        _remove(conn, stale)
+    _write(conn, *_index_rows([(c.id, c.video_id, c.published_at, c.text) for c in added + changed], _tokenize))
+
+
+def install(session_class, tokenize):
+    """Index comment texts on every flush of ``session_class`` using ``tokenize``. Idempotent."""
+    global _tokenize
+    _tokenize = tokenize
+    if not event.contains(session_class, 'after_flush', _index_flushed):
+        event.listen(session_class, 'after_flush', _index_flushed)
+
+
+def rebuild(tokenize, video_pk=None, chunk_size=2000, conn=None):
+    """Recompute signatures and bands from the comments table, one commit per chunk.
+
+    With ``conn`` everything runs in the caller's transaction instead (migrations).
+    Returns the number of indexed comments.
+    """
+    outer = conn
+
+    def transaction():
+        return contextlib.nullcontext(outer) if outer is not None else db.engine.begin()
+
+    with transaction() as conn:
+        if video_pk is None:
+            conn.execute(delete(CommentLshBand.__table__))
+            conn.execute(delete(CommentSignature.__table__))
+        else:
+            conn.execute(delete(CommentLshBand.__table__).where(CommentLshBand.video_id == video_pk))
+            conn.execute(delete(CommentSignature.__table__).where(CommentSignature.video_id == video_pk))
+    indexed = 0
+    last_id = 0
+    while True:
+        query = (select(Comment.id, Comment.video_id, Comment.published_at, Comment.text)
+                 .where(Comment.id > last_id).order_by(Comment.id).limit(chunk_size))
+        if video_pk is not None:
+            query = query.where(Comment.video_id == video_pk)
+        with transaction() as conn:
+            rows = conn.execute(query).all()
+            if not rows:
+                return indexed
+            signatures, bands = _index_rows(rows, tokenize)
+            _write(conn, signatures, bands)
+        indexed += len(signatures)
+        last_id = rows[-1][0]
+        logger.info(f"Indexed {indexed} comments (up to id {last_id})")
+
+
+# -- lookups -------------------------------------------------------------
+
+def _load_signatures(pks):
+    info = {}
+    pks = list(pks)
+    for start in range(0, len(pks), _CHUNK):
+        for row in db.session.execute(
+                select(CommentSignature.comment_pk, CommentSignature.video_id, CommentSignature.published_at,
+                       CommentSignature.signature)
+                .where(CommentSignature.comment_pk.in_(pks[start:start + _CHUNK]))):
+            info[row.comment_pk] = (row.video_id, row.published_at, _unpack(row.signature))
+    return info
+
+
+def _bucket_members(keys, max_candidates, *criteria):
+    """comment pks per (band, bucket), stopping after ``max_candidates`` rows. Returns (members, truncated)."""
+    members = defaultdict(list)
+    fetched = 0
+    for start in range(0, len(keys), _CHUNK):
+        rows = db.session.execute(
+            select(CommentLshBand.band, CommentLshBand.bucket, CommentLshBand.comment_pk)
+            .where(tuple_(CommentLshBand.band, CommentLshBand.bucket).in_(keys[start:start + _CHUNK]), *criteria)
+            .limit(max_candidates - fetched + 1)).all()
+        for band, bucket, pk in rows:
+            members[(band, bucket)].append(pk)
+        fetched += len(rows)
+        if fetched > max_candidates:
+            return members, True
+    return members, False
+
+
+def _clusters(members, threshold):
+    """Union-find over bucket mates that reach ``threshold`` against their bucket's first member.
+
+    Comparing with one pivot per bucket keeps the work linear in the bucket size even for
+    large spam waves. Returns a list of cluster dicts, largest first.
+    """
+    info = _load_signatures({pk for pks in members.values() for pk in pks})
+    parent = {}
+
+    def find(pk):
+        parent.setdefault(pk, pk)
+        while parent[pk] != pk:
+            parent[pk] = parent[parent[pk]]
+            pk = parent[pk]
+        return pk
+
+    lowest = {}
+    for pks in members.values():
+        pks = [pk for pk in dict.fromkeys(pks) if pk in info]
+        if len(pks) < 2:
+            continue
+        pivot = pks[0]
+        for pk in pks[1:]:
+            root_a, root_b = find(pivot), find(pk)
+            if root_a == root_b:
+                continue
+            sim = similarity(info[pivot][2], info[pk][2])
+            if sim >= threshold:
+                parent[root_b] = root_a
+                lowest[root_a] = min(sim, lowest.get(root_a, 1.0), lowest.pop(root_b, 1.0))
+
+    groups = defaultdict(list)
+    for pk in parent:
+        groups[find(pk)].append(pk)
+    clusters = []
+    for root, pks in groups.items():
+        if len(pks) < 2:
+            continue
+        pks.sort(key=lambda pk: (info[pk][1] is None, info[pk][1], pk))
+        published = [info[pk][1] for pk in pks if info[pk][1] is not None]
+        clusters.append({
+            'comment_pks': pks,
+            'size': len(pks),
+            'video_ids': sorted({info[pk][0] for pk in pks}),
+            'min_similarity': round(lowest.get(root, 1.0), 4),
+            'first_published': min(published) if published else None,
+            'last_published': max(published) if published else None,
+        })
+    clusters.sort(key=lambda c: (-c['size'], c['comment_pks'][0]))
+    return clusters
+
+
+def matches_for_comment(comment_pk, threshold=DEFAULT_THRESHOLD, limit=50, max_candidates=5000):
+    """Comments similar to one comment as [(comment_pk, similarity)], most similar first.
+
+    Returns None if the comment has no signature (too short or not indexed).
+    """
+    own = _load_signatures([comment_pk]).get(comment_pk)
+    if own is None:
+        return None
+    rows = db.session.execute(
+        select(CommentLshBand.comment_pk)
+        .where(tuple_(CommentLshBand.band, CommentLshBand.bucket).in_(band_keys(own[2])),
+               CommentLshBand.comment_pk != comment_pk)
+        .distinct().limit(max_candidates)).all()
+    info = _load_signatures([row[0] for row in rows])
+    scored = [(pk, similarity(own[2], sig)) for pk, (_, _, sig) in info.items()]
+    scored = [(pk, round(sim, 4)) for pk, sim in scored if sim >= threshold]
+    scored.sort(key=lambda item: (-item[1], item[0]))
+    return scored[:limit]
+
+
+def clusters_for_video(video_pk, threshold=DEFAULT_THRESHOLD, min_size=2, limit=20, max_candidates=50000):
+    """Near-duplicate clusters that contain at least one comment of the video (across all videos).
+
+    Returns (clusters, truncated).
+    """
+    keys = [tuple(row) for row in db.session.execute(
+        select(CommentLshBand.band, CommentLshBand.bucket).where(CommentLshBand.video_id == video_pk).distinct())]
+    members, truncated = _bucket_members(keys, max_candidates)
+    clusters = [c for c in _clusters(members, threshold) if c['size'] >= min_size and video_pk in c['video_ids']]
+    return clusters[:limit], truncated
+
+
+def clusters_in_window(since, until, threshold=DEFAULT_THRESHOLD, min_size=3, min_videos=2, limit=20,
+                       max_buckets=5000, max_candidates=50000):
+    """Near-duplicate clusters among comments published in [since, until), e.g. spam waves.
+
+    Only buckets holding at least ``min_size`` comments of the window are expanded.
+    Returns (clusters, truncated).
+    """
+    window = (CommentLshBand.published_at >= since, CommentLshBand.published_at < until)
+    keys = [(band, bucket) for band, bucket, _ in db.session.execute(
+        select(CommentLshBand.band, CommentLshBand.bucket, func.count())
+        .where(*window)
+        .group_by(CommentLshBand.band, CommentLshBand.bucket)
+        .having(func.count() >= min_size)
+        .order_by(func.count().desc())
+        .limit(max_buckets + 1))]
+    truncated = len(keys) > max_buckets
+    members, more = _bucket_members(keys[:max_buckets], max_candidates, *window)
+    clusters = [c for c in _clusters(members, threshold)
+                if c['size'] >= min_size and len(c['video_ids']) >= min_videos]
+    return clusters[:limit], truncated or more
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintain the near-duplicate (MinHash LSH) index.')
+    parser.add_argument('command', choices=['rebuild'])
+    parser.add_argument('--video', type=int, help='internal video id (default: all videos)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from app import app
+    import keywords
+
+    with app.app_context():
+        count = rebuild(keywords.base_tokenize, args.video)
+    print(f"Indexed {count} comments")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,373 @@
+"""
+Optional native Postgres partitioning for ``video_metrics`` and ``comments``.
+
+* ``video_metrics`` is range-partitioned by month on ``recorded_at``
+  (``video_metrics_y2025m01`` ...) plus a DEFAULT partition. Retention drops
+  whole monthly partitions instead of deleting rows.
+* ``comments`` is hash-partitioned on ``video_id`` (``comments_p00`` ...), so
+  every per-video query touches a single partition.
+
+Converting a live table is done online in steps that can be re-run:
+
+1. ``prepare``: a trigger records the ids of changed rows in
+   ``<table>_partition_changes`` and an empty partitioned copy
+   ``<table>_partitioned`` is created (sharing the id sequence).
+2. ``copy``: existing rows are copied in id batches, one commit each.
+3. ``catch-up``: rows changed since then are re-copied from the change log.
+4. ``swap``: under a short ACCESS EXCLUSIVE lock the last changes are applied
+   and the tables and indexes are renamed; the original table stays around as
+   ``<table>_unpartitioned`` until ``finalize`` drops it.
+
+``convert`` runs steps 1-4 in a row.
+
+Partitioned tables need the partition key in every unique constraint: the
+primary keys become (id, recorded_at) and (id, video_id) and the
+``comment_id`` unique index becomes (comment_id, video_id). Foreign keys that
+point at ``comments`` (``comment_history.comment_id``) are dropped on swap.
+
+Usage:
+    python partitioning.py status
+    python partitioning.py convert video_metrics
+    python partitioning.py convert comments --hash-partitions 16 --batch-size 5000
+    python partitioning.py finalize comments
+    python partitioning.py maintain          # create upcoming months, apply METRICS_RETENTION_MONTHS
+    python partitioning.py drop-metrics --before 2024-01 [--detach-only]
+"""
+
+import argparse
+import logging
+import re
+import sys
+import time
+from datetime import datetime
+
+from sqlalchemy import text
+
+from models import db, utcnow
+
+logger = logging.getLogger(__name__)
+
+METRICS_TABLE = 'video_metrics'
+COMMENTS_TABLE = 'comments'
+PARTITION_KEYS = {METRICS_TABLE: 'recorded_at', COMMENTS_TABLE: 'video_id'}
+
+_BOUND_RE = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+_INDEX_RE = re.compile(r"^CREATE (UNIQUE )?INDEX (\S+) ON (\S+) USING (\w+) \((.*?)\)( WHERE .*)?$")
+
+
+def _month_start(when):
+    return datetime(when.year, when.month, 1)
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def metric_partition_name(month):
+    return f"{METRICS_TABLE}_y{month.year}m{month.month:02d}"
+
+
+def is_partitioned(conn, table):
+    if conn.dialect.name != 'postgresql':
+        return False
+    return conn.execute(text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:t)"),
+                        {'t': table}).first() is not None
+
+
+def metric_partitions(conn, table=METRICS_TABLE):
+    """Return ``[(name, lower, upper)]`` of the monthly partitions, oldest first (DEFAULT excluded)."""
+    rows = conn.execute(text("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(:t)
+    """), {'t': table}).all()
+    partitions = []
+    for name, bound in rows:
+        match = _BOUND_RE.search(bound or '')
+        if match:
+            partitions.append((name, datetime.fromisoformat(match.group(1)), datetime.fromisoformat(match.group(2))))
+    return sorted(partitions, key=lambda p: p[1])
+
+
+def ensure_metric_partitions(conn, months_ahead, start=None, table=METRICS_TABLE):
+    """Create monthly partitions from ``start`` (default: this month) through ``months_ahead`` months.
+
+    Partitions must exist before rows for their month arrive; otherwise the
+    rows land in the DEFAULT partition and that month can no longer be
+    attached without first moving them out.
+    """
+    month = _month_start(start or utcnow())
+    last = _add_months(_month_start(utcnow()), months_ahead)
+    created = []
+    existing = {name for name, _, _ in metric_partitions(conn, table)}
+    while month <= last:
+        name = metric_partition_name(month)
+        if name not in existing:
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"))
+            created.append(name)
+        month = _add_months(month, 1)
+    return created
+
+
+def drop_metric_partitions(conn, before, detach_only=False):
+    """Detach (and unless ``detach_only``, drop) monthly partitions that end on or before ``before``."""
+    removed = []
+    for name, _, upper in metric_partitions(conn):
+        if upper <= before:
+            conn.execute(text(f"ALTER TABLE {METRICS_TABLE} DETACH PARTITION {name}"))
+            if not detach_only:
+                conn.execute(text(f"DROP TABLE {name}"))
+            removed.append(name)
+    return removed
+
+
+def maintain_partitions(engine, months_ahead, retention_months):
+    """Scheduled upkeep: pre-create upcoming metric partitions and apply retention.
+
+    No-op unless ``video_metrics`` is partitioned. Returns (created, removed).
+    """
+    with engine.begin() as conn:
+        if not is_partitioned(conn, METRICS_TABLE):
+            return [], []
+        created = ensure_metric_partitions(conn, months_ahead)
+        removed = []
+        if retention_months > 0:
+            removed = drop_metric_partitions(conn, _add_months(_month_start(utcnow()), -retention_months))
+    if created or removed:
+        logger.info(f"Metric partitions created: {created or '-'}; removed: {removed or '-'}")
+    return created, removed
+
+
+class OnlinePartitioner:
+    """Moves an existing table into a partitioned copy while the app keeps writing to it.
+
+    Args:
+        engine: SQLAlchemy engine (Postgres)
+        table: 'video_metrics' or 'comments'
+        batch_size: rows per copy / catch-up transaction
+        hash_partitions: number of hash partitions for comments
+        months_ahead: monthly metric partitions to create beyond the current month
+        lock_timeout_ms: how long the swap waits for its table lock before giving up
+    """
+
+    def __init__(self, engine, table, batch_size=5000, hash_partitions=16, months_ahead=3, lock_timeout_ms=5000):
+        if table not in PARTITION_KEYS:
+            raise ValueError(f"Unsupported table {table!r}")
+        if engine.dialect.name != 'postgresql':
+            raise RuntimeError('Native partitioning requires PostgreSQL')
+        self.engine = engine
+        self.table = table
+        self.key = PARTITION_KEYS[table]
+        self.new = f"{table}_partitioned"
+        self.old = f"{table}_unpartitioned"
+        self.changes = f"{table}_partition_changes"
+        self.batch_size = batch_size
+        self.hash_partitions = hash_partitions
+        self.months_ahead = months_ahead
+        self.lock_timeout_ms = lock_timeout_ms
+
+    def _exists(self, conn, name):
+        return conn.execute(text("SELECT to_regclass(:t)"), {'t': name}).scalar() is not None
+
+    def prepare(self):
+        with self.engine.begin() as conn:
+            if is_partitioned(conn, self.table):
+                raise RuntimeError(f"{self.table} is already partitioned")
+            conn.execute(text(f"CREATE TABLE IF NOT EXISTS {self.changes} (id BIGINT PRIMARY KEY)"))
+            conn.execute(text(f"""
+                CREATE OR REPLACE FUNCTION {self.changes}_capture() RETURNS trigger AS $$
+                BEGIN
+                    IF TG_OP = 'DELETE' THEN
+                        INSERT INTO {self.changes} (id) VALUES (OLD.id) ON CONFLICT DO NOTHING;
+                    ELSE
+                        INSERT INTO {self.changes} (id) VALUES (NEW.id) ON CONFLICT DO NOTHING;
+                    END IF;
+                    RETURN NULL;
+                END $$ LANGUAGE plpgsql
+            """))
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {self.changes}_trigger ON {self.table}"))
+            conn.execute(text(
+                f"CREATE TRIGGER {self.changes}_trigger AFTER INSERT OR UPDATE OR DELETE ON {self.table} "
+                f"FOR EACH ROW EXECUTE FUNCTION {self.changes}_capture()"))
+            if self._exists(conn, self.new):
+                return
+            if self.table == METRICS_TABLE:
+                clause = f"RANGE ({self.key})"
+            else:
+                clause = f"HASH ({self.key})"
+            # INCLUDING DEFAULTS keeps the nextval() default, so both tables share the id sequence
+            conn.execute(text(
+                f"CREATE TABLE {self.new} (LIKE {self.table} INCLUDING DEFAULTS) PARTITION BY {clause}"))
+            conn.execute(text(f"ALTER TABLE {self.new} ADD PRIMARY KEY (id, {self.key})"))
+            conn.execute(text(
+                f"ALTER TABLE {self.new} ADD FOREIGN KEY (video_id) REFERENCES videos (id)"))
+            if self.table == METRICS_TABLE:
+                first = conn.execute(text(f"SELECT min(recorded_at) FROM {self.table}")).scalar()
+                ensure_metric_partitions(conn, self.months_ahead, start=first, table=self.new)
+                conn.execute(text(f"CREATE TABLE {METRICS_TABLE}_default PARTITION OF {self.new} DEFAULT"))
+            else:
+                for remainder in range(self.hash_partitions):
+                    conn.execute(text(
+                        f"CREATE TABLE {self.table}_p{remainder:02d} PARTITION OF {self.new} "
+                        f"FOR VALUES WITH (MODULUS {self.hash_partitions}, REMAINDER {remainder})"))
+        logger.info(f"Prepared {self.new} and change capture on {self.table}")
+
+    def copy(self):
+        """Copy all rows that existed when the copy started, one id range per transaction."""
+        with self.engine.connect() as conn:
+            high = conn.execute(text(f"SELECT max(id) FROM {self.table}")).scalar() or 0
+            low = conn.execute(text(f"SELECT coalesce(max(id), 0) FROM {self.new}")).scalar()
+            conn.rollback()
+            copied = 0
+            started = time.monotonic()
+            while low < high:
+                upper = low + self.batch_size
+                with conn.begin():
+                    result = conn.execute(text(
+                        f"INSERT INTO {self.new} SELECT * FROM {self.table} WHERE id > :low AND id <= :upper "
+                        f"ON CONFLICT DO NOTHING"), {'low': low, 'upper': upper})
+                copied += result.rowcount or 0
+                low = upper
+                logger.info(f"{self.table}: copied {copied} rows (id <= {min(low, high)} of {high}, "
+                            f"{copied / max(time.monotonic() - started, 1e-6):.0f} rows/s)")
+        return copied
+
+    def _create_indexes(self):
+        """Recreate the source table's secondary indexes on the partitioned copy (suffix ``_p``)."""
+        with self.engine.begin() as conn:
+            rows = conn.execute(text("""
+                SELECT i.indexname, i.indexdef FROM pg_indexes i
+                JOIN pg_class c ON c.relname = i.indexname
+                JOIN pg_index x ON x.indexrelid = c.oid
+                WHERE i.tablename = :t AND NOT x.indisprimary
+            """), {'t': self.table}).all()
+            for name, definition in rows:
+                match = _INDEX_RE.match(definition)
+                if not match:
+                    logger.warning(f"Skipping index {name}: cannot rewrite {definition!r}")
+                    continue
+                unique, _, _, method, columns, where = match.groups()
+                if unique and self.key not in [c.strip() for c in columns.split(',')]:
+                    # Unique indexes on partitioned tables must contain the partition key
+                    columns = f"{columns}, {self.key}"
+                conn.execute(text(
+                    f"CREATE {unique or ''}INDEX IF NOT EXISTS {name}_p ON {self.new} "
+                    f"USING {method} ({columns}){where or ''}"))
+
+    def _apply_changes(self, conn, limit=None):
+        query = f"DELETE FROM {self.changes} WHERE id IN (SELECT id FROM {self.changes}"
+        query += f" LIMIT {int(limit)})" if limit else ")"
+        ids = [row[0] for row in conn.execute(text(query + " RETURNING id"))]
+        if ids:
+            conn.execute(text(f"DELETE FROM {self.new} WHERE id = ANY(:ids)"), {'ids': ids})
+            conn.execute(text(f"INSERT INTO {self.new} SELECT * FROM {self.table} WHERE id = ANY(:ids)"),
+                         {'ids': ids})
+        return len(ids)
+
+    def catch_up(self):
+        """Re-copy changed rows in batches until the change log is down to less than one batch."""
+        total = 0
+        with self.engine.connect() as conn:
+            while True:
+                with conn.begin():
+                    applied = self._apply_changes(conn, self.batch_size)
+                total += applied
+                if applied < self.batch_size:
+                    break
+        logger.info(f"{self.table}: re-copied {total} changed rows")
+        return total
+
+    def swap(self):
+        """Apply the remaining changes and exchange the tables under a short exclusive lock."""
+        with self.engine.begin() as conn:
+            conn.execute(text(f"SET LOCAL lock_timeout = {int(self.lock_timeout_ms)}"))
+            conn.execute(text(f"LOCK TABLE {self.table} IN ACCESS EXCLUSIVE MODE"))
+            self._apply_changes(conn)
+            conn.execute(text(f"DROP TRIGGER {self.changes}_trigger ON {self.table}"))
+            conn.execute(text(f"DROP FUNCTION {self.changes}_capture()"))
+            conn.execute(text(f"DROP TABLE {self.changes}"))
+            # Foreign keys follow the table, not its name; they cannot point at a partitioned
+            # table without the partition key, so they are dropped.
+            for table, constraint in conn.execute(text("""
+                SELECT conrelid::regclass::text, conname FROM pg_constraint
+                WHERE contype = 'f' AND confrelid = to_regclass(:t)
+            """), {'t': self.table}).all():
+                conn.execute(text(f"ALTER TABLE {table} DROP CONSTRAINT {constraint}"))
+            index_names = [row[0] for row in conn.execute(text(
+                "SELECT indexname FROM pg_indexes WHERE tablename = :t"), {'t': self.table})]
+            conn.execute(text(f"ALTER TABLE {self.table} RENAME TO {self.old}"))
+            conn.execute(text(f"ALTER TABLE {self.new} RENAME TO {self.table}"))
+            for name in index_names:
+                conn.execute(text(f"ALTER INDEX {name} RENAME TO {name}_old"))
+                if self._exists(conn, f"{name}_p"):
+                    conn.execute(text(f"ALTER INDEX {name}_p RENAME TO {name}"))
+            conn.execute(text(f"ALTER INDEX {self.new}_pkey RENAME TO {self.table}_pkey"))
+            conn.execute(text(f"ALTER SEQUENCE {self.table}_id_seq OWNED BY {self.table}.id"))
+        logger.info(f"{self.table} is now partitioned; the old table is kept as {self.old}")
+
+    def convert(self):
+        self.prepare()
+        self.copy()
+        self._create_indexes()
+        self.catch_up()
+        self.swap()
+
+    def finalize(self):
+        with self.engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {self.old}"))
+        logger.info(f"Dropped {self.old}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Optional Postgres partitioning for TubeTracker.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('status')
+    convert = sub.add_parser('convert')
+    convert.add_argument('table', choices=sorted(PARTITION_KEYS))
+    convert.add_argument('--batch-size', type=int, default=5000)
+    convert.add_argument('--hash-partitions', type=int, default=None)
+    finalize = sub.add_parser('finalize', help='drop the pre-partitioning copy of a converted table')
+    finalize.add_argument('table', choices=sorted(PARTITION_KEYS))
+    sub.add_parser('maintain')
+    drop = sub.add_parser('drop-metrics')
+    drop.add_argument('--before', required=True, help='YYYY-MM; partitions ending on or before this month go')
+    drop.add_argument('--detach-only', action='store_true', help='detach but keep the tables')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from app import app
+
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name != 'postgresql':
+            print('Partitioning is only available on PostgreSQL.')
+            return 1
+        config = app.config
+        if args.command == 'status':
+            with engine.connect() as conn:
+                for table in sorted(PARTITION_KEYS):
+                    print(f"{table:<16} {'partitioned' if is_partitioned(conn, table) else 'plain'}")
+                for name, lower, upper in metric_partitions(conn):
+                    print(f"  {name:<28} {lower:%Y-%m-%d} .. {upper:%Y-%m-%d}")
+        elif args.command == 'convert':
+            OnlinePartitioner(
+                engine, args.table, batch_size=args.batch_size,
+                hash_partitions=args.hash_partitions or config['COMMENT_HASH_PARTITIONS'],
+                months_ahead=config['METRIC_PARTITION_MONTHS_AHEAD'],
+            ).convert()
+        elif args.command == 'finalize':
+            OnlinePartitioner(engine, args.table).finalize()
+        elif args.command == 'maintain':
+            maintain_partitions(engine, config['METRIC_PARTITION_MONTHS_AHEAD'], config['METRICS_RETENTION_MONTHS'])
+        else:
+            with engine.begin() as conn:
+                removed = drop_metric_partitions(conn, datetime.strptime(args.before, '%Y-%m'), args.detach_only)
+            print(f"Removed: {', '.join(removed) or 'nothing'}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
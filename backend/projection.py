@@ -0,0 +1,115 @@
+"""
+Column-projection read path for comment listings.
+
+The listings used to load full ``Comment`` entities (identity map, attribute
+instrumentation) and serialize each one with ``to_dict()``, which formats up
+to six datetimes in Python, before ``jsonify`` encoded the result again.
+``comment_items`` instead selects only the columns behind the requested
+fields as plain rows, and ``json_response`` encodes them with orjson when it
+is installed (datetimes are formatted natively, identical to ``isoformat()``)
+or with the stdlib encoder otherwise.
+
+The output matches ``Comment.to_dict()`` key for key; ``fields=id,text,...``
+narrows both the JSON and the SELECT. ``last_seen`` is derived from sync
+epochs like ``_comments_to_dicts`` in app.py.
+
+See benchmark_reads.py for the comparison with the ORM path.
+"""
+
+import json
+from datetime import date, datetime
+
+from flask import Response
+
+from models import db, Comment, Video, VideoSyncEpoch
+
+try:
+    import orjson
+except ImportError:  # optional, stdlib json is used instead
+    orjson = None
+
+# Keys of Comment.to_dict(), in order
+COMMENT_FIELDS = (
+    'id', 'video_id', 'comment_id', 'parent_id', 'author', 'author_channel_id', 'text', 'like_count',
+    'published_at', 'updated_at', 'status', 'deleted_at', 'first_seen', 'last_seen', 'reinstated_at',
+    'sentiment', 'sentiment_score', 'sentiment_label', 'sentiment_model',
+)
+# Columns needed to derive last_seen (the stored last_seen is the legacy fallback)
+_LAST_SEEN_INPUTS = ('id', 'video_id', 'status', 'seen_epoch', 'last_seen')
+
+
+def parse_fields(value):
+    """Field names of a ``fields=a,b`` parameter; all fields when empty. Raises ValueError."""
+    if not value:
+        return COMMENT_FIELDS
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in COMMENT_FIELDS]
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(unknown)} (available: {', '.join(COMMENT_FIELDS)})")
+    return tuple(dict.fromkeys(names)) or COMMENT_FIELDS
+
+
+def last_seen_times(entries):
+    """Epoch-derived last_seen per comment id for (id, video_id, status, seen_epoch) tuples.
+
+    Active comments were confirmed in their video's current epoch, deleted ones in their
+    stored seen_epoch. Two queries regardless of the number of comments.
+    """
+    if not entries:
+        return {}
+    video_ids = {video_id for _, video_id, _, _ in entries}
+    current = dict(db.session.query(Video.id, Video.sync_epoch).filter(Video.id.in_(video_ids)).all())
+    wanted = {}
+    for comment_pk, video_id, status, seen_epoch in entries:
+        epoch = current.get(video_id) if status == 'active' else seen_epoch
+        if epoch:
+            wanted[comment_pk] = (video_id, epoch)
+    if not wanted:
+        return {}
+    rows = db.session.query(VideoSyncEpoch.video_id, VideoSyncEpoch.epoch, VideoSyncEpoch.synced_at).filter(
+        VideoSyncEpoch.video_id.in_(video_ids),
+        VideoSyncEpoch.epoch.in_({e for _, e in wanted.values()})
+    ).all()
+    times = {(v, e): t for v, e, t in rows}
+    return {comment_pk: times.get(key) for comment_pk, key in wanted.items()}
+
+
+def comment_items(query, fields=COMMENT_FIELDS):
+    """Run a filtered/ordered/limited ``Comment.query`` as a column projection.
+
+    Returns one dict per row with ``fields`` as keys; datetimes stay datetime objects
+    for the encoder.
+    """
+    derive_last_seen = 'last_seen' in fields
+    selected = list(dict.fromkeys([f for f in fields if f != 'last_seen']
+                                  + (list(_LAST_SEEN_INPUTS) if derive_last_seen else [])))
+    rows = query.with_entities(*[getattr(Comment, name) for name in selected]).all()
+    if not derive_last_seen:
+        positions = [selected.index(f) for f in fields]
+        return [dict(zip(fields, [row[i] for i in positions])) for row in rows]
+
+    pk, video, status, epoch, legacy = (selected.index(name) for name in _LAST_SEEN_INPUTS)
+    times = last_seen_times([(row[pk], row[video], row[status], row[epoch]) for row in rows])
+    positions = [selected.index(f) if f != 'last_seen' else None for f in fields]
+    items = []
+    for row in rows:
+        values = [row[i] if i is not None else (times.get(row[pk]) or row[legacy]) for i in positions]
+        items.append(dict(zip(fields, values)))
+    return items
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(payload):
+    """Encode ``payload`` to UTF-8 JSON bytes (orjson if installed)."""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def json_response(payload, status=200):
+    return Response(dumps(payload), status=status, mimetype='application/json')
@@ -0,0 +1,254 @@
+"""
+Resumable sentiment backfill over the comments table.
+
+A job scores every comment that is missing a result or is stale for the
+current model and threshold:
+
+* never scored, failed, or scored by another model (``sentiment_model``)
+  -> run inference,
+* scored by the current model but labelled on the wrong side of the job's
+  ``SENTIMENT_MIN_CONFIDENCE`` -> re-derive the label from the stored score
+  and raw label, without inference.
+
+Comments are walked in ``comments.id`` order in chunks (keyset pagination).
+After every chunk the job row in ``sentiment_backfill_jobs`` records the last
+id, counters and elapsed time in the same commit as the comment updates, so a
+restarted or paused job continues where it stopped. Inference runs outside
+any transaction; the write phase re-reads the chunk's rows and skips those a
+sync changed in the meantime, so a backfill never blocks or overwrites syncs.
+
+Only one process runs a job at a time: starting claims it with a conditional
+UPDATE, and a ``running`` job whose holder stopped updating it for
+``STALE_AFTER`` can be taken over.
+
+Usage:
+    python sentiment_backfill.py run [--job ID] [--chunk-size N] [--max-rate N]
+    python sentiment_backfill.py status
+    python sentiment_backfill.py pause --job ID
+"""
+
+import argparse
+import logging
+import sys
+import time
+from datetime import timedelta
+
+from sqlalchemy import and_, func, or_, update
+
+from models import db, utcnow, Comment, SentimentBackfillJob
+from sentiment_service import apply_result
+
+logger = logging.getLogger(__name__)
+
+STALE_AFTER = timedelta(minutes=10)
+_UNFINISHED = ('pending', 'running', 'paused', 'failed')
+
+
+def candidate_filter(model_name, min_confidence):
+    """SQL condition for comments a backfill with this model and threshold has to touch."""
+    scored_by_model = Comment.sentiment_model == model_name
+    return and_(
+        Comment.text.isnot(None), Comment.text != '',
+        or_(
+            Comment.sentiment_model.is_(None),
+            Comment.sentiment_model != model_name,
+            and_(scored_by_model, Comment.sentiment.isnot(None), Comment.sentiment_score < min_confidence),
+            and_(scored_by_model, Comment.sentiment.is_(None), Comment.sentiment_score >= min_confidence,
+                 Comment.sentiment_label.isnot(None)),
+        ))
+
+
+def start_job(model_name, min_confidence):
+    """Return the unfinished job for this model and threshold, or create one."""
+    job = (SentimentBackfillJob.query
+           .filter(SentimentBackfillJob.model_name == model_name,
+                   SentimentBackfillJob.min_confidence == min_confidence,
+                   SentimentBackfillJob.status.in_(_UNFINISHED))
+           .order_by(SentimentBackfillJob.id.desc()).first())
+    if job is not None:
+        return job
+    max_id = db.session.query(func.max(Comment.id)).scalar() or 0
+    total = (db.session.query(func.count(Comment.id))
+             .filter(Comment.id <= max_id, candidate_filter(model_name, min_confidence)).scalar())
+    job = SentimentBackfillJob(model_name=model_name, min_confidence=min_confidence, status='pending',
+                               last_comment_id=0, max_comment_id=max_id, total_estimate=total,
+                               processed=0, scored=0, relabeled=0, skipped=0, active_seconds=0.0,
+                               updated_at=utcnow())
+    db.session.add(job)
+    db.session.commit()
+    logger.info(f"Created sentiment backfill job {job.id}: {total} candidate comments for {model_name}")
+    return job
+
+
+def claim_job(job_id, holder):
+    """Mark the job as running for ``holder``. Returns False if someone else is running it."""
+    now = utcnow()
+    result = db.session.execute(
+        update(SentimentBackfillJob)
+        .where(SentimentBackfillJob.id == job_id,
+               or_(SentimentBackfillJob.status.in_(('pending', 'paused', 'failed')),
+                   SentimentBackfillJob.holder == holder,
+                   and_(SentimentBackfillJob.status == 'running',
+                        SentimentBackfillJob.updated_at < now - STALE_AFTER)))
+        .values(status='running', holder=holder, updated_at=now, error=None)
+    )
+    db.session.commit()
+    return bool(result.rowcount)
+
+
+def pause_job(job_id):
+    """Ask a running job to stop after its current chunk. Returns False for unknown or finished jobs."""
+    result = db.session.execute(
+        update(SentimentBackfillJob)
+        .where(SentimentBackfillJob.id == job_id, SentimentBackfillJob.status.in_(('pending', 'running')))
+        .values(status='paused', updated_at=utcnow())
+    )
+    db.session.commit()
+    return bool(result.rowcount)
+
+
+def _relabel(comment, min_confidence, analyzer):
+    if comment.sentiment_score is not None and comment.sentiment_score >= min_confidence:
+        comment.sentiment = analyzer._normalize_label(comment.sentiment_label)
+    else:
+        comment.sentiment = None
+
+
+def _run_chunk(job, analyzer, chunk_size):
+    """Process one chunk. Returns the number of candidate rows read (0 when the job is done)."""
+    rows = (db.session.query(Comment.id, Comment.text, Comment.sentiment_model, Comment.sentiment_label)
+            .filter(Comment.id > job.last_comment_id, Comment.id <= job.max_comment_id,
+                    candidate_filter(job.model_name, job.min_confidence))
+            .order_by(Comment.id).limit(chunk_size).all())
+    last_id = job.last_comment_id
+    # End the read transaction before the (slow) inference
+    db.session.rollback()
+    if not rows:
+        return 0
+
+    to_infer = [r for r in rows if r.sentiment_model != job.model_name or r.sentiment_label is None]
+    results = analyzer.analyze_batch([r.text for r in to_infer]) if to_infer else []
+
+    # FOR UPDATE routes the re-read to the writer (and locks the rows on Postgres)
+    current = {c.id: c for c in Comment.query.filter(Comment.id.in_([r.id for r in rows])).with_for_update()}
+    scored = relabeled = skipped = 0
+    for row, result in zip(to_infer, results):
+        comment = current.get(row.id)
+        if comment is None or comment.text != row.text:
+            skipped += 1
+            continue
+        apply_result(comment, result, job.min_confidence, job.model_name)
+        scored += 1
+    inferred_ids = {r.id for r in to_infer}
+    for row in rows:
+        if row.id in inferred_ids:
+            continue
+        comment = current.get(row.id)
+        if comment is None or comment.sentiment_model != job.model_name:
+            skipped += 1
+            continue
+        _relabel(comment, job.min_confidence, analyzer)
+        relabeled += 1
+
+    job = db.session.get(SentimentBackfillJob, job.id)
+    job.last_comment_id = max(last_id, rows[-1].id)
+    job.processed += len(rows)
+    job.scored += scored
+    job.relabeled += relabeled
+    job.skipped += skipped
+    job.updated_at = utcnow()
+    db.session.commit()
+    return len(rows)
+
+
+def run_job(job_id, analyzer, chunk_size=256, max_rate=0, holder='cli'):
+    """Run a job until it is done, paused or fails. ``max_rate`` caps comments/second (0 = no cap).
+
+    Returns the job's to_dict().
+    """
+    if not claim_job(job_id, holder):
+        logger.info(f"Sentiment backfill job {job_id} is running elsewhere or finished")
+        return db.session.get(SentimentBackfillJob, job_id).to_dict()
+    if getattr(analyzer, 'classifier', None) is None:
+        return _finish(job_id, 'failed', 'sentiment model is not loaded')
+
+    while True:
+        job = db.session.get(SentimentBackfillJob, job_id)
+        if job.status != 'running' or job.holder != holder:
+            logger.info(f"Sentiment backfill job {job_id} stopped ({job.status})")
+            return job.to_dict()
+        started = time.perf_counter()
+        try:
+            count = _run_chunk(job, analyzer, chunk_size)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Sentiment backfill job {job_id} failed: {e}")
+            return _finish(job_id, 'failed', str(e))
+        if not count:
+            return _finish(job_id, 'done')
+        if max_rate:
+            # Throttle: never go faster than max_rate comments/second on average per chunk
+            time.sleep(max(0.0, count / max_rate - (time.perf_counter() - started)))
+        job = db.session.get(SentimentBackfillJob, job_id)
+        job.active_seconds = (job.active_seconds or 0.0) + (time.perf_counter() - started)
+        db.session.commit()
+        progress = job.to_dict()
+        logger.info(f"Sentiment backfill job {job_id}: {job.processed}/{job.total_estimate} comments, "
+                    f"{progress['comments_per_second']}/s, ETA {progress['eta_seconds']}s")
+
+
+def _finish(job_id, status, error=None):
+    job = db.session.get(SentimentBackfillJob, job_id)
+    job.status = status
+    job.error = error
+    job.updated_at = utcnow()
+    if status == 'done':
+        job.finished_at = job.updated_at
+    db.session.commit()
+    logger.info(f"Sentiment backfill job {job_id} {status}: {job.processed} comments "
+                f"({job.scored} scored, {job.relabeled} relabeled, {job.skipped} skipped)")
+    return job.to_dict()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score comments missing or stale sentiment results.')
+    parser.add_argument('command', choices=['run', 'status', 'pause'])
+    parser.add_argument('--job', type=int, help='job id (run: resume this job; pause: required)')
+    parser.add_argument('--chunk-size', type=int, help='comments per chunk (default SENTIMENT_BACKFILL_CHUNK)')
+    parser.add_argument('--max-rate', type=float,
+                        help='max comments/second (default SENTIMENT_BACKFILL_MAX_RATE, 0 = unthrottled)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from app import app
+    from coordination import default_node_id
+    from sentiment_service import get_analyzer
+
+    with app.app_context():
+        if args.command == 'status':
+            for job in SentimentBackfillJob.query.order_by(SentimentBackfillJob.id.desc()).limit(20):
+                d = job.to_dict()
+                print(f"{d['id']:>4}  {d['status']:<8} {d['processed']}/{d['total_estimate']}  "
+                      f"{d['comments_per_second'] or '-'}/s  ETA {d['eta_seconds'] or '-'}s  {d['model_name']}")
+            return 0
+
+        if args.command == 'pause':
+            if not args.job:
+                parser.error('pause needs --job')
+            print('Pausing.' if pause_job(args.job) else 'Job is not running.')
+            return 0
+
+        analyzer = get_analyzer()
+        job_id = args.job or start_job(analyzer.model_name, app.config['SENTIMENT_MIN_CONFIDENCE']).id
+        result = run_job(job_id, analyzer,
+                         chunk_size=args.chunk_size or app.config['SENTIMENT_BACKFILL_CHUNK'],
+                         max_rate=args.max_rate if args.max_rate is not None
+                         else app.config['SENTIMENT_BACKFILL_MAX_RATE'],
+                         holder=default_node_id())
+    print(f"Job {result['id']}: {result['status']}, {result['processed']} comments "
+          f"({result['scored']} scored, {result['relabeled']} relabeled, {result['skipped']} skipped)")
+    return 0 if result['status'] != 'failed' else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -7,10 +7,17 @@ German and English (and other languages).
 
 from transformers import pipeline
 import logging
-from typing import List, Dict, Optional
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Dict, Optional
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_MODEL = "cardiffnlp/twitter-xlm-roberta-base-sentiment"
+
 
 class SentimentAnalyzer:
     """
@@ -18,7 +25,10 @@ class SentimentAnalyzer:
     Uses a multilingual sentiment model that supports German, English, and others.
     """
     
-    def __init__(self, model_name: str = "cardiffnlp/twitter-xlm-roberta-base-sentiment"):
+    # Number of texts the pipeline runs through the model at once in analyze_batch
+    batch_size = 8
+
+    def __init__(self, model_name: str = DEFAULT_MODEL):
         """
         Initialize the sentiment analyzer.
 
@@ -98,7 +108,7 @@ class SentimentAnalyzer:
             if not valid_texts:
                 return [None] * len(texts)
 
-            results_raw = self.classifier(valid_texts, batch_size=8, truncation=True)
+            results_raw = self.classifier(valid_texts, batch_size=self.batch_size, truncation=True)
 
             results = [None] * len(texts)
             for idx, result in zip(valid_indices, results_raw):
@@ -113,8 +123,89 @@ class SentimentAnalyzer:
             return [None] * len(texts)
 
 
+class MicroBatcher:
+    """
+    Coalesces concurrent single-text requests into analyze_batch calls.
+
+    The first queued text opens a batch; it is run as soon as ``max_batch_size``
+    texts are collected or ``max_wait_ms`` have passed since that first text,
+    whichever comes first. Each caller gets a Future for its own text, so a burst
+    of requests costs a few model batches instead of one pipeline call each, and
+    no request waits longer than ``max_wait_ms`` plus one batch of inference.
+    """
+
+    def __init__(self, analyze_batch: Callable[[List[str]], List[Optional[Dict[str, any]]]],
+                 max_batch_size: int = 32, max_wait_ms: float = 10,
+                 on_batch: Optional[Callable[[int, float, float], None]] = None):
+        """
+        Args:
+            analyze_batch: function scoring a list of texts (usually SentimentAnalyzer.analyze_batch).
+            max_batch_size: most texts per analyze_batch call.
+            max_wait_ms: longest time the first text of a batch waits for company.
+            on_batch: optional callback(batch_size, queue_wait_seconds, inference_seconds).
+        """
+        self.analyze_batch = analyze_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.on_batch = on_batch
+        self._lock = threading.Lock()
+        self._queue = None
+        self._pid = None
+
+    def _ensure_worker(self):
+        # (Re)start the worker lazily, also in processes forked after creation
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, args=(self._queue,), name='sentiment-microbatcher',
+                                 daemon=True).start()
+            return self._queue
+
+    def submit(self, texts: List[str]) -> List[Future]:
+        """Queue texts for inference; returns one Future per text."""
+        pending = self._ensure_worker()
+        futures = []
+        for text in texts:
+            future = Future()
+            pending.put((text, future, time.perf_counter()))
+            futures.append(future)
+        return futures
+
+    def analyze(self, texts: List[str], timeout: Optional[float] = None) -> List[Optional[Dict[str, any]]]:
+        """Score texts through the shared batches; blocks until all results are in."""
+        return [f.result(timeout=timeout) for f in self.submit(texts)]
+
+    def _run(self, pending):
+        while True:
+            batch = [pending.get()]
+            deadline = batch[0][2] + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    batch.append(pending.get(timeout=remaining) if remaining > 0 else pending.get_nowait())
+                except queue.Empty:
+                    break
+            started = time.perf_counter()
+            try:
+                results = self.analyze_batch([text for text, _, _ in batch])
+            except Exception as e:
+                logger.error(f"Micro-batch of {len(batch)} texts failed: {e}")
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+            if self.on_batch:
+                try:
+                    self.on_batch(len(batch), started - batch[0][2], time.perf_counter() - started)
+                except Exception as e:
+                    logger.warning(f"Micro-batch callback failed: {e}")
+
+
 # Global singleton instance
 _analyzer = None
+_batcher = None
 
 
 def get_analyzer() -> SentimentAnalyzer:
@@ -123,3 +214,42 @@ def get_analyzer() -> SentimentAnalyzer:
     if _analyzer is None:
         _analyzer = SentimentAnalyzer()
     return _analyzer
+
+
+def current_model_name() -> str:
+    """Name of the model get_analyzer() uses, without loading it."""
+    return _analyzer.model_name if _analyzer is not None else DEFAULT_MODEL
+
+
+def get_batcher(max_batch_size: int = 32, max_wait_ms: float = 10,
+                on_batch: Optional[Callable[[int, float, float], None]] = None) -> MicroBatcher:
+    """Get or create the global micro-batcher in front of the global analyzer."""
+    global _batcher
+    if _batcher is None:
+        _batcher = MicroBatcher(get_analyzer().analyze_batch, max_batch_size, max_wait_ms, on_batch)
+    return _batcher
+
+
+def apply_result(comment, result: Optional[Dict[str, any]], min_confidence: float, model_name: str) -> None:
+    """Store an analyze_batch result on ``comment``, keeping the label only above ``min_confidence``.
+
+    Successful results are stamped with ``model_name``; failed ones leave the stamp empty
+    so the comment counts as never scored.
+    """
+    if not result:
+        comment.sentiment = None
+        comment.sentiment_score = None
+        comment.sentiment_label = None
+        comment.sentiment_model = None
+        return
+    score = result.get('score') or result.get('confidence') or 0.0
+    comment.sentiment_model = model_name
+    if score and float(score) >= float(min_confidence):
+        comment.sentiment = result.get('sentiment')
+        comment.sentiment_score = float(score)
+        comment.sentiment_label = result.get('label')
+    else:
+        # store score but do not commit a label
+        comment.sentiment = None
+        comment.sentiment_score = float(score) if score is not None else None
+        comment.sentiment_label = result.get('label') if 'label' in result else None
@@ -0,0 +1,169 @@
+"""
+Per-video sentiment trends over time.
+
+``sentiment_buckets`` holds, per video and hour/day of ``published_at``, the
+number of positive, neutral, negative and unscored active comments plus the
+sum and count of their confidence scores. A flush hook (comment_deltas.py)
+turns every comment insert, deletion, reinstatement and re-scoring into
+per-bucket deltas and applies them with one upsert, in the same transaction.
+Trend queries therefore read a few hundred bucket rows instead of scanning
+every comment.
+
+Usage:
+    python sentiment_trends.py rebuild [--video ID]   # recompute buckets from the comments table
+"""
+
+import argparse
+import logging
+import math
+import sys
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, or_, select
+
+from comment_deltas import DeltaHook, dialect_insert
+from models import db, Comment, SentimentBucket
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = {'hour': timedelta(hours=1), 'day': timedelta(days=1)}
+CATEGORIES = ('positive', 'neutral', 'negative', 'unscored')
+_FIELDS = CATEGORIES + ('score_sum', 'score_count')
+
+
+def bucket_start(when, granularity):
+    if when.tzinfo is not None:
+        when = when.astimezone(timezone.utc).replace(tzinfo=None)
+    if granularity == 'day':
+        return when.replace(hour=0, minute=0, second=0, microsecond=0)
+    return when.replace(minute=0, second=0, microsecond=0)
+
+
+def _counted_state(video_pk, status, published_at, sentiment, score):
+    """What a comment contributes to the buckets, or None if it is not counted."""
+    if video_pk is None or published_at is None or (status or 'active') != 'active':
+        return None
+    category = sentiment if sentiment in CATEGORIES else 'unscored'
+    return video_pk, published_at, category, score
+
+
+def _add(deltas, state, sign):
+    if state is None:
+        return
+    video_pk, published_at, category, score = state
+    for granularity in GRANULARITIES:
+        entry = deltas[(video_pk, granularity, bucket_start(published_at, granularity))]
+        entry[CATEGORIES.index(category)] += sign
+        if score is not None:
+            entry[4] += sign * score
+            entry[5] += sign
+
+
+def _state(get):
+    return _counted_state(get('video_id'), get('status'), get('published_at'), get('sentiment'),
+                          get('sentiment_score'))
+
+
+def _collect(deltas, before, after):
+    _add(deltas, before, -1)
+    _add(deltas, after, 1)
+
+
+def _apply(session, deltas):
+    rows = [dict(video_id=v, granularity=g, bucket_start=b, **dict(zip(_FIELDS, values)))
+            for (v, g, b), values in deltas.items() if any(values)]
+    if not rows:
+        return
+    table = SentimentBucket.__table__
+    stmt = dialect_insert(session)(table)
+    session.execute(stmt.on_conflict_do_update(
+        index_elements=[table.c.video_id, table.c.granularity, table.c.bucket_start],
+        set_={name: table.c[name] + stmt.excluded[name] for name in _FIELDS}), rows)
+
+
+_hook = DeltaHook('sentiment_bucket_deltas', _state, _collect, _apply,
+                  lambda: defaultdict(lambda: [0, 0, 0, 0, 0.0, 0]))
+
+
+def install(session_class):
+    """Keep sentiment_buckets in sync with every flush of ``session_class``. Idempotent."""
+    _hook.install(session_class)
+
+
+def rebuild(conn, video_pk=None):
+    """Recompute buckets from the comments table on ``conn`` (inside the caller's transaction)."""
+    table = SentimentBucket.__table__
+    clear = delete(table)
+    query = select(Comment.video_id, Comment.published_at, Comment.sentiment, Comment.sentiment_score).where(
+        or_(Comment.status == 'active', Comment.status.is_(None)), Comment.published_at.isnot(None))
+    if video_pk is not None:
+        clear = clear.where(table.c.video_id == video_pk)
+        query = query.where(Comment.video_id == video_pk)
+    conn.execute(clear)
+    deltas = defaultdict(lambda: [0, 0, 0, 0, 0.0, 0])
+    for video_id, published_at, sentiment, score in conn.execute(query.execution_options(yield_per=5000)):
+        _add(deltas, _counted_state(video_id, 'active', published_at, sentiment, score), 1)
+    rows = [dict(video_id=v, granularity=g, bucket_start=b, **dict(zip(_FIELDS, values)))
+            for (v, g, b), values in deltas.items()]
+    for start in range(0, len(rows), 1000):
+        conn.execute(table.insert(), rows[start:start + 1000])
+    return len(rows)
+
+
+def _merge(rows):
+    merged = {'bucket_start': rows[0].bucket_start}
+    for name in _FIELDS:
+        merged[name] = sum(getattr(r, name) for r in rows)
+    return merged
+
+
+def trend(video_pk, granularity='day', since=None, until=None, max_points=200):
+    """Buckets of one video in [since, until), merged into at most ``max_points`` points.
+
+    Merging sums adjacent buckets, so totals are preserved at every resolution.
+    """
+    query = SentimentBucket.query.filter_by(video_id=video_pk, granularity=granularity)
+    if since:
+        query = query.filter(SentimentBucket.bucket_start >= bucket_start(since, granularity))
+    if until:
+        query = query.filter(SentimentBucket.bucket_start < until)
+    rows = query.order_by(SentimentBucket.bucket_start.asc()).all()
+    step = max(1, math.ceil(len(rows) / max_points)) if max_points and max_points > 0 else 1
+    span = GRANULARITIES[granularity]
+    points = []
+    for start in range(0, len(rows), step):
+        group = rows[start:start + step]
+        point = _merge(group)
+        total = sum(point[c] for c in CATEGORIES)
+        points.append({
+            'bucket_start': point['bucket_start'].isoformat(),
+            'bucket_end': (group[-1].bucket_start + span).isoformat(),
+            'positive': point['positive'],
+            'neutral': point['neutral'],
+            'negative': point['negative'],
+            'unscored': point['unscored'],
+            'total': total,
+            'mean_confidence': round(point['score_sum'] / point['score_count'], 4) if point['score_count'] else None,
+        })
+    return points, step
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintain the sentiment_buckets trend table.')
+    parser.add_argument('command', choices=['rebuild'])
+    parser.add_argument('--video', type=int, help='internal video id (default: all videos)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from app import app
+
+    with app.app_context():
+        with db.engine.begin() as conn:
+            count = rebuild(conn, args.video)
+    print(f"Rebuilt {count} buckets at {datetime.now(timezone.utc).isoformat()}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
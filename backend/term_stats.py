@@ -0,0 +1,324 @@
+"""
+Corpus statistics of keyword terms for relevance scoring.
+
+``video_terms`` counts, per video and term, the active comments containing
+the term and its occurrences; ``term_stats`` holds the same counts over the
+whole archive plus the number of videos using the term. The empty term ''
+counts every active comment, so its rows are the totals (comments per video,
+all comments and the number of videos with comments). Bigrams are terms as
+well, so a bigram's comment count is the co-occurrence count its PMI needs.
+
+A flush hook (comment_deltas.py) runs inserted, edited, deleted and
+reinstated comments through the keyword tokenizer (keywords.py) and applies
+the deltas with one upsert per table. The ``video_terms`` upsert returns the
+new counts, so terms that appear on or vanish from a video adjust
+``video_count`` without another query. The archive-wide deltas are appended
+to ``term_stat_deltas`` and folded into ``term_stats`` right after the commit
+(``fold``), so concurrent syncs never hold its rows for a whole sync.
+
+Scorings of the keyword endpoints (``scoring=``), over the most frequent
+``KEYWORD_SCORING_CANDIDATES`` terms of the video (or the archive):
+
+* ``tfidf`` - occurrences * (ln((1 + videos) / (1 + videos using the term)) + 1)
+* ``pmi`` - bigrams only, by ln(N * c(a b) / (c(a) * c(b))) over N comments
+* ``hybrid`` - tfidf, bigrams weighted by 1 + max(normalized PMI, 0)
+
+The statistics are counted with one stopword version (see
+``keywords.stats_tokenizer``): after a stopword change, deltas are skipped
+until app.py's ``rebuild_keyword_stats`` (run by the API in thread mode,
+worker.py or ``keywords.py``) has recounted them, so a removed comment is
+never subtracted with other stopwords than it was added with. Terms longer
+than 200 characters are not counted.
+
+Usage:
+    python term_stats.py rebuild [--video ID]   # recompute from the comments table
+"""
+
+import argparse
+import logging
+import math
+import sys
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, func, select, tuple_
+
+from comment_deltas import DeltaHook, defer, dialect_insert, repair_negative
+from models import db, Comment, TermStat, TermStatDelta, VideoTerm
+import keywords
+
+logger = logging.getLogger(__name__)
+
+TOTAL = ''  # term of the totals rows
+SCORINGS = ('frequency', 'tfidf', 'pmi', 'hybrid')
+MAX_TERM_LENGTH = 200
+_CHUNK = 500
+
+
+def _ngram(term):
+    return 0 if term == TOTAL else 2 if ' ' in term else 1
+
+
+def term_counts(text, tokenizer=None):
+    """Occurrences per term of one comment, including the totals term."""
+    found = tokenizer.terms(text or '') if tokenizer is not None else keywords.terms(text)
+    counts = Counter(t for t in found if len(t) <= MAX_TERM_LENGTH)
+    counts[TOTAL] = 1
+    return counts
+
+
+def _counted_state(video_pk, status, text):
+    """What a comment contributes to the term statistics, or None if it is deleted."""
+    # status is still None on new comments (the column default applies at INSERT)
+    if video_pk is None or status == 'deleted':
+        return None
+    return video_pk, text or ''
+
+
+def _add(deltas, state, sign, tokenizer):
+    video_pk, text = state
+    for term, occurrences in term_counts(text, tokenizer).items():
+        entry = deltas[(video_pk, term)]
+        entry[0] += sign
+        entry[1] += sign * occurrences
+
+
+def _state(get):
+    return _counted_state(get('video_id'), get('status'), get('text'))
+
+
+def _collect(changes, before, after):
+    # Tokenized after the flush, with the stopwords the statistics were counted with
+    if before is not None:
+        changes[before] -= 1
+    if after is not None:
+        changes[after] += 1
+
+
+def _upsert_statement(session, table, keys, counters):
+    stmt = dialect_insert(session)(table)
+    return stmt.on_conflict_do_update(index_elements=[table.c[k] for k in keys],
+                                      set_={name: table.c[name] + stmt.excluded[name] for name in counters})
+
+
+def _apply(session, changes):
+    changes = {state: sign for state, sign in changes.items() if sign}
+    if not changes:
+        return
+    tokenizer = keywords.stats_tokenizer(session)
+    if tokenizer is None:
+        logger.debug("Term statistics are being recounted for new stopwords; skipping deltas")
+        return
+    deltas = defaultdict(lambda: [0, 0])
+    for state, sign in changes.items():
+        _add(deltas, state, sign, tokenizer)
+    # Primary key order, so concurrent upserts lock rows in the same order
+    rows = [dict(video_id=video_pk, term=term, ngram=_ngram(term), comment_count=comments, occurrence_count=occ)
+            for (video_pk, term), (comments, occ) in sorted(deltas.items()) if comments or occ]
+    if not rows:
+        return
+    video_terms = VideoTerm.__table__
+    stmt = _upsert_statement(session, video_terms, ('video_id', 'term'), ('comment_count', 'occurrence_count'))
+    per_term = defaultdict(lambda: [0, 0, 0])
+    emptied = []
+    returned = session.execute(stmt.returning(video_terms.c.video_id, video_terms.c.term,
+                                              video_terms.c.comment_count, video_terms.c.occurrence_count),
+                               rows).mappings().all()
+    repair_negative(session, video_terms, ('comment_count', 'occurrence_count'), returned)
+    for row in returned:
+        video_pk, term, count = row['video_id'], row['term'], row['comment_count']
+        comments, occ = deltas[(video_pk, term)]
+        entry = per_term[term]
+        entry[0] += comments
+        entry[1] += occ
+        before = count - comments
+        if before <= 0 < count:
+            entry[2] += 1
+        elif count <= 0 < before:
+            entry[2] -= 1
+            emptied.append((video_pk, term))
+    pending = [dict(term=term, ngram=_ngram(term), comment_count=comments, occurrence_count=occ, video_count=videos)
+               for term, (comments, occ, videos) in per_term.items() if comments or occ or videos]
+    if pending:
+        session.execute(TermStatDelta.__table__.insert(), pending)
+        defer(session, fold)
+    for start in range(0, len(emptied), _CHUNK):
+        session.execute(delete(video_terms).where(
+            tuple_(video_terms.c.video_id, video_terms.c.term).in_(emptied[start:start + _CHUNK]),
+            video_terms.c.comment_count <= 0))
+
+
+def fold(conn):
+    """Move the committed rows of term_stat_deltas into term_stats (caller's transaction).
+
+    The DELETE ... RETURNING claims the rows, so concurrent folds never apply one twice.
+    Returns the number of terms updated.
+    """
+    pending = TermStatDelta.__table__
+    sums = defaultdict(lambda: [0, 0, 0])
+    for term, comments, occ, videos in conn.execute(delete(pending).returning(
+            pending.c.term, pending.c.comment_count, pending.c.occurrence_count, pending.c.video_count)):
+        entry = sums[term]
+        entry[0] += comments
+        entry[1] += occ
+        entry[2] += videos
+    rows = [dict(term=term, ngram=_ngram(term), comment_count=comments, occurrence_count=occ, video_count=videos)
+            for term, (comments, occ, videos) in sorted(sums.items()) if comments or occ or videos]
+    if not rows:
+        return 0
+    term_stats = TermStat.__table__
+    counters = ('comment_count', 'occurrence_count', 'video_count')
+    returned = conn.execute(
+        _upsert_statement(conn, term_stats, ('term',), counters)
+        .returning(term_stats.c.term, *[term_stats.c[name] for name in counters]), rows).mappings().all()
+    repair_negative(conn, term_stats, counters, returned)
+    return len(rows)
+
+
+_hook = DeltaHook('term_stat_deltas', _state, _collect, _apply, Counter)
+
+
+def install(session_class):
+    """Keep video_terms and term_stats in sync with every flush of ``session_class``. Idempotent."""
+    _hook.install(session_class)
+
+
+def _write_video(conn, video_pk, comments, occurrences):
+    rows = [dict(video_id=video_pk, term=term, ngram=_ngram(term), comment_count=comments[term],
+                 occurrence_count=occurrences[term]) for term in comments]
+    for start in range(0, len(rows), 5000):
+        conn.execute(VideoTerm.__table__.insert(), rows[start:start + 5000])
+    return len(rows)
+
+
+def rebuild(conn, video_pk=None, tokenizer=None):
+    """Recompute the statistics from the comments table on ``conn`` (inside the caller's transaction).
+
+    With ``video_pk`` only that video's terms are recounted; term_stats is always
+    re-derived from video_terms. Returns the number of video_terms rows written.
+    """
+    tokenizer = tokenizer or keywords.load_tokenizer(conn)
+    video_terms, term_stats = VideoTerm.__table__, TermStat.__table__
+    texts = select(Comment.video_id, Comment.text).where(Comment.status == 'active').order_by(Comment.video_id)
+    clear = delete(video_terms)
+    if video_pk is not None:
+        texts = texts.where(Comment.video_id == video_pk)
+        clear = clear.where(video_terms.c.video_id == video_pk)
+    conn.execute(clear)
+
+    count = 0
+    current, comments, occurrences = None, Counter(), Counter()
+    for video, text in conn.execute(texts.execution_options(yield_per=5000)):
+        if video != current:
+            if current is not None:
+                count += _write_video(conn, current, comments, occurrences)
+            current, comments, occurrences = video, Counter(), Counter()
+        counts = term_counts(text, tokenizer)
+        occurrences.update(counts)
+        comments.update(counts.keys())
+    if current is not None:
+        count += _write_video(conn, current, comments, occurrences)
+
+    # Deltas not folded yet are already part of video_terms
+    conn.execute(delete(TermStatDelta.__table__))
+    conn.execute(delete(term_stats))
+    c = video_terms.c
+    conn.execute(term_stats.insert().from_select(
+        ['term', 'ngram', 'comment_count', 'occurrence_count', 'video_count'],
+        select(c.term, func.max(c.ngram), func.sum(c.comment_count), func.sum(c.occurrence_count), func.count())
+        .where(c.comment_count > 0).group_by(c.term)))
+    return count
+
+
+def candidates(video_pk, bigrams=True, min_occ=1, limit=2000, bigrams_only=False):
+    """(term, occurrences, comments) of a video (or the archive with None), most frequent first."""
+    model = TermStat if video_pk is None else VideoTerm
+    query = db.session.query(model.term, model.occurrence_count, model.comment_count)
+    if video_pk is not None:
+        query = query.filter(VideoTerm.video_id == video_pk)
+    if bigrams_only:
+        query = query.filter(model.ngram == 2)
+    else:
+        query = query.filter(model.ngram.in_((1, 2) if bigrams else (1,)))
+    return (query.filter(model.occurrence_count >= max(min_occ, 1))
+            .order_by(model.occurrence_count.desc()).limit(limit).all())
+
+
+def _corpus_counts(terms):
+    """term -> (comments, videos) over the archive for ``terms`` and the totals term."""
+    terms = sorted(set(terms) | {TOTAL})
+    found = {}
+    for start in range(0, len(terms), _CHUNK):
+        rows = (db.session.query(TermStat.term, TermStat.comment_count, TermStat.video_count)
+                .filter(TermStat.term.in_(terms[start:start + _CHUNK])).all())
+        found.update((term, (comments, videos)) for term, comments, videos in rows)
+    return found
+
+
+def score_terms(rows, scoring):
+    """Score (term, occurrences, comments) rows; returns (score, term, occurrences, comments), best first."""
+    needed = set()
+    for term, _, _ in rows:
+        needed.add(term)
+        if ' ' in term:
+            needed.update(term.split(' ', 1))
+    corpus = _corpus_counts(needed)
+    total_comments, total_videos = corpus.get(TOTAL, (0, 0))
+    n = max(total_comments, 1)
+
+    def pmi(term):
+        """(pmi, normalized pmi) of a bigram over comments, None without counts."""
+        first, second = term.split(' ', 1)
+        joint, a, b = corpus.get(term, (0, 0))[0], corpus.get(first, (0, 0))[0], corpus.get(second, (0, 0))[0]
+        if not (joint and a and b):
+            return None
+        value = math.log(n * joint / (a * b))
+        return value, (value / -math.log(joint / n) if joint < n else 1.0)
+
+    scored = []
+    for term, occ, comments in rows:
+        if scoring == 'pmi':
+            found = pmi(term) if ' ' in term else None
+            if found is None:
+                continue
+            score = found[0]
+        else:
+            score = occ * (math.log((1 + total_videos) / (1 + corpus.get(term, (0, 0))[1])) + 1)
+            if scoring == 'hybrid' and ' ' in term:
+                found = pmi(term)
+                score *= 1 + max(found[1], 0) if found else 1
+        scored.append((score, term, occ, comments))
+    scored.sort(key=lambda x: (-x[0], -x[2], -x[3], -len(x[1])))
+    return scored
+
+
+def top_terms(video_pk, scoring, limit, min_occ, bigrams=True, max_candidates=2000):
+    """Keyword items like keywords.top_terms(), ranked by ``scoring`` and with a 'score'."""
+    rows = candidates(video_pk, bigrams, min_occ, max_candidates, bigrams_only=scoring == 'pmi')
+    return [{
+        'term': term,
+        'occurrence_count': int(occ),
+        'comment_count': int(comments),
+        'ngram': 2 if ' ' in term else 1,
+        'score': round(score, 4)
+    } for score, term, occ, comments in score_terms(rows, scoring)[:limit]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintain the keyword term statistics.')
+    parser.add_argument('command', choices=['rebuild'])
+    parser.add_argument('--video', type=int, help='internal video id (default: all videos)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from app import app
+
+    with app.app_context():
+        with db.engine.begin() as conn:
+            count = rebuild(conn, args.video)
+    print(f"Rebuilt {count} video term rows at {datetime.now(timezone.utc).isoformat()}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
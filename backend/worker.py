@@ -0,0 +1,66 @@
+"""
+Background worker: scheduled syncs and queued jobs outside the API.
+
+Runs the scheduler (sync_all_videos, coordinator heartbeat, partition
+maintenance) and polls for import and sentiment backfill jobs that the API
+queued with BACKGROUND_JOBS=worker. Run exactly one per deployment, or
+several with SYNC_COORDINATION=lease; the API itself is served by
+gunicorn (wsgi.py) without a scheduler. Sync runs happen here, so the sync
+metrics are served here too, on GET :WORKER_METRICS_PORT/metrics.
+
+Usage:
+    python worker.py [--poll-seconds 5] [--no-scheduler] [--metrics-port 9105]
+"""
+
+import argparse
+import logging
+import signal
+import sys
+import threading
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run scheduled syncs and queued background jobs.')
+    parser.add_argument('--poll-seconds', type=float, help='job queue poll interval (default WORKER_POLL_SECONDS)')
+    parser.add_argument('--no-scheduler', action='store_true', help='only run queued jobs')
+    parser.add_argument('--metrics-port', type=int,
+                        help='port of GET /metrics (default WORKER_METRICS_PORT, 0 = off)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from app import create_app, run_queued_jobs, scheduler
+    from instrumentation import serve_metrics
+
+    app = create_app(run_scheduler=not args.no_scheduler)
+    poll_seconds = args.poll_seconds or app.config.get('WORKER_POLL_SECONDS', 5)
+    metrics_port = args.metrics_port if args.metrics_port is not None else app.config.get('WORKER_METRICS_PORT', 0)
+    logger = logging.getLogger('worker')
+    stop = threading.Event()
+    metrics_server = None
+    if metrics_port:
+        metrics_server = serve_metrics(metrics_port)
+        logger.info(f"Serving metrics on port {metrics_port}")
+
+    def _stop(signum, frame):
+        logger.info(f"Received signal {signum}, stopping after the current job")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    logger.info(f"Worker started (scheduler: {'off' if args.no_scheduler else 'on'}, "
+                f"polling every {poll_seconds}s)")
+    while not stop.is_set():
+        try:
+            run_queued_jobs()
+        except Exception as e:
+            logger.error(f"Polling queued jobs failed: {e}")
+        stop.wait(poll_seconds)
+    if scheduler.running:
+        scheduler.shutdown(wait=True)
+    if metrics_server is not None:
+        metrics_server.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
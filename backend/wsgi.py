@@ -0,0 +1,14 @@
+"""
+WSGI entry point for production servers.
+
+Creates the app without the scheduler, so every server process only serves
+the API; scheduled syncs, partition maintenance and queued background jobs
+run in the single worker.py process.
+
+Usage:
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+from app import create_app
+
+app = create_app(run_scheduler=False)
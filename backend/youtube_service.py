@@ -1,16 +1,54 @@
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from datetime import datetime
+from instrumentation import record_api_call
+import hashlib
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+def thread_digests(comments):
+    """Fingerprint of every comment thread over (comment_id, updated_at, like_count) of its comments.
+
+    Keyed by the top-level comment id, so a thread keeps its digest when newer
+    threads push it onto another page.
+    """
+    hashes = {}
+    for c in comments:
+        thread_id = c['parent_id'] or c['comment_id']
+        h = hashes.get(thread_id)
+        if h is None:
+            h = hashes[thread_id] = hashlib.blake2b(digest_size=8)
+        h.update(f"{c['comment_id']}|{c['updated_at'].isoformat()}|{c['like_count']}\n".encode('utf-8'))
+    return {thread_id: h.hexdigest() for thread_id, h in hashes.items()}
+
+
+def combine_digests(digests):
+    """Rolling fingerprint of a whole video from its ``(thread_id, digest)`` pairs, in thread id order."""
+    h = hashlib.blake2b(digest_size=16)
+    for _, d in sorted(digests):
+        h.update(d.encode('ascii'))
+    return h.hexdigest()
+
+
 class YouTubeService:
-    def __init__(self, api_key):
+    def __init__(self, api_key, http=None, api_endpoint=None):
+        """Create the API client.
+
+        ``http`` replaces the httplib2 transport (e.g. fake_youtube.FakeYouTubeTransport)
+        and ``api_endpoint`` points the client at another host such as a local stand-in.
+        """
         self.api_key = api_key
-        self.youtube = build('youtube', 'v3', developerKey=api_key)
+        client_options = {'api_endpoint': api_endpoint} if api_endpoint else None
+        self.youtube = build('youtube', 'v3', developerKey=api_key, http=http,
+                             client_options=client_options, cache_discovery=False)
     
+    def _execute(self, request, method):
+        """Execute an API request and count it for sync instrumentation."""
+        record_api_call(method)
+        return request.execute()
+
     def extract_video_id(self, url_or_id):
         """Extract video ID from various YouTube URL formats or return ID if already extracted."""
         if 'youtube.com/watch?v=' in url_or_id:
@@ -21,6 +59,36 @@ class YouTubeService:
             # Assume it's already a video ID
             return url_or_id
     
+    def extract_playlist_id(self, url_or_id):
+        """Extract a playlist ID from a playlist URL (``list=``) or return the ID as given."""
+        if 'list=' in url_or_id:
+            return url_or_id.split('list=')[1].split('&')[0]
+        return url_or_id
+
+    def extract_channel_ref(self, url_or_id):
+        """Extract a channel ID (``UC...``) or handle (``@name``) from a channel URL or return it as given."""
+        for marker in ('/channel/', '/@'):
+            if marker in url_or_id:
+                ref = url_or_id.split(marker)[1].split('/')[0].split('?')[0]
+                return ref if marker == '/channel/' else '@' + ref
+        return url_or_id
+
+    @staticmethod
+    def _parse_video(item):
+        snippet = item['snippet']
+        statistics = item['statistics']
+        return {
+            'video_id': item['id'],
+            'title': snippet.get('title', ''),
+            'channel_title': snippet.get('channelTitle', ''),
+            'description': snippet.get('description', ''),
+            'published_at': datetime.fromisoformat(snippet['publishedAt'].replace('Z', '+00:00')),
+            'thumbnail_url': snippet.get('thumbnails', {}).get('high', {}).get('url', ''),
+            'view_count': int(statistics.get('viewCount', 0)),
+            'like_count': int(statistics.get('likeCount', 0)),
+            'comment_count': int(statistics.get('commentCount', 0))
+        }
+
     def get_video_details(self, video_id):
         """Fetch video details from YouTube API."""
         try:
@@ -28,91 +96,199 @@ class YouTubeService:
                 part='snippet,statistics',
                 id=video_id
             )
-            response = request.execute()
+            response = self._execute(request, 'videos.list')
             
             if not response.get('items'):
                 return None
             
-            item = response['items'][0]
-            snippet = item['snippet']
-            statistics = item['statistics']
-            
-            return {
-                'video_id': video_id,
-                'title': snippet.get('title', ''),
-                'channel_title': snippet.get('channelTitle', ''),
-                'description': snippet.get('description', ''),
-                'published_at': datetime.fromisoformat(snippet['publishedAt'].replace('Z', '+00:00')),
-                'thumbnail_url': snippet.get('thumbnails', {}).get('high', {}).get('url', ''),
-                'view_count': int(statistics.get('viewCount', 0)),
-                'like_count': int(statistics.get('likeCount', 0)),
-                'comment_count': int(statistics.get('commentCount', 0))
-            }
+            return self._parse_video(response['items'][0])
         except HttpError as e:
             logger.error(f"YouTube API error getting video details: {e}")
             return None
         except Exception as e:
             logger.error(f"Error getting video details: {e}")
             return None
+
+    def get_videos_details(self, video_ids):
+        """Fetch details of many videos, 50 ids per videos.list call (one quota unit each).
+
+        Returns a dict video_id -> details; unknown or private videos are missing.
+        Raises HttpError on API errors.
+        """
+        details = {}
+        for start in range(0, len(video_ids), 50):
+            request = self.youtube.videos().list(
+                part='snippet,statistics',
+                id=','.join(video_ids[start:start + 50]),
+                maxResults=50
+            )
+            response = self._execute(request, 'videos.list')
+            for item in response.get('items', []):
+                details[item['id']] = self._parse_video(item)
+        return details
+
+    def resolve_handle(self, handle):
+        """Channel ID for an @handle via search.list (None if unknown).
+
+        The pinned API client's discovery document predates channels.list's
+        forHandle parameter, so handles go through a channel search (100 quota
+        units, once per import). Raises HttpError on API errors.
+        """
+        request = self.youtube.search().list(part='snippet', q=handle, type='channel', maxResults=5)
+        response = self._execute(request, 'search.list')
+        wanted = handle.lower()
+        for item in response.get('items') or []:
+            snippet = item.get('snippet', {})
+            if (snippet.get('customUrl') or '').lower() == wanted or \
+                    '@' + (snippet.get('channelTitle') or '').replace(' ', '').lower() == wanted:
+                return item.get('id', {}).get('channelId') or snippet.get('channelId')
+        items = response.get('items') or []
+        return items[0].get('id', {}).get('channelId') if len(items) == 1 else None
+
+    def get_uploads_playlist_id(self, channel_ref):
+        """Resolve a channel ID or @handle to its uploads playlist via channels.list (None if unknown).
+
+        Raises HttpError on API errors.
+        """
+        channel_id = self.resolve_handle(channel_ref) if channel_ref.startswith('@') else channel_ref
+        if not channel_id:
+            return None
+        request = self.youtube.channels().list(part='contentDetails', id=channel_id)
+        response = self._execute(request, 'channels.list')
+        items = response.get('items') or []
+        if not items:
+            return None
+        return items[0].get('contentDetails', {}).get('relatedPlaylists', {}).get('uploads')
+
+    def iter_playlist_video_ids(self, playlist_id, limit=None):
+        """Yield the video IDs of a playlist, paging playlistItems.list 50 at a time.
+
+        Raises HttpError on API errors (e.g. playlistNotFound).
+        """
+        page_token = None
+        seen = 0
+        while True:
+            request = self.youtube.playlistItems().list(
+                part='contentDetails',
+                playlistId=playlist_id,
+                maxResults=50,
+                pageToken=page_token
+            )
+            response = self._execute(request, 'playlistItems.list')
+            for item in response.get('items', []):
+                video_id = item.get('contentDetails', {}).get('videoId')
+                if video_id:
+                    yield video_id
+                    seen += 1
+                    if limit and seen >= limit:
+                        return
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                return
     
-    def get_video_comments(self, video_id, max_results=100):
-        """Fetch all comments (including replies) for a video."""
-        comments = []
-        
+    @staticmethod
+    def _parse_comment(comment_id, parent_id, snippet):
+        return {
+            'comment_id': comment_id,
+            'parent_id': parent_id,
+            'author': snippet.get('authorDisplayName', ''),
+            'author_channel_id': snippet.get('authorChannelId', {}).get('value', ''),
+            'text': snippet.get('textDisplay', ''),
+            'like_count': snippet.get('likeCount', 0),
+            'published_at': datetime.fromisoformat(snippet['publishedAt'].replace('Z', '+00:00')),
+            'updated_at': datetime.fromisoformat(snippet['updatedAt'].replace('Z', '+00:00'))
+        }
+
+    def _iter_replies(self, parent_id):
+        """Page through all replies of a thread via comments.list."""
+        next_page_token = None
+        while True:
+            request = self.youtube.comments().list(
+                part='snippet',
+                parentId=parent_id,
+                maxResults=100,
+                pageToken=next_page_token,
+                textFormat='plainText'
+            )
+            response = self._execute(request, 'comments.list')
+            for reply in response.get('items', []):
+                yield self._parse_comment(reply['id'], parent_id, reply['snippet'])
+            next_page_token = response.get('nextPageToken')
+            if not next_page_token:
+                break
+
+    def _parse_thread(self, item):
+        """Top-level comment plus all its replies.
+
+        commentThreads only embeds a few replies; when totalReplyCount says there are
+        more, the full reply list is fetched with comments.list.
+        """
+        top_id = item['snippet']['topLevelComment']['id']
+        comments = [self._parse_comment(top_id, None, item['snippet']['topLevelComment']['snippet'])]
+        inline = item.get('replies', {}).get('comments', [])
+        if item['snippet'].get('totalReplyCount', len(inline)) > len(inline):
+            comments.extend(self._iter_replies(top_id))
+        else:
+            for reply in inline:
+                comments.append(self._parse_comment(reply['id'], top_id, reply['snippet']))
+        return comments
+
+    def iter_comment_pages(self, video_id, page_token=None):
+        """Yield ``(comments, next_page_token, digests)`` for every commentThreads page of a video.
+
+        ``digests`` maps each thread on the page to its thread_digests() fingerprint.
+
+        Starts at ``page_token`` (to resume an interrupted sweep) and holds only one
+        page in memory. API errors are raised to the caller.
+        """
+        while True:
+            request = self.youtube.commentThreads().list(
+                part='snippet,replies',
+                videoId=video_id,
+                maxResults=100,
+                pageToken=page_token,
+                textFormat='plainText'
+            )
+            response = self._execute(request, 'commentThreads.list')
+            comments = []
+            for item in response.get('items', []):
+                comments.extend(self._parse_thread(item))
+            page_token = response.get('nextPageToken')
+            yield comments, page_token, thread_digests(comments)
+            if not page_token:
+                break
+
+    def get_video_comment_pages(self, video_id, max_results=100):
+        """Fetch up to ``max_results`` comments (plus replies of the fetched threads) page by page.
+
+        Returns ``(pages, complete)`` where pages is a list of ``(comments, digests)``;
+        ``complete`` is True only if every thread of the video was fetched without
+        errors, i.e. absent comments really are gone.
+        """
+        pages = []
+        fetched = 0
         try:
-            # Get top-level comments
-            next_page_token = None
-            while True:
-                request = self.youtube.commentThreads().list(
-                    part='snippet,replies',
-                    videoId=video_id,
-                    maxResults=min(max_results, 100),
-                    pageToken=next_page_token,
-                    textFormat='plainText'
-                )
-                response = request.execute()
-                
-                for item in response.get('items', []):
-                    # Top-level comment
-                    top_comment = item['snippet']['topLevelComment']['snippet']
-                    comments.append({
-                        'comment_id': item['snippet']['topLevelComment']['id'],
-                        'parent_id': None,
-                        'author': top_comment.get('authorDisplayName', ''),
-                        'author_channel_id': top_comment.get('authorChannelId', {}).get('value', ''),
-                        'text': top_comment.get('textDisplay', ''),
-                        'like_count': top_comment.get('likeCount', 0),
-                        'published_at': datetime.fromisoformat(top_comment['publishedAt'].replace('Z', '+00:00')),
-                        'updated_at': datetime.fromisoformat(top_comment['updatedAt'].replace('Z', '+00:00'))
-                    })
-                    
-                    # Replies
-                    if 'replies' in item:
-                        for reply in item['replies']['comments']:
-                            reply_snippet = reply['snippet']
-                            comments.append({
-                                'comment_id': reply['id'],
-                                'parent_id': item['snippet']['topLevelComment']['id'],
-                                'author': reply_snippet.get('authorDisplayName', ''),
-                                'author_channel_id': reply_snippet.get('authorChannelId', {}).get('value', ''),
-                                'text': reply_snippet.get('textDisplay', ''),
-                                'like_count': reply_snippet.get('likeCount', 0),
-                                'published_at': datetime.fromisoformat(reply_snippet['publishedAt'].replace('Z', '+00:00')),
-                                'updated_at': datetime.fromisoformat(reply_snippet['updatedAt'].replace('Z', '+00:00'))
-                            })
-                
-                next_page_token = response.get('nextPageToken')
-                if not next_page_token or len(comments) >= max_results:
-                    break
-            
-            return comments
-        
+            for comments, next_page_token, digests in self.iter_comment_pages(video_id):
+                pages.append((comments, digests))
+                fetched += len(comments)
+                if next_page_token and fetched >= max_results:
+                    return pages, False
+            return pages, True
         except HttpError as e:
             if e.resp.status == 403:
                 logger.warning(f"Comments are disabled for video {video_id}")
             else:
                 logger.error(f"YouTube API error getting comments: {e}")
-            return []
+            return pages, False
         except Exception as e:
             logger.error(f"Error getting comments: {e}")
-            return []
+            return pages, False
+
+    def get_video_comments_window(self, video_id, max_results=100):
+        """Like get_video_comment_pages, but returns ``(comments, complete)`` as one flat list."""
+        pages, complete = self.get_video_comment_pages(video_id, max_results=max_results)
+        return [c for comments, _ in pages for c in comments], complete
+
+    def get_video_comments(self, video_id, max_results=100):
+        """Fetch all comments (including replies) for a video."""
+        return self.get_video_comments_window(video_id, max_results=max_results)[0]